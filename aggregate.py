@@ -0,0 +1,75 @@
+import numpy as np
+
+from dataset import get_column
+
+# Aggregations understood by groupby_year_month
+AGGREGATIONS = ['sum', 'mean', 'max', 'min', 'first', 'count']
+
+# Function to sort the rows with a valid date into (year, month) segments
+def year_month_segments(columns):
+    valid = columns['valid']
+    order = np.flatnonzero(valid)[np.argsort(columns['year_month'][valid], kind='stable')]
+    sorted_keys = columns['year_month'][order]
+    bucket_keys, starts, counts = np.unique(sorted_keys, return_index=True, return_counts=True)
+    return order, bucket_keys, starts, counts
+
+# Function to reduce one field over the sorted (year, month) segments
+def reduce_segments(values, starts, counts, aggregation):
+    if aggregation == 'sum':
+        return np.add.reduceat(values, starts)
+    if aggregation == 'mean':
+        return np.add.reduceat(values, starts) / counts
+    if aggregation == 'max':
+        return np.maximum.reduceat(values, starts)
+    if aggregation == 'min':
+        return np.minimum.reduceat(values, starts)
+    if aggregation == 'first':
+        return values[starts]  # The stable sort keeps file order inside each month
+    if aggregation == 'count':
+        return counts.astype(np.float64)
+    raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {AGGREGATIONS}")
+
+# Function to group the columns by year and month and aggregate (field, aggregation) pairs.
+# Returns 'years', a dense years x 12 'count' array and one years x 12 array per pair
+# (keyed 'field_aggregation', NaN where a month has no records).
+def groupby_year_month(columns, aggregations):
+    order, bucket_keys, starts, counts = year_month_segments(columns)
+    years = np.unique(bucket_keys // 12)
+    rows = np.searchsorted(years, bucket_keys // 12)
+    months = bucket_keys % 12
+
+    count = np.zeros((len(years), 12), dtype=np.int64)
+    count[rows, months] = counts
+    result = {'years': years, 'count': count}
+
+    # Each field is gathered into segment order once, however many aggregations read it
+    field_values = {}
+    for field, aggregation in aggregations:
+        dense = np.full((len(years), 12), np.nan)
+        if len(order):
+            if field not in field_values:
+                field_values[field] = np.asarray(get_column(columns, field), dtype=np.float64)[order]
+            dense[rows, months] = reduce_segments(field_values[field], starts, counts, aggregation)
+        result[f'{field}_{aggregation}'] = dense
+
+    return result
+
+# Function to turn a group-by result into the year -> month -> {name: value} dicts the plot functions use.
+# `names` maps each output name to a result key; months without records are left out.
+def to_year_month_dict(result, names):
+    year_month_data = {}
+    for row, year in enumerate(result['years'].tolist()):
+        months = {}
+        for month in range(1, 13):
+            if result['count'][row, month - 1]:
+                months[month] = {name: result[key][row, month - 1].item() for name, key in names.items()}
+        year_month_data[year] = months
+    return year_month_data
+
+# Function to count small-integer codes per (year, month); rows with a negative code are skipped.
+# Returns the year_month keys that have counted rows and a keys x code_count count table.
+def count_codes_by_year_month(columns, codes, code_count):
+    selected = columns['valid'] & (codes >= 0)
+    bucket_keys, buckets = np.unique(columns['year_month'][selected], return_inverse=True)
+    table = np.bincount(buckets * code_count + codes[selected], minlength=len(bucket_keys) * code_count)
+    return bucket_keys, table.reshape(len(bucket_keys), code_count)
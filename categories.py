@@ -0,0 +1,86 @@
+import numpy as np
+
+# Function to get the smallest float above an edge, so 'value <= edge' becomes 'value < above(edge)'
+def above(edge):
+    return np.nextafter(edge, np.inf)
+
+# Function to build a binning table from labels and their half-open [low, high) intervals.
+# None leaves an end open; values in the gaps between intervals get the `default` code.
+def make_bins(labels, intervals, default=-1):
+    edges = sorted({edge for interval in intervals for edge in interval if edge is not None})
+    codes = np.full(len(edges) + 1, default, dtype=np.int8)
+
+    # Slot i covers [edges[i - 1], edges[i]), with open ends before the first and after the last edge
+    slot_lows = [-np.inf] + edges
+    slot_highs = edges + [np.inf]
+    for code, (low, high) in enumerate(intervals):
+        low = -np.inf if low is None else low
+        high = np.inf if high is None else high
+        for slot, (slot_low, slot_high) in enumerate(zip(slot_lows, slot_highs)):
+            if low <= slot_low and slot_high <= high:
+                codes[slot] = code
+
+    return {'labels': labels, 'edges': np.array(edges, dtype=np.float64), 'codes': codes, 'default': default}
+
+# The intervals mirror the old if/elif chains, including their gaps (magnitude 2.5, rain 5.5, ...)
+MAGNITUDE_BINS = make_bins(
+    ['Low_Magnitude', 'Medium_Magnitude', 'High_Magnitude'],
+    [(None, above(2)), (3, above(5)), (above(5), None)],
+)
+ELEVATION_BINS = make_bins(
+    ['Below_Sea_Level', 'Sea_Level', 'Ground_Level', 'Ground_Level_Mid', 'Ground_Level_High'],
+    [(None, above(10)), (11, above(30)), (31, above(60)), (61, above(90)), (above(90), None)],
+)
+RAINFALL_BINS = make_bins(
+    ['Low_rainfall', 'Medium_rainfall', 'High_rainfall'],
+    [(None, above(5)), (6, above(10)), (above(10), None)],
+)
+TIME_OF_DAY_BINS = make_bins(
+    ['Morning', 'Mid_Morning', 'Afternoon', 'Evening', 'Night'],
+    [(0, 10), (10, 13), (13, 17), (17, 20), (20, 24)],
+)
+# Sunlight is binned on the percentage of a 12 hour day; anything not Low or Medium counts as Full
+SUNLIGHT_BINS = make_bins(
+    ['Low Sunlight', 'Medium Sunlight', 'Full Sunlight'],
+    [(None, above(30)), (31, above(60))],
+    default=2,
+)
+
+# Function to map a whole column to small-integer category codes in one call
+def classify_column(values, bins):
+    values = np.asarray(values, dtype=np.float64)
+    codes = bins['codes'][np.searchsorted(bins['edges'], values, side='right')]
+    codes[np.isnan(values)] = bins['default']  # NaN fails every comparison of the old chains
+    return codes
+
+# Function to count how often each category code occurs, ignoring rows left unclassified
+def count_codes(codes, bins):
+    return np.bincount(codes[codes >= 0], minlength=len(bins['labels']))
+
+# Function to turn an array of counts into a {label: count} dict in label order
+def counts_to_dict(counts, bins):
+    return dict(zip(bins['labels'], counts.tolist()))
+
+# Function to add one chunk's category counts into nested year -> city -> label -> count dicts.
+# Rows without a valid date or a city, or left unclassified, are skipped; years and cities keep file order.
+def count_codes_by_year_and_city(columns, codes, bins, counts):
+    selected = columns['valid'] & (columns['city'] != '') & (codes >= 0)
+    if not selected.any():
+        return counts
+
+    city_names, city_codes = np.unique(columns['city'][selected], return_inverse=True)
+    pair_keys = columns['year'][selected].astype(np.int64) * len(city_names) + city_codes
+    pairs, first_rows, pair_codes = np.unique(pair_keys, return_index=True, return_inverse=True)
+
+    category_count = len(bins['labels'])
+    table = np.bincount(pair_codes * category_count + codes[selected], minlength=len(pairs) * category_count)
+    table = table.reshape(len(pairs), category_count)
+
+    for pair in np.argsort(first_rows, kind='stable').tolist():
+        year, city_code = divmod(pairs[pair].item(), len(city_names))
+        city = city_names[city_code].item()
+        for label, count in zip(bins['labels'], table[pair].tolist()):
+            if count:
+                counts[year][city][label] += count
+
+    return counts
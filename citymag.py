@@ -1,46 +1,49 @@
-import json
-import matplotlib.pyplot as plt
 import os
+import numpy as np
 from collections import defaultdict
-from datetime import datetime
-
-# Function to load data from a JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-# Function to classify earthquake magnitudes into categories
-def classify_magnitude(magnitude):
-    if magnitude <= 2:
-        return 'Low_Magnitude'
-    elif 3 <= magnitude <= 5:
-        return 'Medium_Magnitude'
-    elif magnitude >= 5:
-        return 'High_Magnitude'
-    return None  # If there's no valid data for magnitude
+from cube import load_cube, cube_slice, axis_labels
+from render import plt, render_cached_charts
+from export import write_data_only
+
+# Function to get the cities of each year in the order they first appear in that year's records
+# (counting only records with a city and a classified magnitude, as the graphs do), from the first
+# row the cube keeps for each of its cells
+def cities_by_year_in_file_order(cube):
+    coords = cube['coords']
+    selected = np.flatnonzero(
+        (coords['year'] < len(cube['years']))
+        & (cube['cities'][coords['city']] != '')
+        & (coords['magnitude'] < len(axis_labels('magnitude')))
+    )
+
+    # The first row of every (year, city) pair is the earliest first row of its cells
+    pair_keys = coords['year'][selected].astype(np.int64) * len(cube['cities']) + coords['city'][selected]
+    order = np.argsort(cube['first_rows'][selected], kind='stable')
+    pairs, first_positions = np.unique(pair_keys[order], return_index=True)
+
+    cities_by_year = defaultdict(list)
+    for pair in pairs[np.argsort(first_positions, kind='stable')].tolist():
+        year_slot, city_slot = divmod(pair, len(cube['cities']))
+        cities_by_year[cube['years'][year_slot].item()].append(cube['cities'][city_slot].item())
+    return cities_by_year
 
 # Function to count the frequency of magnitude categories per city, month, and year
-def count_magnitude_categories_by_year(data):
+# (the counts come from the cube, which also gives the order of each year's cities that decides the graph chunks)
+def count_magnitude_categories_by_year(cube):
     # Initialize defaultdict to store magnitude category counts by year, city
     magnitude_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))  # Year -> City -> Category -> Count
 
-    for entry in data:
-        date = entry.get('date', '')
-        magnitude = entry.get('magnitude', 0)
-        city = entry.get('city', None)  # Get city, default to None if it doesn't exist
-
-        # Skip entry if city is missing or not a valid string
-        if not city or not isinstance(city, str):
-            continue
-
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            category = classify_magnitude(magnitude)
-            if category:
-                magnitude_counts[year][city][category] += 1
-        except ValueError:
-            continue  # Skip invalid date entries
+    # Drop the cube's slots for invalid dates and unclassified magnitudes
+    table = cube_slice(cube, ['year', 'city', 'magnitude'])[:-1, :, :-1]
+    year_slots = {year: slot for slot, year in enumerate(cube['years'].tolist())}
+    city_slots = {city: slot for slot, city in enumerate(cube['cities'].tolist())}
+
+    # Missing cities (stored as '' by the loader) are already left out of the order
+    for year, cities in cities_by_year_in_file_order(cube).items():
+        for city in cities:
+            for category, count in zip(axis_labels('magnitude'), table[year_slots[year], city_slots[city]].tolist()):
+                if count:
+                    magnitude_counts[year][city][category] += count
     
     return magnitude_counts
 
@@ -49,8 +52,8 @@ def create_folder(folder_name):
     if not os.path.exists(folder_name):
         os.makedirs(folder_name)
 
-# Function to plot and save the bar graph for magnitude categories by year (10 cities per graph)
-def plot_magnitude_frequency_by_year(magnitude_counts, folder_name):
+# Function to plot and save the magnitude category bar graph of one chunk of (up to 10) cities and return its path
+def plot_magnitude_frequency_chunk(year, chunk_index, cities_data, folder_name):
     # Define colors for the categories
     category_colors = {
         'Low_Magnitude': 'blue',
@@ -58,64 +61,82 @@ def plot_magnitude_frequency_by_year(magnitude_counts, folder_name):
         'High_Magnitude': 'green'
     }
 
+    chunk = list(cities_data)  # Cities of this chunk, in order
+
+    low_counts = []
+    medium_counts = []
+    high_counts = []
+
+    # Get the magnitude category counts for each city in this chunk
+    for city in chunk:
+        low_counts.append(cities_data[city].get('Low_Magnitude', 0))
+        medium_counts.append(cities_data[city].get('Medium_Magnitude', 0))
+        high_counts.append(cities_data[city].get('High_Magnitude', 0))
+
+    # Set up the figure for the bar graph
+    bar_width = 0.25  # Width of the bars
+    index = range(len(chunk))  # X positions for each city
+
+    fig, ax = plt.subplots(figsize=(12, 8))
+
+    # Create bars for the 3 categories (Low, Medium, High) for each city
+    ax.bar(index, low_counts, bar_width, label='Low Magnitude', color=category_colors['Low_Magnitude'])
+    ax.bar([i + bar_width for i in index], medium_counts, bar_width, label='Medium Magnitude', color=category_colors['Medium_Magnitude'])
+    ax.bar([i + 2 * bar_width for i in index], high_counts, bar_width, label='High Magnitude', color=category_colors['High_Magnitude'])
+
+    # Set labels and title
+    ax.set_xlabel('Cities')
+    ax.set_ylabel('Frequency of Earthquakes')
+    ax.set_title(f'Earthquake Magnitude Frequency in {year} - Part {chunk_index + 1}')
+    ax.set_xticks([i + bar_width for i in index])  # Position the x-ticks between the bars
+    ax.set_xticklabels(chunk, rotation=45, ha='right')
+    ax.legend(title="Magnitude Categories")
+
+    # Save the plot
+    save_path = f'{folder_name}/earthquake_frequency_{year}_{chunk_index + 1}.png'
+    plt.tight_layout()  # Ensure everything fits nicely
+    plt.savefig(save_path)
+    plt.close()  # Close the plot to avoid memory issues
+    return save_path
+
+# Function to plot and save the bar graph for magnitude categories by year (10 cities per graph)
+def plot_magnitude_frequency_by_year(magnitude_counts, folder_name, workers=None):
+    jobs = []
     for year, cities_data in magnitude_counts.items():
         cities = list(cities_data.keys())  # Get all cities for this year
         
-        # Split cities into chunks of 10
+        # Split cities into chunks of 10; each render job only carries its own cities' counts
         chunks = [cities[i:i + 10] for i in range(0, len(cities), 10)]
-
         for chunk_index, chunk in enumerate(chunks):
-            low_counts = []
-            medium_counts = []
-            high_counts = []
-
-            # Get the magnitude category counts for each city in this chunk
-            for city in chunk:
-                low_counts.append(cities_data[city].get('Low_Magnitude', 0))
-                medium_counts.append(cities_data[city].get('Medium_Magnitude', 0))
-                high_counts.append(cities_data[city].get('High_Magnitude', 0))
-
-            # Set up the figure for the bar graph
-            bar_width = 0.25  # Width of the bars
-            index = range(len(chunk))  # X positions for each city
-
-            fig, ax = plt.subplots(figsize=(12, 8))
-
-            # Create bars for the 3 categories (Low, Medium, High) for each city
-            ax.bar(index, low_counts, bar_width, label='Low Magnitude', color=category_colors['Low_Magnitude'])
-            ax.bar([i + bar_width for i in index], medium_counts, bar_width, label='Medium Magnitude', color=category_colors['Medium_Magnitude'])
-            ax.bar([i + 2 * bar_width for i in index], high_counts, bar_width, label='High Magnitude', color=category_colors['High_Magnitude'])
-
-            # Set labels and title
-            ax.set_xlabel('Cities')
-            ax.set_ylabel('Frequency of Earthquakes')
-            ax.set_title(f'Earthquake Magnitude Frequency in {year} - Part {chunk_index + 1}')
-            ax.set_xticks([i + bar_width for i in index])  # Position the x-ticks between the bars
-            ax.set_xticklabels(chunk, rotation=45, ha='right')
-            ax.legend(title="Magnitude Categories")
-
-            # Save the plot
-            save_path = f'{folder_name}/earthquake_frequency_{year}_{chunk_index + 1}.png'
-            plt.tight_layout()  # Ensure everything fits nicely
-            plt.savefig(save_path)
-            plt.close()  # Close the plot to avoid memory issues
+            jobs.append((year, chunk_index, {city: dict(cities_data[city]) for city in chunk}, folder_name))
 
-# Main function to load data, process, and generate the graphs
-def main():
-    # Load the data (replace with your actual file path)
-    data = load_json_data('bar_line\\merged_data.json')  # Your actual data file path
-    
-    # Count magnitude categories by year
-    magnitude_counts = count_magnitude_categories_by_year(data)
+    return render_cached_charts(plot_magnitude_frequency_chunk, jobs, folder_name, workers)
 
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(magnitude_counts, workers=None):
     # Create the folder for storing graphs
     create_folder('earthquake_histograms_by_year')
 
     # Plot the earthquake magnitude frequency graph for each year (with 10 cities per graph)
-    plot_magnitude_frequency_by_year(magnitude_counts, 'earthquake_histograms_by_year')
+    plot_magnitude_frequency_by_year(magnitude_counts, 'earthquake_histograms_by_year', workers)
 
     print("Graphs have been saved in the 'earthquake_histograms_by_year' folder.")
 
+# Main function to load data, process, and generate the graphs
+def main():
+    # Load the count cube (built from the data file and saved on the first run)
+    cube = load_cube('bar_line\\merged_data.json')  # Your actual data file path
+    
+    # Count magnitude categories by year
+    magnitude_counts = count_magnitude_categories_by_year(cube)
+
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(magnitude_counts):
+        return
+
+    # Draw the charts
+    draw_report(magnitude_counts)
+
 # Execute the main function
 if __name__ == "__main__":
     main()
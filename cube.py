@@ -0,0 +1,143 @@
+import os
+import json
+import numpy as np
+
+from dataset import read_dataset, source_fingerprint, cache_fingerprint, cache_folder, get_column, derived_column
+from categories import MAGNITUDE_BINS, ELEVATION_BINS, RAINFALL_BINS, TIME_OF_DAY_BINS, classify_column
+
+# Bump when the cube layout or any bin table changes so persisted cubes are rebuilt
+CUBE_VERSION = 2
+
+# Axes of the count cube, in storage order
+CUBE_AXES = ['year', 'month', 'city', 'magnitude', 'elevation', 'rainfall', 'time_of_day']
+
+# Category axes and the column each one is binned from. Every category axis has one extra
+# trailing slot for rows left unclassified, so summing any axis away still counts every record.
+CATEGORY_AXES = {
+    'magnitude': ('magnitude', MAGNITUDE_BINS),
+    'elevation': ('elevation', ELEVATION_BINS),
+    'rainfall': ('rain_sum', RAINFALL_BINS),
+    'time_of_day': ('hour', TIME_OF_DAY_BINS),
+}
+
+# Function to get the bin codes of one category axis for every row of a loaded dataset
+# (computed once per dataset and shared through the derived column memo)
+def category_codes(columns, axis):
+    column, bins = CATEGORY_AXES[axis]
+    return derived_column(columns, f'{axis}_codes', lambda columns: classify_column(get_column(columns, column), bins))
+
+# Function to map the city column to codes, with cities numbered in order of first appearance
+def encode_cities(cities):
+    names, first_rows, codes = np.unique(cities, return_index=True, return_inverse=True)
+    order = np.argsort(first_rows, kind='stable')
+    renumber = np.empty(len(order), dtype=np.int64)
+    renumber[order] = np.arange(len(order))
+    return names[order], renumber[codes]
+
+# Function to build the sparse count cube of one dataset.
+# Only non-empty cells are kept: one coordinate array per axis plus a count per cell and the first row
+# counted in the cell (so the order records first appear in can be read back without the dataset).
+# The year and month axes end with a slot for rows without a valid date; '' is the missing city.
+def build_cube(columns):
+    valid = columns['valid']
+    years = np.unique(columns['year'][valid])
+    cities, city_codes = encode_cities(columns['city'])
+
+    year_codes = np.where(valid, np.searchsorted(years, columns['year']), len(years))
+    month_codes = np.where(valid, columns['month'] - 1, 12)
+    axis_codes = [year_codes, month_codes, city_codes]
+    shape = [len(years) + 1, 13, len(cities)]
+    for axis, (column, bins) in CATEGORY_AXES.items():
+        codes = category_codes(columns, axis)
+        slot_count = len(bins['labels'])
+        axis_codes.append(np.where(codes >= 0, codes, slot_count))
+        shape.append(slot_count + 1)
+
+    cells, first_rows, counts = np.unique(np.ravel_multi_index(axis_codes, shape), return_index=True, return_counts=True)
+    coords = np.unravel_index(cells, shape)
+    return {
+        'years': years,
+        'cities': cities,
+        'shape': tuple(shape),
+        'coords': dict(zip(CUBE_AXES, coords)),
+        'counts': counts,
+        'first_rows': first_rows.astype(np.int64),
+    }
+
+# Function to sum the cube down to the given axes (in the order given).
+# `where` optionally restricts axes to one slot index or a list of slot indexes before summing.
+def cube_slice(cube, axes, where=None):
+    keep = np.ones(len(cube['counts']), dtype=bool)
+    for axis, slots in (where or {}).items():
+        keep &= np.isin(cube['coords'][axis], slots)
+
+    shape = tuple(cube['shape'][CUBE_AXES.index(axis)] for axis in axes)
+    if not axes:
+        return cube['counts'][keep].sum()
+    cells = np.ravel_multi_index([cube['coords'][axis][keep] for axis in axes], shape)
+    return np.bincount(cells, weights=cube['counts'][keep], minlength=int(np.prod(shape))).astype(np.int64).reshape(shape)
+
+# Function to get the labels of one category axis (without the unclassified slot)
+def axis_labels(axis):
+    return CATEGORY_AXES[axis][1]['labels']
+
+# Function to get the path of the persisted cube of a data file (inside its parse cache folder)
+def cube_path(file_path):
+    return os.path.join(cache_folder(file_path), 'cube.npz')
+
+# Function to save a cube next to the parse cache, tagged with the data file's fingerprint
+def write_cube(file_path, fingerprint, cube):
+    path = cube_path(file_path)
+    staging = f'{path}.tmp-{os.getpid()}.npz'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {f'coords_{axis}': coords for axis, coords in cube['coords'].items()}
+        np.savez(
+            staging,
+            meta=np.array(json.dumps({'fingerprint': fingerprint, 'version': CUBE_VERSION, 'shape': cube['shape']})),
+            years=cube['years'],
+            cities=cube['cities'],
+            counts=cube['counts'],
+            first_rows=cube['first_rows'],
+            **arrays,
+        )
+        os.replace(staging, path)
+    except OSError as error:
+        print(f"Could not write count cube for '{file_path}': {error}")
+        if os.path.exists(staging):
+            os.remove(staging)
+
+# Function to read a persisted cube back, or return None if it is missing or stale
+def read_cube(file_path, fingerprint):
+    try:
+        with np.load(cube_path(file_path)) as stored:
+            meta = json.loads(stored['meta'].item())
+            if meta['fingerprint'] != fingerprint or meta['version'] != CUBE_VERSION:
+                return None
+            return {
+                'years': stored['years'],
+                'cities': stored['cities'],
+                'shape': tuple(meta['shape']),
+                'coords': {axis: stored[f'coords_{axis}'] for axis in CUBE_AXES},
+                'counts': stored['counts'],
+                'first_rows': stored['first_rows'],
+            }
+    except (OSError, ValueError, KeyError):
+        return None
+
+# Function to load the count cube of a data file, building and persisting it the first time. When the
+# file is already loaded the cube is built from `columns` and tagged with the fingerprint they were parsed
+# from (read_dataset's, or the parse cache's when none is given).
+def load_cube(file_path, columns=None, fingerprint=None):
+    if columns is None:
+        fingerprint = source_fingerprint(file_path)
+    elif fingerprint is None:
+        fingerprint = cache_fingerprint(file_path)
+    cube = read_cube(file_path, fingerprint) if fingerprint is not None else None
+    if cube is None:
+        if columns is None:
+            columns, fingerprint = read_dataset(file_path)
+        cube = build_cube(columns)
+        if fingerprint is not None:
+            write_cube(file_path, fingerprint, cube)
+    return cube
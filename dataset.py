@@ -0,0 +1,485 @@
+import codecs
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# Top-level fields every record carries next to the nested 'weather' block
+NUMERIC_FIELDS = ['magnitude', 'elevation']
+
+# Bump when the column layout changes so old parse caches are rebuilt
+CACHE_VERSION = 3
+
+# Days in each month of a non-leap year, indexed by month number
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+# Character positions of the digits in a 'YYYY-MM-DD' date
+DATE_DIGIT_POSITIONS = [0, 1, 2, 3, 5, 6, 8, 9]
+
+# Bytes hashed from the start and the end of the source file for its fingerprint
+FINGERPRINT_SAMPLE_BYTES = 1 << 20
+
+# Characters read per step by the streaming reader, and records per streamed chunk
+STREAM_BLOCK_SIZE = 1 << 16
+STREAM_CHUNK_RECORDS = 100000
+
+# Smallest byte range worth handing to a separate worker when parsing JSON Lines
+JSONL_MIN_RANGE_BYTES = 8 << 20
+
+# Function to convert the 'time' string of a record into its hour (-1 if missing)
+def parse_hour(time_str):
+    try:
+        return int(str(time_str).split(':')[0])
+    except ValueError:
+        return -1
+
+# Function to turn a list of record dicts into typed NumPy columns
+def records_to_columns(records):
+    dates = []
+    cities = []
+    hours = []
+    numeric = {field: [] for field in NUMERIC_FIELDS}
+    weather = {}
+
+    for index, entry in enumerate(records):
+        dates.append(str(entry.get('date', '') or ''))
+
+        # Keep only plain city names, anything else becomes an empty string
+        city = entry.get('city', '')
+        cities.append(city if isinstance(city, str) else '')
+
+        hours.append(parse_hour(entry.get('time', '')))
+
+        for field in NUMERIC_FIELDS:
+            numeric[field].append(entry.get(field, 0))
+
+        # Flatten the weather block, back-filling fields first seen mid-file with 0
+        entry_weather = entry.get('weather', {}) or {}
+        for field in entry_weather:
+            if field not in weather:
+                weather[field] = [0] * index
+        for field, values in weather.items():
+            values.append(entry_weather.get(field, 0))
+
+    columns = {
+        'date': np.array(dates, dtype=str),
+        'city': np.array(cities, dtype=str),
+        'hour': np.array(hours, dtype=np.int8),
+    }
+    for field, values in numeric.items():
+        columns[field] = np.array(values, dtype=np.float64)
+    for field, values in weather.items():
+        columns[field] = np.array(values, dtype=np.float64)
+
+    add_date_columns(columns)
+    return columns
+
+# Function to decode a whole array of 'YYYY-MM-DD' strings into year/month/day ints, a validity
+# mask, a packed year * 12 + (month - 1) bucket key (-1 for invalid dates) and a day number
+def decode_dates(dates):
+    dates = np.ascontiguousarray(dates, dtype=str)
+    count = len(dates)
+    width = dates.dtype.itemsize // 4
+    years = np.zeros(count, dtype=np.int32)
+    months = np.zeros(count, dtype=np.int32)
+    days = np.zeros(count, dtype=np.int32)
+    canonical = np.zeros(count, dtype=bool)
+
+    # Fast path: read the digits of canonical dates straight out of the string buffer
+    if count and width >= 10:
+        chars = dates.view(np.uint32).reshape(count, width)
+        digits = chars[:, DATE_DIGIT_POSITIONS].astype(np.int32) - ord('0')
+        canonical = (
+            ((digits >= 0) & (digits <= 9)).all(axis=1)
+            & (chars[:, 4] == ord('-'))
+            & (chars[:, 7] == ord('-'))
+            & (chars[:, 10:] == 0).all(axis=1)
+        )
+        years = np.where(canonical, digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3], 0).astype(np.int32)
+        months = np.where(canonical, digits[:, 4] * 10 + digits[:, 5], 0).astype(np.int32)
+        days = np.where(canonical, digits[:, 6] * 10 + digits[:, 7], 0).astype(np.int32)
+
+    # Check the ranges the same way strptime does, including leap years
+    leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    month_lengths = DAYS_IN_MONTH[np.clip(months, 0, 12)] + ((months == 2) & leap)
+    valid = canonical & (years >= 1) & (months >= 1) & (months <= 12) & (days >= 1) & (days <= month_lengths)
+
+    # Slow path: strptime also accepts forms like '2020-1-5', so let it judge anything non-canonical
+    for index in np.flatnonzero(~canonical & (dates != '')):
+        try:
+            parsed = datetime.strptime(dates[index], "%Y-%m-%d")
+        except ValueError:
+            continue  # Leave invalid dates masked out
+        years[index] = parsed.year
+        months[index] = parsed.month
+        days[index] = parsed.day
+        valid[index] = True
+
+    years[~valid] = 0
+    months[~valid] = 0
+    days[~valid] = 0
+    year_month = np.where(valid, years * 12 + months - 1, -1).astype(np.int32)
+
+    # Days since 1970-01-01, so date ranges can be compared as integers (0 for invalid dates)
+    first_of_month = ((years - 1970) * 12 + months - 1).astype('datetime64[M]').astype('datetime64[D]')
+    day_number = np.where(valid, (first_of_month + (days - 1)).astype(np.int64), 0).astype(np.int32)
+
+    return {'year': years, 'month': months, 'day': days, 'valid': valid, 'year_month': year_month, 'day_number': day_number}
+
+# Function to add the decoded date columns to a set of columns
+def add_date_columns(columns):
+    columns.update(decode_dates(columns['date']))
+
+# Function to fetch a column, falling back to zeros when no record had the field
+def get_column(columns, name):
+    if name in columns:
+        return columns[name]
+    return np.zeros(len(columns['date']), dtype=np.float64)
+
+# Columns derived so far from each loaded dataset: id(columns) -> (columns, {name: values})
+DERIVED_COLUMNS = {}
+
+# Function to get a column derived from a loaded dataset, computing it with build_func(columns) only
+# the first time, so every report run over the same in-memory dataset shares it. Meant for whole
+# datasets; the memo keeps each dataset alive, so streamed chunks should not go through it.
+def derived_column(columns, name, build_func):
+    entry = DERIVED_COLUMNS.get(id(columns))
+    if entry is None or entry[0] is not columns:
+        entry = DERIVED_COLUMNS[id(columns)] = (columns, {})
+    if name not in entry[1]:
+        entry[1][name] = build_func(columns)
+    return entry[1][name]
+
+# Function to drop the derived columns of a dataset once nothing will read it again, so it can be freed
+def forget_derived_columns(columns):
+    entry = DERIVED_COLUMNS.get(id(columns))
+    if entry is not None and entry[0] is columns:
+        del DERIVED_COLUMNS[id(columns)]
+
+
+# Function to iterate over every row, as plain Python values
+def iter_rows(columns, *names):
+    return zip(*(get_column(columns, name).tolist() for name in names))
+
+# Function to iterate over the rows with a valid date, as plain Python values
+def iter_valid_rows(columns, *names):
+    valid = columns['valid']
+    return zip(*(get_column(columns, name)[valid].tolist() for name in names))
+
+# Function to yield the records of a top-level JSON array one at a time, without loading the whole file
+# (reading only its first `size` bytes when size is given)
+def iter_json_records(file_path, size=None):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(file_path, 'rb') as f:
+        remaining = os.fstat(f.fileno()).st_size if size is None else size
+        buffer = ''
+        position = 0
+        at_eof = False
+        opened = False
+
+        while True:
+            # Skip whitespace and the separators between array items
+            while position < len(buffer) and (buffer[position].isspace() or (opened and buffer[position] == ',')):
+                position += 1
+
+            if position < len(buffer):
+                if not opened:
+                    if buffer[position] != '[':
+                        raise ValueError(f"'{file_path}' does not contain a top-level JSON array")
+                    opened = True
+                    position += 1
+                    continue
+
+                if buffer[position] == ']':
+                    return
+
+                try:
+                    record, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    end = None
+
+                # Only trust a record that is followed by more text, or that ends the file
+                if end is not None and (end < len(buffer) or at_eof):
+                    yield record
+                    position = end
+                    continue
+
+                if at_eof:
+                    raise ValueError(f"'{file_path}' ends in the middle of a record")
+            elif at_eof:
+                if opened:
+                    raise ValueError(f"'{file_path}' ends before its JSON array is closed")
+                return
+
+            # Drop what has been consumed and read the next block
+            block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+            remaining -= len(block)
+            at_eof = not block
+            buffer = buffer[position:] + text_decoder.decode(block, final=at_eof)
+            position = 0
+
+# Function to yield the records of a JSON array in lists of at most chunk_size records
+def iter_json_chunks(file_path, chunk_size=STREAM_CHUNK_RECORDS, size=None):
+    chunk = []
+    for record in iter_json_records(file_path, size):
+        chunk.append(record)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# Function to stream a data file as a sequence of column chunks in constant memory
+def iter_column_chunks(file_path, chunk_size=STREAM_CHUNK_RECORDS, size=None):
+    for chunk in iter_json_chunks(file_path, chunk_size, size):
+        yield records_to_columns(chunk)
+
+# Function to treat either one set of columns or a stream of column chunks as a stream
+def as_column_chunks(data):
+    if isinstance(data, dict):
+        return [data]
+    return data
+
+# Function to join several sets of columns end to end, filling weather fields missing from a part with 0
+def concat_columns(parts):
+    parts = [part for part in parts if len(part['date'])]
+    if not parts:
+        return records_to_columns([])
+    if len(parts) == 1:
+        return parts[0]
+
+    names = []
+    for part in parts:
+        names.extend(name for name in part if name not in names)
+
+    columns = {}
+    for name in names:
+        columns[name] = np.concatenate([
+            part[name] if name in part else np.zeros(len(part['date']), dtype=np.float64)
+            for part in parts
+        ])
+    return columns
+
+# Function to find where the complete lines of a JSON Lines file end within its bytes [start, size): after
+# the last newline, or at size when the text after it is a whole record that only lacks its newline (the
+# last line of a finished file). A line cut off while it is being written is left for a later read.
+def complete_lines_end(file_path, start, size):
+    tail = b''
+    with open(file_path, 'rb') as f:
+        # Read back from the end one block at a time until the last newline
+        position = size
+        while position > start and b'\n' not in tail:
+            step = min(STREAM_BLOCK_SIZE, position - start)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+    tail = tail[tail.rfind(b'\n') + 1:]
+
+    if not tail.strip():
+        return size
+    try:
+        if isinstance(json.loads(tail), dict):
+            return size
+    except ValueError:
+        pass
+    return size - len(tail)
+
+# Function to split the first `size` bytes of a JSON Lines file (all of it by default) into about `parts`
+# byte ranges that start and end on line boundaries
+def split_line_ranges(file_path, parts, size=None):
+    size = os.path.getsize(file_path) if size is None else size
+    bounds = [0]
+    with open(file_path, 'rb') as f:
+        for part in range(1, parts):
+            f.seek(size * part // parts)
+            f.readline()  # Move on to the start of the next line
+            position = f.tell()
+            if position >= size:
+                break
+            if position > bounds[-1]:
+                bounds.append(position)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# Function to parse one byte range of complete JSON Lines into columns (runs in a worker process)
+def parse_line_range(file_path, start, end):
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    return records_to_columns([json.loads(line) for line in text.splitlines() if line.strip()])
+
+# Function to parse the complete lines of a JSON Lines file in parallel, one byte range per worker
+# (a last line still being written is left out). With end given only the lines before it are parsed.
+def load_jsonl_columns(file_path, workers=None, end=None):
+    workers = workers or os.cpu_count() or 1
+    if end is None:
+        end = complete_lines_end(file_path, 0, os.path.getsize(file_path))
+    parts = max(1, min(workers, end // JSONL_MIN_RANGE_BYTES))
+    ranges = split_line_ranges(file_path, parts, end)
+
+    if len(ranges) == 1:
+        return parse_line_range(file_path, *ranges[0])
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        starts, ends = zip(*ranges)
+        return concat_columns(list(executor.map(parse_line_range, [file_path] * len(ranges), starts, ends)))
+
+# Function to fingerprint a data file by size, mtime and a hash of its head and tail. With size given,
+# the hash covers the file as if it ended there (to check that an older, shorter file was only appended to);
+# with mtime_ns given too, the file is not looked up again (the size and mtime come from one earlier stat).
+def file_fingerprint(file_path, size=None, mtime_ns=None):
+    if size is None or mtime_ns is None:
+        stat = os.stat(file_path)
+        size = stat.st_size if size is None else size
+        mtime_ns = stat.st_mtime_ns if mtime_ns is None else mtime_ns
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(min(size, FINGERPRINT_SAMPLE_BYTES)))
+        if size > FINGERPRINT_SAMPLE_BYTES:
+            tail_start = max(size - FINGERPRINT_SAMPLE_BYTES, FINGERPRINT_SAMPLE_BYTES)
+            f.seek(tail_start)
+            digest.update(f.read(size - tail_start))
+    return {
+        'version': CACHE_VERSION,
+        'size': size,
+        'mtime_ns': mtime_ns,
+        'hash': digest.hexdigest(),
+    }
+
+# Function to get the folder holding the parse cache of a data file
+def cache_folder(file_path):
+    return file_path + '.cache'
+
+# Function to map the cached columns back in, or return None if the cache is missing or stale
+def read_cache(file_path, fingerprint):
+    folder = cache_folder(file_path)
+    try:
+        with open(os.path.join(folder, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('fingerprint') != fingerprint:
+        return None
+
+    try:
+        return {
+            name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r')
+            for name in meta['columns']
+        }
+    except (OSError, ValueError):
+        return None
+
+# Function to write the columns as one .npy file each plus a metadata header
+def write_cache(file_path, fingerprint, columns):
+    folder = cache_folder(file_path)
+    staging = f'{folder}.tmp-{os.getpid()}'
+    try:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        os.makedirs(staging)
+        for name, values in columns.items():
+            np.save(os.path.join(staging, f'{name}.npy'), values)
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump({'fingerprint': fingerprint, 'columns': list(columns)}, f)
+
+        # Swap the finished cache in so readers never see a half-written one
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.rename(staging, folder)
+    except OSError as error:
+        print(f"Could not write parse cache for '{file_path}': {error}")
+        shutil.rmtree(staging, ignore_errors=True)
+
+# Function to fingerprint the part of a data file that can be parsed now: the whole of a JSON array, or
+# the complete lines of a JSON Lines file. The file is looked up once, so the fingerprint's size is where
+# a parse has to stop for its columns to be exactly what the fingerprint describes.
+def source_fingerprint(file_path):
+    stat = os.stat(file_path)
+    size = stat.st_size
+    if file_path.endswith('.jsonl'):
+        size = complete_lines_end(file_path, 0, size)
+    return file_fingerprint(file_path, size, stat.st_mtime_ns)
+
+# Function to load a merged_data.json (JSON array) or merged_data.jsonl (JSON Lines) file into columns,
+# reusing the parse cache when it is fresh. Returns the columns with the fingerprint of the bytes they
+# were parsed from; records appended while the file is read are left for the next load.
+def read_dataset(file_path, use_cache=True, workers=None):
+    fingerprint = source_fingerprint(file_path)
+    if use_cache:
+        columns = read_cache(file_path, fingerprint)
+        if columns is not None:
+            return columns, fingerprint
+
+    if file_path.endswith('.jsonl'):
+        columns = load_jsonl_columns(file_path, workers, fingerprint['size'])
+    else:
+        # Stream the array in chunks so only the columns, never every record dict, are held at once
+        columns = concat_columns(list(iter_column_chunks(file_path, size=fingerprint['size'])))
+
+    if use_cache:
+        write_cache(file_path, fingerprint, columns)
+    return columns, fingerprint
+
+# Function to load a merged_data.json (JSON array) or merged_data.jsonl (JSON Lines) file into columns
+def load_dataset(file_path, use_cache=True, workers=None):
+    return read_dataset(file_path, use_cache, workers)[0]
+
+# Function to find what was appended to a data file since it had the given (older) fingerprint. Returns the
+# byte range (start, end) of the complete lines added to a JSON Lines file (empty when the file is unchanged
+# or no line is complete yet), or None when the file was changed some other way than by appending lines.
+# `stat` is the os.stat of the file to compare, when the caller has already looked it up.
+def appended_line_range(file_path, fingerprint, stat=None):
+    stat = os.stat(file_path) if stat is None else stat
+    size = stat.st_size
+    if fingerprint.get('version') != CACHE_VERSION or size < fingerprint['size']:
+        return None
+
+    # At the same size the file is unchanged only if its whole fingerprint (mtime included) still
+    # matches; an edit in place that keeps the size is a rewrite
+    if size == fingerprint['size']:
+        return (size, size) if file_fingerprint(file_path, size, stat.st_mtime_ns) == fingerprint else None
+
+    # A longer file was appended to only if the part it had before still hashes the same
+    if not file_path.endswith('.jsonl') or file_fingerprint(file_path, fingerprint['size'], stat.st_mtime_ns)['hash'] != fingerprint['hash']:
+        return None
+
+    # Stop after the last complete line; a line still being written is left for the next look
+    return fingerprint['size'], complete_lines_end(file_path, fingerprint['size'], size)
+
+# Function to read the fingerprint of the file the parse cache was written from, or None without a cache
+def cache_fingerprint(file_path):
+    try:
+        with open(os.path.join(cache_folder(file_path), 'meta.json'), 'r') as f:
+            return json.load(f)['fingerprint']
+    except (OSError, ValueError, KeyError):
+        return None
+
+# Function to bring the parse cache of a JSON Lines file up to date with the lines appended to the file
+# since the cache was written, parsing only those lines. Returns the columns, the number of rows the cache
+# held before and the fingerprint of the bytes the columns were parsed from, or None when there is no cache
+# or the file was changed some other way than by appending (read_dataset then parses it again in full).
+# A last line still being written is left for the next call.
+def append_to_cache(file_path):
+    cached = cache_fingerprint(file_path)
+    columns = read_cache(file_path, cached) if cached is not None else None
+    stat = os.stat(file_path)
+    appended = appended_line_range(file_path, cached, stat) if columns is not None else None
+    if appended is None:
+        return None
+
+    start, end = appended
+    rows = len(columns['date'])
+    if end == start:
+        return columns, rows, cached
+
+    # Fingerprint exactly the lines parsed, with the mtime of the one look at the file
+    fingerprint = file_fingerprint(file_path, end, stat.st_mtime_ns)
+    columns = concat_columns([dict(columns), parse_line_range(file_path, start, end)])
+    write_cache(file_path, fingerprint, columns)
+    return columns, rows, fingerprint
@@ -1,15 +1,17 @@
-import json
-import matplotlib.pyplot as plt
 import os
-from datetime import datetime
-
-def setup_output_folder(folder_name):
-    """Creates an output folder if it doesn't exist, or clears it if it does."""
-    if os.path.exists(folder_name):
-        for file in os.listdir(folder_name):
-            os.remove(os.path.join(folder_name, file))
-    else:
-        os.makedirs(folder_name)
+import sys
+import json
+import argparse
+import numpy as np
+from dataset import load_dataset, get_column, derived_column
+from categories import MAGNITUDE_BINS, RAINFALL_BINS, SUNLIGHT_BINS, classify_column, count_codes, counts_to_dict
+from cube import CATEGORY_AXES, build_cube, cube_slice, load_cube, encode_cities, category_codes
+from queries import load_queries, evaluate_queries
+from render import plt, render_charts
+from export import add_data_only_args, write_aggregates
+from output import check_folder_keys, start_output_run, output_path, finish_output_run, discard_output_run
+from index import (build_date_index, build_city_date_index, build_day_prefix_counts, prefix_range_counts,
+                   parse_day, select_date_rows)
 
 OUTPUT_FOLDERS = {
     "earthquake_piecharts": "earthquake_piecharts",
@@ -18,16 +20,27 @@ OUTPUT_FOLDERS = {
     "rain_piecharts_analysis": "rain_piecharts_analysis",
     "day_files":"day_files"
 }
+
+# Output run the interactive charts are staged in (see output.py); None writes straight into the folders
+output_run = None
  
-# Your function to create pie chart
+# Function to create one pie chart in the output folder of folder_key (the key is checked even when
+# there is nothing to plot, so a wrong key fails on the first call)
 def create_pie_chart(data, labels, title, filename ,folder_key):
- for folder in OUTPUT_FOLDERS.values():
-    setup_output_folder(folder)
-
+    check_folder_keys(OUTPUT_FOLDERS, [folder_key])
     if not data or all(d == 0 for d in data):
         print(f"Skipping pie chart generation for {title} because there is no valid data to plot.")
         return  
 
+    if output_run is not None:
+        chart_path = output_path(output_run, folder_key, filename)
+    else:
+        os.makedirs(OUTPUT_FOLDERS[folder_key], exist_ok=True)
+        chart_path = os.path.join(OUTPUT_FOLDERS[folder_key], filename)
+    draw_pie_chart(data, labels, title, chart_path)
+
+# Function to draw one pie chart and save it to output_path
+def draw_pie_chart(data, labels, title, output_path):
     plt.figure(figsize=(8, 8))
     colors = plt.cm.Paired.colors[:len(labels)]  # Assign unique colors, ensuring no repeats
 
@@ -49,1006 +62,477 @@ def create_pie_chart(data, labels, title, filename ,folder_key):
     plt.title(title, fontsize=10)
 
     # Save chart without any internal labels
-    output_path = os.path.join(OUTPUT_FOLDERS[folder_key], filename)
     plt.savefig(output_path, bbox_inches='tight')
     plt.close()
     print(f"Saved pie chart: {output_path}")
-
-# Function to classify rainfall data by magnitude
-def classify_magnitude(magnitude):
-    if magnitude <= 2:
-        return 'Low_Magnitude'
-    elif 3 <= magnitude <= 5:
-        return 'Medium_Magnitude'
-    elif magnitude >= 5:
-        return 'High_Magnitude'
-    return None  # If there's no valid data for magnitude
-
-# Function to classify elevation
-def classify_elevation(elevation):
-    if elevation <= 10:
-        return 'Below_Sea_Level'
-    elif 11 <= elevation <= 30:
-        return 'Sea_Level'
-    elif 31 <= elevation <= 60:
-        return 'Ground_Level'
-    elif 61 <= elevation <= 90:
-        return 'Ground_Level_Mid'
-    elif elevation > 90:
-        return 'Ground_Level_High'
-    return None
-
-# Function to classify rainfall categories
-def classify_rainfall(rain_sum):
-    if rain_sum <= 5:
-        return 'Low_rainfall'
-    elif 6 <= rain_sum <= 10:
-        return 'Medium_rainfall'
-    elif rain_sum >= 10:
-        return 'High_rainfall'
-    return None  # If there's no valid data for rainfall sum
-
-# Function to categorize time of day
-def categorize_time_of_day(time_str):
-    # Split time_str by ':' and get the hour part
-    hour = int(time_str.split(':')[0])  # Extract hour as an integer
-    
-    if 0 <= hour < 10:
-        return 'Morning'
-    elif 10 <= hour < 13:
-        return 'Mid_Morning'
-    elif 13 <= hour < 17:
-        return 'Afternoon'
-    elif 17 <= hour < 20:
-        return 'Evening'
-    elif 20 <= hour < 24:
-        return 'Night'
-    return None
+    return output_path
 
 def get_sunshine_duration(sunshine_seconds) :
 
    
-    sunshine_seconds = float(sunshine_seconds)
+    sunshine_seconds = np.asarray(sunshine_seconds, dtype=np.float64)
     return sunshine_seconds / 3600  
 
-# Load your JSON data from the file
-def load_json_data(file_path):
-    with open(file_path, 'r') as file:
-        return json.load(file)
-
-# Process data and create a pie chart for rainfall categories
-def process_earthquake_magnitude_data_and_create_pie_chart(json_data):
-    
-    earthquake_magnitude_categories = {'Low_Magnitude':0 ,'Medium_Magnitude':0,'High_Magnitude':0}
-    
-    # Iterate over each record and classify the rainfall
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-       
-        magnitude_category = classify_magnitude(magnitude)
-        if magnitude_category:
-            if magnitude_category == 'Low_Magnitude':
-               earthquake_magnitude_categories['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                earthquake_magnitude_categories['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                earthquake_magnitude_categories['High_Magnitude'] += 1
-
-    # Prepare data for pie chart
-    data = list(earthquake_magnitude_categories.values())
-    labels = list(earthquake_magnitude_categories.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "Earthquake Magnitude Distribution", "magnitude_distribution.png", "earthquake_piechats")
-
-def process_earthquake_magnitude_by_night(json_data):
-    night_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if time_str_category == 'Night':
-            if magnitude_category == 'Low_Magnitude':
-                night_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                night_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                night_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(night_magnitudes.values())
-    labels = list(night_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_night", "magnitude_distribution _by_night.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_evening(json_data):
-    evening_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        time_str = entry.get('time')
-        
-        time_str_category = categorize_time_of_day(time_str)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if time_str_category == 'Evening':
-            if magnitude_category == 'Low_Magnitude':
-                evening_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                evening_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                evening_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(evening_magnitudes.values())
-    labels = list(evening_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_evening", "magnitude_distribution _by_evening.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_afternoon(json_data):
-    afternoon_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if time_str_category == 'Afternoon':
-            if magnitude_category == 'Low_Magnitude':
-                afternoon_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                afternoon_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                afternoon_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(afternoon_magnitudes.values())
-    labels = list(afternoon_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_afternoon", "magnitude_distribution _by_afternoon.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_mid_morning(json_data):
-    MidMorning_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if time_str_category == 'Mid_Morning':
-            if magnitude_category == 'Low_Magnitude':
-                 MidMorning_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                 MidMorning_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                 MidMorning_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list( MidMorning_magnitudes.values())
-    labels = list( MidMorning_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_ MidMorning_magnitudes", "magnitude_distribution _by_ MidMorning_magnitudes.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_Morning(json_data):
-    Morning_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if time_str_category == 'Morning':
-            if magnitude_category == 'Low_Magnitude':
-                Morning_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Morning_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Morning_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(Morning_magnitudes.values())
-    labels = list(Morning_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_Morning", "magnitude_distribution _by_Morning.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_elevation_Below_Sea_Level(json_data):
-    belowsealevel_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if elevation_category == 'Below_Sea_Level':
-            if magnitude_category == 'Low_Magnitude':
-                belowsealevel_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                belowsealevel_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                belowsealevel_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(belowsealevel_magnitudes.values())
-    labels = list(belowsealevel_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_Below_Sea_Level", "magnitude_distribution _by_Below_Sea_Level.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_elevation_Sea_Level(json_data):
-    Sea_Level_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if elevation_category == 'Sea_Level':
-            if magnitude_category == 'Low_Magnitude':
-                Sea_Level_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Sea_Level_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Sea_Level_magnitudes['High_Magnitude'] += 1
-
-
+# Function to sum the cube down to one category axis as a {label: count} dict
+def cube_counts(cube, axis):
+    bins = CATEGORY_AXES[axis][1]
+    return counts_to_dict(cube_slice(cube, [axis])[:-1], bins)  # The last slot holds unclassified rows
+
+# Function to sum the cube down to a (row category x column category) table as nested {label: {label: count}} dicts
+def cube_table(cube, row_axis, column_axis):
+    row_bins = CATEGORY_AXES[row_axis][1]
+    column_bins = CATEGORY_AXES[column_axis][1]
+    table = cube_slice(cube, [row_axis, column_axis])[:-1, :-1]
+    return {label: counts_to_dict(row, column_bins) for label, row in zip(row_bins['labels'], table)}
+
+# Function to build every pie chart's counts and totals. The category charts are slices of the
+# count cube (built from `data` unless a loaded one is passed); the totals come from the columns.
+def build_pie_chart_counts(data, cube=None):
+    if cube is None:
+        cube = build_cube(data)
+
+    rain_sum = get_column(data, 'rain_sum')
+    snowfall_sum = get_column(data, 'snowfall_sum')
+    precipitation_hours = get_column(data, 'precipitation_hours')
+    sunshine_hours = derived_column(data, 'sunshine_duration', lambda columns: get_sunshine_duration(get_column(columns, 'sunshine_hours')))
+    sunlight_codes = classify_column((sunshine_hours / 12) * 100, SUNLIGHT_BINS)
+    daylight_percentage = (sunshine_hours / 24) * 100
+    precipitation_percentage = (precipitation_hours / 24) * 100
+
+    # Rain counts when a day had any, snow only on days without rain (same for sun and precipitation hours)
+    rain_days = rain_sum != 0
+    sun_days = sunshine_hours != 0
+
+    return {
+        'magnitude': cube_counts(cube, 'magnitude'),
+        'magnitude_by_time_of_day': cube_table(cube, 'time_of_day', 'magnitude'),
+        'magnitude_by_elevation': cube_table(cube, 'elevation', 'magnitude'),
+        'magnitude_by_rainfall': cube_table(cube, 'rainfall', 'magnitude'),
+        'rainfall': cube_counts(cube, 'rainfall'),
+        'rainfall_by_time_of_day': cube_table(cube, 'time_of_day', 'rainfall'),
+        'rainfall_by_elevation': cube_table(cube, 'elevation', 'rainfall'),
+        'sunlight': counts_to_dict(count_codes(sunlight_codes, SUNLIGHT_BINS), SUNLIGHT_BINS),
+        'daylight_vs_rest': {"Daylight Hours": daylight_percentage.sum().item(), "Rest of Day": (100 - daylight_percentage).sum().item()},
+        'precipitation': {"Precipitation Hours": precipitation_percentage.sum().item(), "Hours Without Precipitation": (100 - precipitation_percentage).sum().item()},
+        'precipitation_total': {"Rain": rain_sum[rain_days].sum().item(), "snow": snowfall_sum[~rain_days & (snowfall_sum != 0)].sum().item()},
+        'sunlight_and_precipitation': {"Sun_hours": sunshine_hours[sun_days].sum().item(), "precipitation": precipitation_hours[~sun_days & (precipitation_hours != 0)].sum().item()},
+    }
+
+# Function to draw a pie chart from one slice of the counts
+def create_category_pie_chart(category_counts, title, filename, folder_key):
     # Prepare data for pie chart
-    data = list(Sea_Level_magnitudes.values())
-    labels = list(Sea_Level_magnitudes.keys())
+    data = list(category_counts.values())
+    labels = list(category_counts.keys())
 
     # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_Sea_Level", "magnitude_distribution _by_Sea_Level.png"<"earthquake_piechats")
-
-def process_earthquake_magnitude_by_elevation_Ground_Level(json_data):
-    Ground_Level_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        elevation = entry.get ('elevation')
-        
-        elevation_category = classify_elevation(elevation)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if elevation_category == 'Ground_Level':
-            if magnitude_category == 'Low_Magnitude':
-               Ground_Level_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Ground_Level_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Ground_Level_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(Ground_Level_magnitudes.values())
-    labels = list(Ground_Level_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_Ground_Level", "magnitude_distribution _by_Ground_Level.png")
-
-def process_earthquake_magnitude_by_elevation_Ground_Level_Mid(json_data):
-    Ground_Level_Mid_magnitude = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        elevation = entry.get ('elevation')
-        
-        elevation_category = classify_elevation(elevation)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if elevation_category == 'Ground_Level_Mid':
-            if magnitude_category == 'Low_Magnitude':
-               Ground_Level_Mid_magnitude['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Ground_Level_Mid_magnitude['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Ground_Level_Mid_magnitude['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(Ground_Level_Mid_magnitude.values())
-    labels = list(Ground_Level_Mid_magnitude.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_Ground_Level_Mid", "magnitude_distribution _by_Ground_Level_Mid.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_elevation_Ground_Level_High(json_data):
-    Ground_Level_High_magnitude = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        elevation = entry["elevation"]
-        
-        elevation_category = categorize_time_of_day(elevation)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if elevation_category == 'Ground_Level_High':
-            if magnitude_category == 'Low_Magnitude':
-               Ground_Level_High_magnitude['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Ground_Level_High_magnitude['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Ground_Level_High_magnitude['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(Ground_Level_High_magnitude.values())
-    labels = list(Ground_Level_High_magnitude.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_Ground_Level_High", "magnitude_distribution _by_Ground_Level_High.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_elevation_Ground_Level_High(json_data):
-    Ground_Level_High_magnitude = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if elevation_category == 'Ground_Level_High':
-            if magnitude_category == 'Low_Magnitude':
-               Ground_Level_High_magnitude['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Ground_Level_High_magnitude['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Ground_Level_High_magnitude['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(Ground_Level_High_magnitude.values())
-    labels = list(Ground_Level_High_magnitude.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _by_Ground_Level_High", "magnitude_distribution _by_Ground_Level_High.png")
-
-def process_earthquake_magnitude_by_Low_rainfall(json_data):
-    Low_rainfall_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        
-        rain_sum_category = classify_rainfall(rain_sum)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if rain_sum_category == 'Low_rainfall':
-            if magnitude_category == 'Low_Magnitude':
-               Low_rainfall_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Low_rainfall_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Low_rainfall_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(Low_rainfall_magnitudes.values())
-    labels = list(Low_rainfall_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _recieved with low rainfall", "magnitude_distribution _by_Low_rainfall_magnitudes.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_Medium_rainfall(json_data):
-    Medium_rainfall_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        
-        rain_sum_category = classify_rainfall(rain_sum)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if rain_sum_category == 'Medium_rainfall':
-            if magnitude_category == 'Low_Magnitude':
-               Medium_rainfall_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                Medium_rainfall_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                Medium_rainfall_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(Medium_rainfall_magnitudes.values())
-    labels = list(Medium_rainfall_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _recieved with Medium_rainfall", "magnitude_distribution _by_Medium_rainfall_magnitudes.png","earthquake_piechats")
-
-def process_earthquake_magnitude_by_High_rainfall(json_data):
-    High_rainfall_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        magnitude =entry.get('magnitude')
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        
-        rain_sum_category = classify_rainfall(rain_sum)
-        magnitude_category = classify_magnitude(magnitude)
-        
-        if rain_sum_category == 'High_rainfall':
-            if magnitude_category == 'Low_Magnitude':
-               High_rainfall_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                High_rainfall_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                High_rainfall_magnitudes['High_Magnitude'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(High_rainfall_magnitudes.values())
-    labels = list(High_rainfall_magnitudes.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "magnitude_distribution _recieved with High_rainfall", "magnitude_distribution _by_High_rainfall_magnitudes.png","earthquake_piechats")
-
-
-    year_month_set = set()
-
-    for entry in json_data:
-        date = entry.get('date')
-        if date:
-            year, month, _ = date.split("-")  # Extract year and month
-            year_month_set.add(f"{year}-{month}")  # Add the unique year-month combination to the set
-
-    return year_month_set
+    create_pie_chart(data, labels, title, filename, folder_key)
 
-def process_city_data_magnitude_and_create_pie_chart(json_data, city_name,start_date_input,end_date_input):
-    city_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Loop through the JSON data and filter by city
-    for entry in json_data:
-        city = entry.get('city', "")
-        event_date = entry.get('date')
-        if not city or isinstance(city, list):
-            continue
-
-        if city == city_name and start_date_input <= event_date <= end_date_input :
-            magnitude =entry.get('magnitude')
-            magnitude_category = classify_magnitude(magnitude)
-            if magnitude_category == 'Low_Magnitude':
-                city_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                    city_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                city_magnitudes['High_Magnitude'] += 1
+# Process data and create a pie chart for rainfall categories
+def process_earthquake_magnitude_data_and_create_pie_chart(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude'], "Earthquake Magnitude Distribution", "magnitude_distribution.png", "earthquake_piecharts")
+
+def process_earthquake_magnitude_by_night(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_time_of_day']['Night'], "magnitude_distribution _by_night", "magnitude_distribution _by_night.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_evening(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_time_of_day']['Evening'], "magnitude_distribution _by_evening", "magnitude_distribution _by_evening.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_afternoon(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_time_of_day']['Afternoon'], "magnitude_distribution _by_afternoon", "magnitude_distribution _by_afternoon.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_mid_morning(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_time_of_day']['Mid_Morning'], "magnitude_distribution _by_ MidMorning_magnitudes", "magnitude_distribution _by_ MidMorning_magnitudes.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_Morning(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_time_of_day']['Morning'], "magnitude_distribution _by_Morning", "magnitude_distribution _by_Morning.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_elevation_Below_Sea_Level(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_elevation']['Below_Sea_Level'], "magnitude_distribution _by_Below_Sea_Level", "magnitude_distribution _by_Below_Sea_Level.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_elevation_Sea_Level(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_elevation']['Sea_Level'], "magnitude_distribution _by_Sea_Level", "magnitude_distribution _by_Sea_Level.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_elevation_Ground_Level(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_elevation']['Ground_Level'], "magnitude_distribution _by_Ground_Level", "magnitude_distribution _by_Ground_Level.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_elevation_Ground_Level_Mid(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_elevation']['Ground_Level_Mid'], "magnitude_distribution _by_Ground_Level_Mid", "magnitude_distribution _by_Ground_Level_Mid.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_elevation_Ground_Level_High(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_elevation']['Ground_Level_High'], "magnitude_distribution _by_Ground_Level_High", "magnitude_distribution _by_Ground_Level_High.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_Low_rainfall(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_rainfall']['Low_rainfall'], "magnitude_distribution _recieved with low rainfall", "magnitude_distribution _by_Low_rainfall_magnitudes.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_Medium_rainfall(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_rainfall']['Medium_rainfall'], "magnitude_distribution _recieved with Medium_rainfall", "magnitude_distribution _by_Medium_rainfall_magnitudes.png","earthquake_piecharts")
+
+def process_earthquake_magnitude_by_High_rainfall(pie_counts):
+    create_category_pie_chart(pie_counts['magnitude_by_rainfall']['High_rainfall'], "magnitude_distribution _recieved with High_rainfall", "magnitude_distribution _by_High_rainfall_magnitudes.png","earthquake_piecharts")
+
+# Function to build the per-day cumulative magnitude and rainfall category counts behind the date-range charts
+def build_date_range_counts(data):
+    date_range_counts = {}
+    for kind in ['magnitude', 'rainfall']:
+        bins = CATEGORY_AXES[kind][1]
+        date_range_counts[kind] = build_day_prefix_counts(data, category_codes(data, kind), len(bins['labels']))
+    return date_range_counts
+
+# Function to count the magnitude or rainfall categories of the records dated in [start_date_input, end_date_input].
+# Uses two prefix-sum lookups when date_range_counts is given, otherwise reads the matching rows.
+# Returns the {label: count} dict and the number of records in the range.
+def count_date_range_categories(data, kind, start_date_input, end_date_input, date_index=None, date_range_counts=None):
+    column, bins = CATEGORY_AXES[kind]
+    start_day = parse_day(start_date_input)
+    end_day = parse_day(end_date_input)
+    if date_range_counts is not None and start_day is not None and end_day is not None:
+        counts = prefix_range_counts(date_range_counts[kind], start_day, end_day)
+        return counts_to_dict(counts[:-1], bins), counts.sum().item()  # The last slot holds unclassified rows
+
+    selected = select_date_rows(data, start_date_input, end_date_input, date_index)
+    codes = classify_column(get_column(data, column)[selected], bins)
+    return counts_to_dict(count_codes(codes, bins), bins), len(selected)
+
+# Function to get the title and file name of a date range's magnitude or rainfall pie chart
+def date_range_chart_names(kind, start_date_input, end_date_input):
+    if kind == 'magnitude':
+        return (f"earthquake distribution for {start_date_input} to {end_date_input}",
+                f"earthquake_distribution_for {start_date_input} to {end_date_input}.png")
+    return (f"Rainfall Distribution for {start_date_input} to {end_date_input}",
+            f"rainfall_distribution_for {start_date_input} to {end_date_input}.png")
+
+# Function to get the title and file name of a city's magnitude or rainfall pie chart
+def city_chart_names(kind, city_name, start_date_input, end_date_input):
+    if kind == 'magnitude':
+        return (f"earthquake magnitude Distribution for {city_name} from for {start_date_input} to {end_date_input}",
+                f"earthquake_magnitude_distribution_{city_name}_for_{start_date_input}_to_{end_date_input} .png")
+    return (f"Rainfall Distribution for {city_name} from for {start_date_input} to {end_date_input}",
+            f"rainfall_distribution_{city_name}_for_{start_date_input}_to_{end_date_input} .png")
+
+def process_city_data_magnitude_and_create_pie_chart(data, city_name,start_date_input,end_date_input, city_index=None):
+    # Only the city's rows in the date range are read
+    selected = select_date_rows(data, start_date_input, end_date_input, city_name=city_name, city_index=city_index)
+    magnitude_codes = classify_column(data['magnitude'][selected], MAGNITUDE_BINS)
+    city_magnitudes = counts_to_dict(count_codes(magnitude_codes, MAGNITUDE_BINS), MAGNITUDE_BINS)
 
     # If there is valid data for the city
-   
-        data = list( city_magnitudes.values())
-        labels = list( city_magnitudes.keys())
-        title = f"earthquake magnitude Distribution for {city_name} from for {start_date_input} to {end_date_input}"
-        filename = f"earthquake_magnitude_distribution_{city_name}_for_{start_date_input}_to_{end_date_input} .png"
+    if len(selected):
+        title, filename = city_chart_names('magnitude', city_name, start_date_input, end_date_input)
 
         # Create pie chart for the specific city
-        create_pie_chart(data, labels, title, filename,"earthquake_piechats_analysis")
+        create_category_pie_chart(city_magnitudes, title, filename,"earthquake_piecharts_analysis")
     else:
         print(f"No data available for {city_name}.")
 
-def process_date_range_by_magnitude_and_create_pie_chart(json_data,start_date_input,end_date_input):
-    date_range_magnitudes = {'Low_Magnitude': 0, 'Medium_Magnitude': 0, 'High_Magnitude': 0}
-
-    # Loop through the JSON data and filter by city
-    for entry in json_data:
-        
-        event_date = entry.get('date')
-        
-        if start_date_input <= event_date <= end_date_input :
-            magnitude =entry.get('magnitude')
-            magnitude_category = classify_magnitude(magnitude)
-            if magnitude_category == 'Low_Magnitude':
-                date_range_magnitudes['Low_Magnitude'] += 1
-            elif magnitude_category == 'Medium_Magnitude':
-                    date_range_magnitudes['Medium_Magnitude'] += 1
-            elif magnitude_category == 'High_Magnitude':
-                date_range_magnitudes['High_Magnitude'] += 1
+def process_date_range_by_magnitude_and_create_pie_chart(data,start_date_input,end_date_input, date_index=None, date_range_counts=None):
+    # Count the categories in the date range without rescanning the records
+    date_range_magnitudes, record_count = count_date_range_categories(data, 'magnitude', start_date_input, end_date_input, date_index, date_range_counts)
 
-    # If there is valid data for the city
-   
-        data = list( date_range_magnitudes.values())
-        labels = list( date_range_magnitudes.keys())
-        title = f"earthquake distribution for {start_date_input} to {end_date_input}"
-        filename = f"earthquake_distribution_for {start_date_input} to {end_date_input}.png"
+    # If there is valid data for the date range
+    if record_count:
+        title, filename = date_range_chart_names('magnitude', start_date_input, end_date_input)
 
-        # Create pie chart for the specific city
-        create_pie_chart(data, labels, title, filename,"earthquake_piechats")
+        create_category_pie_chart(date_range_magnitudes, title, filename,"earthquake_piecharts")
     else:
         print(f"No data available for for {start_date_input} to {end_date_input}.")
 
-def process_rainfall_data_and_create_pie_chart(json_data):
-    
-    rainfall_categories = {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-    
-    # Iterate over each record and classify the rainfall
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-       
-        rainfall_category = classify_rainfall(rain_sum)
-        if rainfall_category:
-            if rainfall_category == 'Low_rainfall':
-                rainfall_categories['Low_rainfall'] += 1
-            elif rainfall_category == 'Medium_rainfall':
-                    rainfall_categories['Medium_rainfall'] += 1
-            elif rainfall_category == 'High_rainfall':
-                rainfall_categories['High_rainfall'] += 1
-
-    # Prepare data for pie chart
-    data = list(rainfall_categories.values())
-    labels = list(rainfall_categories.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution", "rainfall_distribution.png","rain_piechats")
-
-def process_rainfall_by_night(json_data):
-    rainfall_categories_by_night= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if time_str_category == 'Night':
-            if rainfall_category == 'Low_rainfall':
-                rainfall_categories_by_night['Low_rainfall'] += 1
-            elif rainfall_category == 'Medium_rainfall':
-                    rainfall_categories_by_night['Medium_rainfall'] += 1
-            elif rainfall_category == 'High_rainfall':
-                rainfall_categories_by_night['High_rainfall'] += 1
-
-
-    # Prepare data for pie chart
-    data = list(rainfall_categories_by_night.values())
-    labels = list(rainfall_categories_by_night.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_night", "rainfall_distribution _by_night.png","rain_piechats")
-
-def process_rainfall_by_evening(json_data):
-    rainfall_categories_by_Evening= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if time_str_category == 'Evening':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_by_Evening['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_by_Evening['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_by_Evening['High_rainfall'] += 1
-
-    # Prepare data for pie chart
-    data = list(rainfall_categories_by_Evening.values())
-    labels = list(rainfall_categories_by_Evening.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_night", "rainfall_distribution _by_night.png","rain_piechats")
-
-def process_rainfall_by_Afternoon(json_data):
-    rainfall_categories_by_Afternoon= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if time_str_category == 'Afternoon':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_by_Afternoon['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_by_Afternoon['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_by_Afternoon['High_rainfall'] += 1
-
-
-
-    # Prepare data for pie chart
-    data = list(rainfall_categories_by_Afternoon.values())
-    labels = list(rainfall_categories_by_Afternoon.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_Afternoon", "rainfall_distribution _by_Afternoon.png","rain_piechats")
-
-def process_rainfall_by_Mid_Morning(json_data):
-    rainfall_categories_by_Mid_Morning= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if time_str_category == 'Mid_Morning':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_by_Mid_Morning['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_by_Mid_Morning['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_by_Mid_Morning['High_rainfall'] += 1
-
-
-    # Prepare data for pie chart
-    data = list( rainfall_categories_by_Mid_Morning.values())
-    labels = list( rainfall_categories_by_Mid_Morning.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_ rainfall_categories_by_Mid_Morning", "rainfall_distribution _by_ rainfall_categories_by_Mid_Morning.png","rain_piechats")
-
-def process_rainfall_by_Morning(json_data):
-    rainfall_categories_by_Morning= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        time_str = entry.get('time', "")
-        
-        time_str_category = categorize_time_of_day(time_str)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if time_str_category == 'Morning':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_by_Morning['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_by_Morning['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_by_Morning['High_rainfall'] += 1
-
-
-    # Prepare data for pie chart
-    data = list( rainfall_categories_by_Morning.values())
-    labels = list( rainfall_categories_by_Morning.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_ rainfall_categories_by_Morning", "rainfall_distribution _by_ rainfall_categories_by_Morning.png","rain_piechats")
-
-def process_rainfall_at_Below_Sea_Level(json_data):
-    rainfall_categories_at_Below_Sea_Level= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if elevation_category == 'Below_Sea_Level':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_at_Below_Sea_Level['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_at_Below_Sea_Level['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_at_Below_Sea_Level['High_rainfall'] += 1
-
-
-    # Prepare data for pie chart
-    data = list( rainfall_categories_at_Below_Sea_Level.values())
-    labels = list( rainfall_categories_at_Below_Sea_Level.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_ rainfall_categories_at_Below_Sea_Level", "rainfall_distribution _by_ rainfall_categories_at_Below_Sea_Level.png","rain_piechats")
-
-def process_rainfall_at_Sea_Level(json_data):
-    rainfall_categories_at_Sea_Level= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if elevation_category == 'Sea_Level':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_at_Sea_Level['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_at_Sea_Level['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_at_Sea_Level['High_rainfall'] += 1
-
+def process_rainfall_data_and_create_pie_chart(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall'], "rainfall_distribution", "rainfall_distribution.png","rain_piecharts")
 
-    # Prepare data for pie chart
-    data = list( rainfall_categories_at_Sea_Level.values())
-    labels = list( rainfall_categories_at_Sea_Level.keys())
-
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_ rainfall_categories_at_Sea_Level", "rainfall_distribution _by_ rainfall_categories_at_Sea_Level.png","rain_piechats")
-
-def process_rainfall_at_Ground_Level(json_data):
-    rainfall_categories_at_Ground_Level= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if elevation_category == 'Ground_Level':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_at_Ground_Level['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_at_Ground_Level['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_at_Ground_Level['High_rainfall'] += 1
+def process_rainfall_by_night(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_time_of_day']['Night'], "rainfall_distribution _by_night", "rainfall_distribution _by_night.png","rain_piecharts")
 
+def process_rainfall_by_evening(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_time_of_day']['Evening'], "rainfall_distribution _by_evening", "rainfall_distribution _by_evening.png","rain_piecharts")
 
-    # Prepare data for pie chart
-    data = list( rainfall_categories_at_Ground_Level.values())
-    labels = list( rainfall_categories_at_Ground_Level.keys())
+def process_rainfall_by_Afternoon(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_time_of_day']['Afternoon'], "rainfall_distribution _by_Afternoon", "rainfall_distribution _by_Afternoon.png","rain_piecharts")
 
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_ rainfall_categories_at_Ground_Level", "rainfall_distribution _by_ rainfall_categories_at_Ground_Level.png","rain_piechats")
-
-def process_rainfall_at_Ground_Level_Mid(json_data):
-    rainfall_categories_at_Ground_Level_Mid= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if elevation_category == 'Ground_Level_Mid':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_at_Ground_Level_Mid['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_at_Ground_Level_Mid['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_at_Ground_Level_Mid['High_rainfall'] += 1
+def process_rainfall_by_Mid_Morning(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_time_of_day']['Mid_Morning'], "rainfall_distribution _by_ rainfall_categories_by_Mid_Morning", "rainfall_distribution _by_ rainfall_categories_by_Mid_Morning.png","rain_piecharts")
 
+def process_rainfall_by_Morning(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_time_of_day']['Morning'], "rainfall_distribution _by_ rainfall_categories_by_Morning", "rainfall_distribution _by_ rainfall_categories_by_Morning.png","rain_piecharts")
 
-    # Prepare data for pie chart
-    data = list( rainfall_categories_at_Ground_Level_Mid.values())
-    labels = list( rainfall_categories_at_Ground_Level_Mid.keys())
+def process_rainfall_at_Below_Sea_Level(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_elevation']['Below_Sea_Level'], "rainfall_distribution _by_ rainfall_categories_at_Below_Sea_Level", "rainfall_distribution _by_ rainfall_categories_at_Below_Sea_Level.png","rain_piecharts")
 
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_Mid", "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_Mid.png","rain_piechats")
-
-def process_rainfall_at_Ground_Level_High(json_data):
-    rainfall_categories_at_Ground_Level_High= {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Iterate over each record and classify the time of day
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        elevation = entry["elevation"]
-        
-        elevation_category = classify_elevation(elevation)
-        rainfall_category = classify_rainfall(rain_sum)
-        
-        if elevation_category == 'Ground_Level_High':
-            if  rainfall_category == 'Low_rainfall':
-                rainfall_categories_at_Ground_Level_High['Low_rainfall'] += 1
-            elif  rainfall_category == 'Medium_rainfall':
-                rainfall_categories_at_Ground_Level_High['Medium_rainfall'] += 1
-            elif  rainfall_category == 'High_rainfall':
-                rainfall_categories_at_Ground_Level_High['High_rainfall'] += 1
+def process_rainfall_at_Sea_Level(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_elevation']['Sea_Level'], "rainfall_distribution _by_ rainfall_categories_at_Sea_Level", "rainfall_distribution _by_ rainfall_categories_at_Sea_Level.png","rain_piecharts")
 
+def process_rainfall_at_Ground_Level(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_elevation']['Ground_Level'], "rainfall_distribution _by_ rainfall_categories_at_Ground_Level", "rainfall_distribution _by_ rainfall_categories_at_Ground_Level.png","rain_piecharts")
 
-    # Prepare data for pie chart
-    data = list( rainfall_categories_at_Ground_Level_High.values())
-    labels = list( rainfall_categories_at_Ground_Level_High.keys())
+def process_rainfall_at_Ground_Level_Mid(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_elevation']['Ground_Level_Mid'], "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_Mid", "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_Mid.png","rain_piecharts")
 
-    # Create pie chart
-    create_pie_chart(data, labels, "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_High", "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_High.png","rain_piechats")
+def process_rainfall_at_Ground_Level_High(pie_counts):
+    create_category_pie_chart(pie_counts['rainfall_by_elevation']['Ground_Level_High'], "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_High", "rainfall_distribution _by_ rainfall_categories_at_Ground_Level_High.png","rain_piecharts")
 
-def process_city_data_rain_and_create_pie_chart(json_data, city_name,start_date_input,end_date_input):
-    city_rainfall = {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Loop through the JSON data and filter by city
-    for entry in json_data:
-        city = entry.get('city', "")
-        event_date = entry.get('date')
-        if not city or isinstance(city, list):
-            continue
-
-        if city == city_name and start_date_input <= event_date <= end_date_input :
-            rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-            rainfall_category = classify_rainfall(rain_sum)
-            if rainfall_category == 'Low_rainfall':
-                city_rainfall['Low_rainfall'] += 1
-            elif rainfall_category == 'Medium_rainfall':
-                    city_rainfall['Medium_rainfall'] += 1
-            elif rainfall_category == 'High_rainfall':
-                city_rainfall['High_rainfall'] += 1
+def process_city_data_rain_and_create_pie_chart(data, city_name,start_date_input,end_date_input, city_index=None):
+    # Only the city's rows in the date range are read
+    selected = select_date_rows(data, start_date_input, end_date_input, city_name=city_name, city_index=city_index)
+    rainfall_codes = classify_column(get_column(data, 'rain_sum')[selected], RAINFALL_BINS)
+    city_rainfall = counts_to_dict(count_codes(rainfall_codes, RAINFALL_BINS), RAINFALL_BINS)
 
     # If there is valid data for the city
-   
-        data = list( city_rainfall.values())
-        labels = list( city_rainfall.keys())
-        title = f"Rainfall Distribution for {city_name} from for {start_date_input} to {end_date_input}"
-        filename = f"rainfall_distribution_{city_name}_for_{start_date_input}_to_{end_date_input} .png"
+    if len(selected):
+        title, filename = city_chart_names('rainfall', city_name, start_date_input, end_date_input)
 
         # Create pie chart for the specific city
-        create_pie_chart(data, labels, title, filename,"rain_piechats_analysis")
+        create_category_pie_chart(city_rainfall, title, filename,"rain_piecharts_analysis")
     else:
         print(f"No data available for {city_name}.")
 
-def process_date_range_by_rainfall_and_create_pie_chart(json_data,start_date_input,end_date_input):
-    date_range_rainfall = {'Low_rainfall': 0, 'Medium_rainfall': 0, 'High_rainfall': 0}
-
-    # Loop through the JSON data and filter by city
-    for entry in json_data:
-        
-        event_date = entry.get('date')
-        
-        if start_date_input <= event_date <= end_date_input :
-            rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-            rainfall_category = classify_rainfall(rain_sum)
-            if rainfall_category == 'Low_rainfall':
-                date_range_rainfall['Low_rainfall'] += 1
-            elif rainfall_category == 'Medium_rainfall':
-                    date_range_rainfall['Medium_rainfall'] += 1
-            elif rainfall_category == 'High_rainfall':
-                date_range_rainfall['High_rainfall'] += 1
+def process_date_range_by_rainfall_and_create_pie_chart(data,start_date_input,end_date_input, date_index=None, date_range_counts=None):
+    # Count the categories in the date range without rescanning the records
+    date_range_rainfall, record_count = count_date_range_categories(data, 'rainfall', start_date_input, end_date_input, date_index, date_range_counts)
 
-    # If there is valid data for the city
-   
-        data = list( date_range_rainfall.values())
-        labels = list( date_range_rainfall.keys())
-        title = f"Rainfall Distribution for {start_date_input} to {end_date_input}"
-        filename = f"rainfall_distribution_for {start_date_input} to {end_date_input}.png"
+    # If there is valid data for the date range
+    if record_count:
+        title, filename = date_range_chart_names('rainfall', start_date_input, end_date_input)
 
-        # Create pie chart for the specific city
-        create_pie_chart(data, labels, title, filename,"rain_piechats_analysis")
+        create_category_pie_chart(date_range_rainfall, title, filename,"rain_piecharts_analysis")
     else:
         print(f"No data available for for {start_date_input} to {end_date_input}.")
 
-def process_sunlight_data(json_data):
-    sunlight_categories = {"Low Sunlight": 0, "Medium Sunlight": 0, "Full Sunlight": 0}
-    
-    for entry in json_data:
-        sunshine_hours = get_sunshine_duration(entry["weather"]["sunshine_hours"])
-        sunlight_percentage = (sunshine_hours / 12) * 100
-        
-        if sunlight_percentage <= 30:
-            sunlight_categories["Low Sunlight"] += 1
-        elif 31 <= sunlight_percentage <= 60:
-            sunlight_categories["Medium Sunlight"] += 1
-        else:
-            sunlight_categories["Full Sunlight"] += 1
-    
-    data = list(sunlight_categories.values())
-    labels = list(sunlight_categories.keys())
-    create_pie_chart(data, labels, "Sunlight Distribution", "sunlight_distribution.png", "day_files")
+def process_sunlight_data(pie_counts):
+    create_category_pie_chart(pie_counts['sunlight'], "Sunlight Distribution", "sunlight_distribution.png", "day_files")
 
-def process_daylight_vs_rest(json_data):
-    daylight_vs_rest = {"Daylight Hours": 0, "Rest of Day": 0}
-    
-    for entry in json_data:
-        daylight_percentage = (get_sunshine_duration(entry["weather"]["sunshine_hours"]) / 24) * 100
-        rest_of_day = 100 - daylight_percentage
-        daylight_vs_rest["Daylight Hours"] += daylight_percentage
-        daylight_vs_rest["Rest of Day"] += rest_of_day
-    
-    data = list(daylight_vs_rest.values())
-    labels = list(daylight_vs_rest.keys())
-    create_pie_chart(data, labels, "Daylight vs Rest of Day", "daylight_vs_rest.png", "day_files")
+def process_daylight_vs_rest(pie_counts):
+    create_category_pie_chart(pie_counts['daylight_vs_rest'], "Daylight vs Rest of Day", "daylight_vs_rest.png", "day_files")
 
-def process_precipitation(json_data):
-    precipitation_data = {"Precipitation Hours": 0, "Hours Without Precipitation": 0}
-    
-    for entry in json_data:
-        precipitation_percentage = (entry["weather"]["precipitation_hours"] / 24) * 100
-        no_precipitation = 100 - precipitation_percentage
-        precipitation_data["Precipitation Hours"] += precipitation_percentage
-        precipitation_data["Hours Without Precipitation"] += no_precipitation
-    
-    data = list(precipitation_data.values())
-    labels = list(precipitation_data.keys())
-    create_pie_chart(data, labels, "Precipitation vs Dry Hours", "precipitation_vs_dry.png", "day_files")
-
-def create_precipitation_pie_chart(json_data):
-    precipitation_total= {"Rain":0 ,"snow":0}
-    # Loop through the data and create pie charts
-    for entry in json_data:
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        snowfall_sum = entry.get('weather', {}).get('snowfall_sum', 0)
-        
-        if  rain_sum:
-            precipitation_total["Rain"] += rain_sum
-        elif snowfall_sum:
-            precipitation_total["snow"] += snowfall_sum
-
-    data = list(precipitation_total.values())
-    labels = list(precipitation_total.keys())    
-    create_pie_chart(data, labels, "precipitation", "precipitation_total.png", "day_files")
-       
-def process_sunlight_andprecipitation(json_data):
-    sunlight_precepitation= {"Sun_hours": 0, "precipitation": 0}
-    
-    for entry in json_data:
-        sunshine_hours = get_sunshine_duration(entry["weather"]["sunshine_hours"])
-        precipitation_hours = entry.get('weather', {}).get('precipitation_hours', 0)
-        
-        if sunshine_hours:
-            sunlight_precepitation["Sun_hours"] += sunshine_hours
-        elif precipitation_hours:
-            sunlight_precepitation["precipitation"] += precipitation_hours
+def process_precipitation(pie_counts):
+    create_category_pie_chart(pie_counts['precipitation'], "Precipitation vs Dry Hours", "precipitation_vs_dry.png", "day_files")
+
+def create_precipitation_pie_chart(pie_counts):
+    create_category_pie_chart(pie_counts['precipitation_total'], "precipitation", "precipitation_total.png", "day_files")
        
-    data = list(sunlight_precepitation.values())
-    labels = list(sunlight_precepitation.keys())
-    create_pie_chart(data, labels, "Sunlight vs precipitation hours", "sunlight_precepitation.png", "day_files")
-     
+def process_sunlight_andprecipitation(pie_counts):
+    create_category_pie_chart(pie_counts['sunlight_and_precipitation'], "Sunlight vs precipitation hours", "sunlight_precepitation.png", "day_files")
+
+# Function to create every magnitude pie chart that needs no date range or city
+def create_magnitude_pie_charts(pie_counts):
+    process_earthquake_magnitude_data_and_create_pie_chart(pie_counts)
+    process_earthquake_magnitude_by_night(pie_counts)
+    process_earthquake_magnitude_by_evening(pie_counts)
+    process_earthquake_magnitude_by_afternoon(pie_counts)
+    process_earthquake_magnitude_by_mid_morning(pie_counts)
+    process_earthquake_magnitude_by_Morning(pie_counts)
+    process_earthquake_magnitude_by_elevation_Below_Sea_Level(pie_counts)
+    process_earthquake_magnitude_by_elevation_Sea_Level(pie_counts)
+    process_earthquake_magnitude_by_elevation_Ground_Level(pie_counts)
+    process_earthquake_magnitude_by_elevation_Ground_Level_Mid(pie_counts)
+    process_earthquake_magnitude_by_elevation_Ground_Level_High(pie_counts)
+
+# Function to create every rainfall pie chart that needs no date range or city
+def create_rainfall_pie_charts(pie_counts):
+    process_rainfall_data_and_create_pie_chart(pie_counts)
+    process_rainfall_by_night(pie_counts)
+    process_rainfall_by_evening(pie_counts)
+    process_rainfall_by_Afternoon(pie_counts)
+    process_rainfall_by_Mid_Morning(pie_counts)
+    process_rainfall_by_Morning(pie_counts)
+    process_rainfall_at_Below_Sea_Level(pie_counts)
+    process_rainfall_at_Sea_Level(pie_counts)
+    process_rainfall_at_Ground_Level(pie_counts)
+    process_rainfall_at_Ground_Level_Mid(pie_counts)
+    process_rainfall_at_Ground_Level_High(pie_counts)
+
+# Function to create the sunlight and precipitation pie charts
+def create_daylight_pie_charts(pie_counts):
+    process_sunlight_data(pie_counts)
+    process_daylight_vs_rest(pie_counts)
+    process_precipitation(pie_counts)
+    create_precipitation_pie_chart(pie_counts)
+    process_sunlight_andprecipitation(pie_counts)
+
+# Output folders of the charts drawn by draw_report
+REPORT_FOLDER_KEYS = ["earthquake_piecharts", "rain_piecharts", "day_files"]
+
+# Function to draw every pie chart that needs no prompt (used by the stats_today runner). The charts are
+# staged and added to their folders at the end; the interactive date-range and city charts are left as they are.
+def draw_report(pie_counts, workers=None):
+    global output_run
+    run = output_run = start_output_run({key: OUTPUT_FOLDERS[key] for key in REPORT_FOLDER_KEYS}, replace=False)
+    try:
+        create_magnitude_pie_charts(pie_counts)
+        create_rainfall_pie_charts(pie_counts)
+        create_daylight_pie_charts(pie_counts)
+    except BaseException:
+        discard_output_run(run)
+        raise
+    finally:
+        output_run = None
+
+    finish_output_run(run)
+    print(f"Pie charts saved in {', '.join(OUTPUT_FOLDERS[key] for key in REPORT_FOLDER_KEYS)}")
+
+# Output folder keys of the batch city charts
+CITY_CHART_FOLDERS = {
+    'magnitude': "earthquake_piecharts_analysis",
+    'rainfall': "rain_piecharts_analysis",
+}
+
+# Output folder keys of the query file's date-range charts (the city charts use CITY_CHART_FOLDERS)
+DATE_RANGE_CHART_FOLDERS = {
+    'magnitude': "earthquake_piecharts",
+    'rainfall': "rain_piecharts_analysis",
+}
+
+check_folder_keys(OUTPUT_FOLDERS, list(CITY_CHART_FOLDERS.values()) + list(DATE_RANGE_CHART_FOLDERS.values()))
+
+# Function to count the magnitude and rainfall categories of every city in the date range in one
+# grouped pass keyed by city code. Returns the city names and one (city x category) table per kind,
+# whose last column holds the rows left unclassified.
+def count_city_categories(data, start_date_input, end_date_input, date_index=None):
+    selected = select_date_rows(data, start_date_input, end_date_input, date_index)
+    cities, city_codes = encode_cities(data['city'][selected])
+
+    city_tables = {}
+    for kind in ['magnitude', 'rainfall']:
+        column, bins = CATEGORY_AXES[kind]
+        slot_count = len(bins['labels']) + 1
+        codes = classify_column(get_column(data, column)[selected], bins)
+        codes = np.where(codes >= 0, codes, slot_count - 1)
+        table = np.bincount(city_codes * slot_count + codes, minlength=len(cities) * slot_count)
+        city_tables[kind] = table.reshape(len(cities), slot_count)
+    return cities.tolist(), city_tables
+
+# Function to produce the magnitude and rainfall pie charts of every city (or only city_names) for one
+# date range, counting with one grouped pass and drawing the charts in parallel worker processes
+def process_city_pie_charts_batch(data, start_date_input, end_date_input, city_names=None, workers=None, date_index=None):
+    cities, city_tables = count_city_categories(data, start_date_input, end_date_input, date_index)
+    city_rows = {city: row for row, city in enumerate(cities) if city}  # '' holds the records without a city
+
+    jobs = []
+    for city_name in (city_names or list(city_rows)):
+        row = city_rows.get(city_name)
+        if row is None:
+            print(f"No data available for {city_name}.")
+            continue
+
+        for kind, table in city_tables.items():
+            bins = CATEGORY_AXES[kind][1]
+            counts = table[row, :-1].tolist()
+            title, filename = city_chart_names(kind, city_name, start_date_input, end_date_input)
+            if not any(counts):
+                print(f"Skipping pie chart generation for {title} because there is no valid data to plot.")
+                continue
+            jobs.append((counts, bins['labels'], title, CITY_CHART_FOLDERS[kind], filename))
+
+    draw_pie_chart_jobs(jobs, workers)
+
+# Function to draw a list of chart jobs (data, labels, title, folder_key, filename) over the render
+# processes. The charts are staged and only moved into their folders, next to the charts already
+# there, once every one of them is drawn. Returns the final chart paths.
+def draw_pie_chart_jobs(jobs, workers=None):
+    folder_keys = sorted({job[3] for job in jobs})
+    check_folder_keys(OUTPUT_FOLDERS, folder_keys)
+    run = start_output_run({key: OUTPUT_FOLDERS[key] for key in folder_keys}, replace=False)
+    try:
+        render_charts(draw_pie_chart, [
+            (data, labels, title, output_path(run, folder_key, filename))
+            for data, labels, title, folder_key, filename in jobs
+        ], workers)
+    except BaseException:
+        discard_output_run(run)
+        raise
+
+    finish_output_run(run)
+    return [os.path.join(OUTPUT_FOLDERS[job[3]], job[4]) for job in jobs]
+
+# Function to draw the pie chart of every evaluated query (see queries.evaluate_queries)
+def create_query_pie_charts(results, workers=None):
+    jobs = []
+    for result in results:
+        kind, city_name = result['kind'], result['city']
+        if city_name is None:
+            title, filename = date_range_chart_names(kind, result['start'], result['end'])
+            folder_key = DATE_RANGE_CHART_FOLDERS[kind]
+        else:
+            title, filename = city_chart_names(kind, city_name, result['start'], result['end'])
+            folder_key = CITY_CHART_FOLDERS[kind]
+
+        counts = list(result['counts'].values())
+        if not result['records']:
+            print(f"No data available for {result['name']} ({title}).")
+        elif not any(counts):
+            print(f"Skipping pie chart generation for {title} because there is no valid data to plot.")
+        else:
+            jobs.append((counts, list(result['counts']), title, folder_key, filename))
+
+    draw_pie_chart_jobs(jobs, workers)
+
+# Function to read the command line options; without --batch-cities, --queries or --data-only the interactive prompts run
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create the earthquake, rainfall and daylight pie charts.")
+    parser.add_argument('--batch-cities', nargs=2, metavar=('START_DATE', 'END_DATE'),
+                        help="Create the per-city magnitude and rainfall pie charts for this date range and exit")
+    parser.add_argument('--cities', nargs='+', metavar='CITY',
+                        help="Only create the batch charts for these cities (default: every city)")
+    parser.add_argument('--queries', metavar='FILE',
+                        help="Evaluate the (kind, date range, city) queries of a .json or .toml file instead of prompting")
+    parser.add_argument('--results', metavar='FILE',
+                        help="Also write the per-query counts of --queries to this JSON file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of processes drawing the batch or query charts (default: $STATS_TODAY_WORKERS, else one per CPU)")
+    return add_data_only_args(parser).parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+
     # Replace this with the path to your actual JSON file
     file_path = "merged_data.json"
     
     # Load the data
-    json_data = load_json_data(file_path)
+    data = load_dataset(file_path)
+
+    # Data-only mode: write the counts behind every pie chart without drawing anything
+    if args.data_only:
+        write_aggregates(build_pie_chart_counts(data, load_cube(file_path)), args.data_only, args.output)
+        sys.exit(0)
+
+    # Batch mode: every city's charts for one date range, without any prompts
+    if args.batch_cities:
+        start_date_input, end_date_input = args.batch_cities
+        process_city_pie_charts_batch(data, start_date_input, end_date_input, args.cities, args.workers)
+        sys.exit(0)
+
+    # Query mode: evaluate every query of the file together, then draw one chart per query
+    if args.queries:
+        results = evaluate_queries(data, load_queries(args.queries))
+        create_query_pie_charts(results, args.workers)
+        if args.results:
+            with open(args.results, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"Query results saved to '{args.results}'")
+        sys.exit(0)
+
+    # Load the count cube (built and saved on the first run)
+    cube = load_cube(file_path)
+
+    # Build the counts behind every pie chart from the cube and the columns
+    pie_counts = build_pie_chart_counts(data, cube)
+
+    # Sort the records by date (and by city, then date) once, and keep per-day running category
+    # counts so every date-range and city query below only touches its own slice
+    date_index = build_date_index(data)
+    date_range_counts = build_date_range_counts(data)
+    city_index = build_city_date_index(data)
+
+    # Stage every chart of this run and swap the finished folders in at the end, so each folder
+    # only holds this run's charts and never a half-written set
+    output_run = start_output_run(OUTPUT_FOLDERS)
 
     # Create the first pie chart for magntude  distribution
-    process_earthquake_magnitude_data_and_create_pie_chart(json_data)
-    process_earthquake_magnitude_by_night(json_data)
-    process_earthquake_magnitude_by_evening(json_data)
-    process_earthquake_magnitude_by_afternoon(json_data)
-    process_earthquake_magnitude_by_mid_morning(json_data)
-    process_earthquake_magnitude_by_Morning(json_data)
-    process_earthquake_magnitude_by_elevation_Below_Sea_Level(json_data)
-    process_earthquake_magnitude_by_elevation_Sea_Level(json_data)
-    process_earthquake_magnitude_by_elevation_Ground_Level(json_data)
-    process_earthquake_magnitude_by_elevation_Ground_Level_Mid(json_data)
-    process_earthquake_magnitude_by_elevation_Ground_Level_High(json_data)
+    create_magnitude_pie_charts(pie_counts)
 
     
     start_date_input = input("Enter the start date (YYYY-MM-DD): ")
     end_date_input = input("Enter the end date (YYYY-MM-DD): ")
     if start_date_input and end_date_input:
-        process_date_range_by_magnitude_and_create_pie_chart(json_data,start_date_input,end_date_input)
+        process_date_range_by_magnitude_and_create_pie_chart(data,start_date_input,end_date_input, date_index, date_range_counts)
 
 
     start_date_input = input("Enter the start date (YYYY-MM-DD): ")
@@ -1057,25 +541,15 @@ if __name__ == "__main__":
           city_name = input("Enter the city name: ")
     if city_name:
     # Process the data for the specified city and create the pie chart
-        process_city_data_magnitude_and_create_pie_chart(json_data, city_name,start_date_input,end_date_input)
+        process_city_data_magnitude_and_create_pie_chart(data, city_name,start_date_input,end_date_input, city_index)
        
 
-    process_rainfall_data_and_create_pie_chart(json_data)
-    process_rainfall_by_night(json_data)
-    process_rainfall_by_evening(json_data)
-    process_rainfall_by_Afternoon(json_data)
-    process_rainfall_by_Mid_Morning(json_data)
-    process_rainfall_by_Morning(json_data)
-    process_rainfall_at_Below_Sea_Level(json_data)
-    process_rainfall_at_Sea_Level(json_data)
-    process_rainfall_at_Ground_Level(json_data)
-    process_rainfall_at_Ground_Level_Mid(json_data)
-    process_rainfall_at_Ground_Level_High(json_data)
+    create_rainfall_pie_charts(pie_counts)
 
     start_date_input = input("Enter the start date (YYYY-MM-DD): ")
     end_date_input = input("Enter the end date (YYYY-MM-DD): ")
     if start_date_input and end_date_input:
-        process_date_range_by_rainfall_and_create_pie_chart(json_data,start_date_input,end_date_input)
+        process_date_range_by_rainfall_and_create_pie_chart(data,start_date_input,end_date_input, date_index, date_range_counts)
 
 
     start_date_input = input("Enter the start date (YYYY-MM-DD): ")
@@ -1084,18 +558,11 @@ if __name__ == "__main__":
           city_name = input("Enter the city name: ")
     if city_name:
     # Process the data for the specified city and create the pie chart
-        process_city_data_rain_and_create_pie_chart(json_data, city_name,start_date_input,end_date_input)
+        process_city_data_rain_and_create_pie_chart(data, city_name,start_date_input,end_date_input, city_index)
        
 
-    process_sunlight_data(json_data)
-
-    process_daylight_vs_rest(json_data)
-
-    process_precipitation(json_data)
-
-    create_precipitation_pie_chart(json_data)
-
-    process_sunlight_andprecipitation(json_data)
-
-
+    create_daylight_pie_charts(pie_counts)
 
+    # Swap the finished chart folders in
+    finish_output_run(output_run)
+    print(f"Pie charts saved in {', '.join(OUTPUT_FOLDERS.values())}")
@@ -1,86 +1,86 @@
-import json
 import os
-import matplotlib.pyplot as plt
+from render import plt, render_cached_charts, chart_template, set_bar_heights, rescale_axes
 import calendar
-from collections import defaultdict
-from datetime import datetime
-import shutil
+from dataset import load_dataset
+from export import write_data_only
+from specs import REPORT_SPECS, evaluate_specs
 
-# Function to load data from a JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-# Function to create the folder if it doesn't exist (or delete and recreate it if it does)
+# Function to create the folder if it doesn't exist (kept between runs)
 def create_folder(folder_name):
-    if os.path.exists(folder_name):
-        shutil.rmtree(folder_name)  # Delete the existing folder and its contents
-    os.makedirs(folder_name)  # Create a new folder
-
-# Load data and create folder
-data = load_json_data('bar_line\\merged_data.json')  # Replace with your actual file path
-create_folder('graphs_elevation_wind_speed')  # Folder to store this specific plot
+    # Keep the folder between runs: the chart cache reuses unchanged graphs and removes stale ones
+    os.makedirs(folder_name, exist_ok=True)
+    return folder_name
 
 # Process data to get elevation and wind speed
 def calculate_elevation_wind_speed(data):
-    monthly_data = defaultdict(lambda: defaultdict(list))
-
-    for entry in data:
-        date = entry.get('date', '')
-        elevation = entry.get('elevation', 0)
-        wind_speed = entry.get('weather', {}).get('wind_speed_max', 0)
-
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            month = year_month.month
-            monthly_data[year][month].append({
-                'elevation': elevation,
-                'wind_speed': wind_speed,
-            })
-        except ValueError:
-            continue  # Skip invalid date entries
-
-    year_month_averages = defaultdict(lambda: defaultdict(dict))
-    for year, months in monthly_data.items():
-        for month, values in months.items():
-            avg_elevation = sum(entry['elevation'] for entry in values) / len(values)
-            avg_wind_speed = sum(entry['wind_speed'] for entry in values) / len(values)
-            year_month_averages[year][month] = {
-                'avg_elevation': avg_elevation,
-                'avg_wind_speed': avg_wind_speed,
-            }
-
-    return year_month_averages
-
-# Plot the graph
-def plot_elevation_wind_speed(year_month_averages):
-    for year, months in year_month_averages.items():
-        months_list = [calendar.month_abbr[i] for i in range(1, 13)]
-        avg_elevation_list = [months.get(i, {}).get('avg_elevation', 0) for i in range(1, 13)]
-        avg_wind_speed_list = [months.get(i, {}).get('avg_wind_speed', 0) for i in range(1, 13)]
-
-        fig, ax1 = plt.subplots(figsize=(10, 6))
-
-        ax2 = ax1.twinx()
-        # Plot line for elevation first to make sure it's on top
-        ax2.plot(months_list, avg_elevation_list, label='Elevation', color='purple', marker='o', linestyle='-', linewidth=2)
-        ax2.set_ylabel('Elevation (m)', color='purple')
-        ax2.tick_params(axis='y', labelcolor='purple')
-
-        # Plot the bars for wind speed
-        ax1.bar(months_list, avg_wind_speed_list, label='Wind Speed (km/h)', color='red', alpha=0.6)
-        ax1.set_xlabel('Month')
-        ax1.set_ylabel('Wind Speed (km/h)', color='red')
-        ax1.tick_params(axis='y', labelcolor='red')
-
-        plt.title(f'Elevation & Wind Speed in {year}')
-        ax1.legend(loc='upper left')
-        ax2.legend(loc='upper right')
-
-        plt.savefig(f'graphs_elevation_wind_speed/elevation_wind_speed_{year}.png')
-        plt.close()
-
-# Calculate and plot
-year_month_averages = calculate_elevation_wind_speed(data)
-plot_elevation_wind_speed(year_month_averages)
+    # The bar and line fields are declared in specs.REPORT_SPECS; see specs.evaluate_specs
+    return evaluate_specs(data, ['elevationwind'])['elevationwind']
+
+# Function to build the elevation and wind speed figure once; every year reuses it with new bar heights and line data
+def build_elevation_wind_speed_template():
+    months_list = [calendar.month_abbr[i] for i in range(1, 13)]
+
+    # Create the figure shared by every year
+    fig, ax1 = plt.subplots(figsize=(10, 6))
+
+    ax2 = ax1.twinx()
+    # Plot line for elevation first to make sure it's on top
+    line, = ax2.plot(months_list, [0] * 12, label='Elevation', color='purple', marker='o', linestyle='-', linewidth=2)
+    ax2.set_ylabel('Elevation (m)', color='purple')
+    ax2.tick_params(axis='y', labelcolor='purple')
+
+    # Plot the bars for wind speed
+    bars = ax1.bar(months_list, [0] * 12, label='Wind Speed (km/h)', color='red', alpha=0.6)
+    ax1.set_xlabel('Month')
+    ax1.set_ylabel('Wind Speed (km/h)', color='red')
+    ax1.tick_params(axis='y', labelcolor='red')
+
+    ax1.legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    return {'figure': fig, 'bar_axes': ax1, 'line_axes': ax2, 'bars': bars, 'line': line}
+
+# Function to plot and save the graph of one year as an image_format ('png' or 'svg') file and return its path
+def plot_elevation_wind_speed_year(year, months, folder_path, image_format='png'):
+    avg_elevation_list = [months.get(i, {}).get('avg_elevation', 0) for i in range(1, 13)]
+    avg_wind_speed_list = [months.get(i, {}).get('avg_wind_speed', 0) for i in range(1, 13)]
+
+    # Reuse the figure: only the bar heights, line data, y-limits and title change from year to year
+    template = chart_template('elevationwind', build_elevation_wind_speed_template)
+    set_bar_heights(template['bars'], avg_wind_speed_list)
+    template['line'].set_ydata(avg_elevation_list)
+    rescale_axes(template['bar_axes'], template['line_axes'])
+    template['line_axes'].set_title(f'Elevation & Wind Speed in {year}')  # The title sits on the twin axes, as plt.title did
+
+    graph_filename = f"{folder_path}/elevation_wind_speed_{year}.{image_format}"
+    template['figure'].savefig(graph_filename)
+    return graph_filename
+
+# Plot the graph of each year
+def plot_elevation_wind_speed(year_month_averages, folder_path, workers=None):
+    # Fan the years out over the render processes; each job only carries that year's monthly values
+    jobs = [(year, months, folder_path) for year, months in year_month_averages.items()]
+    return render_cached_charts(plot_elevation_wind_speed_year, jobs, folder_path, workers)
+
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(year_month_averages, workers=None):
+    # Create the folder and plot
+    folder_path = create_folder(REPORT_SPECS['elevationwind']['folder'])  # Folder to store this specific plot
+    plot_elevation_wind_speed(year_month_averages, folder_path, workers)
+
+# Main function
+def main():
+    # Load data (replace with your actual file path)
+    data = load_dataset('bar_line\\merged_data.json')
+
+    # Calculate the monthly elevation and wind speed per year
+    year_month_averages = calculate_elevation_wind_speed(data)
+
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(year_month_averages):
+        return
+
+    # Draw the charts
+    draw_report(year_month_averages)
+
+if __name__ == "__main__":
+    main()
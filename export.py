@@ -0,0 +1,67 @@
+import sys
+import csv
+import json
+import math
+import argparse
+import numpy as np
+
+# Formats --data-only can write
+DATA_FORMATS = ['json', 'csv']
+
+# Function to turn an aggregate (nested dicts keyed by year, month, city, ...) into plain JSON values:
+# keys become strings, NumPy values become Python ones and NaN becomes None
+def to_plain(value):
+    if isinstance(value, dict):
+        return {str(key): to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [to_plain(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+# Function to flatten a plain aggregate into rows: the keys leading to each value, then the value
+def to_rows(value, keys=()):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from to_rows(item, keys + (key,))
+    else:
+        yield list(keys) + [json.dumps(value) if isinstance(value, list) else value]
+
+# Function to write an aggregate as JSON or as CSV rows (key1, key2, ..., value) to a file, or '-' for stdout
+def write_aggregates(aggregates, data_format='json', output='-'):
+    plain = to_plain(aggregates)
+    f = sys.stdout if output == '-' else open(output, 'w', newline='')
+    try:
+        if data_format == 'json':
+            json.dump(plain, f, indent=2)
+            f.write('\n')
+        else:
+            rows = list(to_rows(plain))
+            key_count = max((len(row) - 1 for row in rows), default=0)
+            writer = csv.writer(f)
+            writer.writerow([f'key{number}' for number in range(1, key_count + 1)] + ['value'])
+            for row in rows:
+                writer.writerow(row[:-1] + [''] * (key_count - len(row) + 1) + row[-1:])
+    finally:
+        if f is not sys.stdout:
+            f.close()
+
+# Function to add the --data-only options to a script's argument parser
+def add_data_only_args(parser):
+    parser.add_argument('--data-only', nargs='?', const='json', choices=DATA_FORMATS,
+                        help="Write the computed aggregates (json by default, or csv) instead of drawing charts")
+    parser.add_argument('--output', default='-', metavar='FILE',
+                        help="File the --data-only aggregates are written to (default: stdout)")
+    return parser
+
+# Function for the chart scripts' main(): with --data-only on the command line, write the aggregates
+# and return True so the script stops before any folder or chart is touched; otherwise return False
+def write_data_only(aggregates, argv=None):
+    args, _ = add_data_only_args(argparse.ArgumentParser(add_help=False)).parse_known_args(argv)
+    if args.data_only is None:
+        return False
+
+    write_aggregates(aggregates, args.data_only, args.output)
+    return True
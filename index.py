@@ -0,0 +1,100 @@
+import numpy as np
+
+from dataset import decode_dates
+from cube import encode_cities
+
+# Function to build the date index of a dataset: the rows with a valid date sorted by day number.
+# File order is kept among rows of the same day.
+def build_date_index(columns):
+    rows = np.flatnonzero(columns['valid'])
+    order = rows[np.argsort(columns['day_number'][rows], kind='stable')]
+    return {'order': order, 'days': columns['day_number'][order]}
+
+# Function to turn one 'YYYY-MM-DD' string into a day number, or None if it is not a valid date
+def parse_day(date_str):
+    decoded = decode_dates(np.array([date_str]))
+    return decoded['day_number'][0].item() if decoded['valid'][0] else None
+
+# Function to get the rows whose day number lies in [start_day, end_day], in date order.
+# Bisects the sorted day numbers, so the cost is O(log n) plus the size of the slice.
+def day_range_rows(date_index, start_day, end_day):
+    start = np.searchsorted(date_index['days'], start_day, side='left')
+    end = np.searchsorted(date_index['days'], end_day, side='right')
+    return date_index['order'][start:end]
+
+# Function to build per-day cumulative counts of a code column: row d of 'cumulative' holds how
+# many valid-date rows of each code fall before first_day + d. Negative codes (unclassified rows)
+# are counted in an extra last slot so range totals still cover every record.
+def build_day_prefix_counts(columns, codes, code_count):
+    valid = columns['valid']
+    days = columns['day_number'][valid].astype(np.int64)
+    slots = np.where(codes[valid] >= 0, codes[valid], code_count)
+    first_day = days.min().item() if len(days) else 0
+    day_count = (days.max().item() - first_day + 1) if len(days) else 0
+
+    per_day = np.bincount((days - first_day) * (code_count + 1) + slots, minlength=day_count * (code_count + 1))
+    cumulative = np.zeros((day_count + 1, code_count + 1), dtype=np.int64)
+    np.cumsum(per_day.reshape(day_count, code_count + 1), axis=0, out=cumulative[1:])
+    return {'first_day': first_day, 'cumulative': cumulative}
+
+# Function to get the per-code counts of the rows dated in [start_day, end_day] with two lookups.
+# Takes single day numbers or arrays of them (one range per element); ranges outside the data are empty.
+def prefix_range_counts(prefix_counts, start_day, end_day):
+    cumulative = prefix_counts['cumulative']
+    day_count = len(cumulative) - 1
+    start = np.clip(np.asarray(start_day) - prefix_counts['first_day'], 0, day_count)
+    end = np.clip(np.asarray(end_day) - prefix_counts['first_day'] + 1, start, day_count)
+    return cumulative[end] - cumulative[start]
+
+# Function to build the city x date index: valid-date rows with a city, grouped by city code and
+# sorted by day number inside each city. offsets[code]:offsets[code + 1] is one city's slice.
+def build_city_date_index(columns):
+    cities, city_codes = encode_cities(columns['city'])
+    rows = np.flatnonzero(columns['valid'] & (columns['city'] != ''))
+    order = rows[np.lexsort((columns['day_number'][rows], city_codes[rows]))]
+
+    offsets = np.zeros(len(cities) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(city_codes[rows], minlength=len(cities)), out=offsets[1:])
+    return {
+        'cities': {city: code for code, city in enumerate(cities.tolist())},
+        'offsets': offsets,
+        'order': order,
+        'days': columns['day_number'][order],
+    }
+
+# Function to get the rows of one city dated in [start_day, end_day], touching only that city's slice
+def city_day_range_rows(city_index, city_name, start_day, end_day):
+    code = city_index['cities'].get(city_name)
+    if code is None:
+        return city_index['order'][:0]
+
+    first, last = city_index['offsets'][code], city_index['offsets'][code + 1]
+    days = city_index['days'][first:last]
+    start = first + np.searchsorted(days, start_day, side='left')
+    end = first + np.searchsorted(days, end_day, side='right')
+    return city_index['order'][start:end]
+
+# Function to select the records of a city (optional) whose date falls in [start_date_input, end_date_input]
+def select_date_range(data, start_date_input, end_date_input, city_name=None):
+    selected = (data['date'] >= start_date_input) & (data['date'] <= end_date_input)
+    if city_name is not None:
+        selected &= data['city'] == city_name
+    return selected
+
+# Function to get the rows of a city (optional) whose date falls in [start_date_input, end_date_input]
+# by bisecting the date index, or only that city's slice of the city x date index. Inputs that are not
+# valid dates fall back to the string comparison over every record.
+def select_date_rows(data, start_date_input, end_date_input, date_index=None, city_name=None, city_index=None):
+    start_day = parse_day(start_date_input)
+    end_day = parse_day(end_date_input)
+    if start_day is None or end_day is None:
+        return np.flatnonzero(select_date_range(data, start_date_input, end_date_input, city_name))
+
+    if city_name is not None:
+        if city_index is None:
+            city_index = build_city_date_index(data)
+        return city_day_range_rows(city_index, city_name, start_day, end_day)
+
+    if date_index is None:
+        date_index = build_date_index(data)
+    return day_range_rows(date_index, start_day, end_day)
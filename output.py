@@ -0,0 +1,51 @@
+import os
+import shutil
+
+# Function to check that every folder key names one of the output folders, before anything is written
+def check_folder_keys(folders, keys):
+    unknown = sorted(set(keys) - set(folders))
+    if unknown:
+        raise ValueError(f"Unknown output folder keys {unknown}, expected some of {sorted(folders)}")
+
+# Function to start an output run over the given folders (key -> folder path). Every folder gets a
+# fresh staging folder next to it, and charts are written there until finish_output_run swaps them in.
+# replace=True makes each folder hold only this run's files; replace=False adds them to what is there.
+def start_output_run(folders, replace=True):
+    staging = {}
+    for key, folder in folders.items():
+        staging[key] = f'{folder}.tmp-{os.getpid()}'
+        if os.path.exists(staging[key]):
+            shutil.rmtree(staging[key])
+        os.makedirs(staging[key])
+    return {'folders': dict(folders), 'staging': staging, 'replace': replace}
+
+# Function to get the path a chart of the run should be written to (inside the staging folder of folder_key)
+def output_path(run, folder_key, filename):
+    check_folder_keys(run['folders'], [folder_key])
+    return os.path.join(run['staging'][folder_key], filename)
+
+# Function to move the finished staging folders into place, so a folder never holds a half-written run.
+# Returns the number of files moved in.
+def finish_output_run(run):
+    moved = 0
+    for key, folder in run['folders'].items():
+        staging = run['staging'][key]
+        if run['replace']:
+            moved += len(os.listdir(staging))
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
+            os.rename(staging, folder)
+            continue
+
+        # Adding to the folder: each file is swapped in on its own, replacing an older file of the same name
+        os.makedirs(folder, exist_ok=True)
+        for filename in os.listdir(staging):
+            os.replace(os.path.join(staging, filename), os.path.join(folder, filename))
+            moved += 1
+        os.rmdir(staging)
+    return moved
+
+# Function to drop the staging folders of a run that did not finish, leaving the output folders untouched
+def discard_output_run(run):
+    for staging in run['staging'].values():
+        shutil.rmtree(staging, ignore_errors=True)
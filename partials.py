@@ -0,0 +1,243 @@
+import os
+import json
+import numpy as np
+
+from dataset import read_dataset, file_fingerprint, cache_fingerprint, appended_line_range, parse_line_range, get_column, as_column_chunks, records_to_columns
+from cube import encode_cities
+
+# Bump when the layout of the partial states changes so persisted ones are rebuilt
+PARTIALS_VERSION = 1
+
+# Fields kept as partial states, as stored in the data file (sunshine_hours stays in seconds)
+PARTIAL_FIELDS = [
+    'magnitude', 'elevation', 'rain_sum', 'snowfall_sum', 'wind_speed_max', 'sunshine_hours',
+    'precipitation_hours', 'temperature_max', 'temperature_min', 'temperature_mean',
+]
+
+# Mergeable statistics kept per field, and how two partitions' values combine ('first' keeps the
+# value of the earlier row)
+PARTIAL_STATS = {
+    'sum': np.add,
+    'sumsq': np.add,
+    'min': np.minimum,
+    'max': np.maximum,
+    'first': None,
+}
+
+# Aggregations partials_by_year_month can read from the partial states
+PARTIAL_AGGREGATIONS = ['sum', 'mean', 'max', 'min', 'first', 'count', 'std']
+
+# Function to combine partial states entry by entry. Entries with the same (year_month, city) become one
+# partition: counts, sums and sums of squares add up, min and max keep the smallest and largest value
+# and first keeps the value of the earliest row. Returns the partitions sorted by year_month, then city.
+def combine_entries(year_month, city, count, first_row, values):
+    city_count = int(city.max()) + 1 if len(city) else 1
+    keys = year_month * city_count + city
+    order = np.lexsort((first_row, keys))
+    partition_keys, starts = np.unique(keys[order], return_index=True)
+
+    combined = {
+        'year_month': partition_keys // city_count,
+        'city': partition_keys % city_count,
+        'count': np.add.reduceat(count[order], starts) if len(order) else count[:0],
+        'first_row': first_row[order][starts],
+        'values': {},
+    }
+    for name, column in values.items():
+        ufunc = PARTIAL_STATS[name.rsplit('_', 1)[1]]
+        column = column[order]
+        if ufunc is None or not len(order):
+            combined['values'][name] = column[starts]
+        else:
+            combined['values'][name] = ufunc.reduceat(column, starts)
+    return combined
+
+# Function to build the partial states of a loaded dataset: per (year, month, city) partition the row
+# count and the sum, sum of squares, min, max and first value of every field in PARTIAL_FIELDS.
+# row_offset numbers the rows after those already folded into another state (to keep 'first' in file order).
+def build_partials(columns, row_offset=0):
+    rows = np.flatnonzero(np.asarray(columns['valid']))
+    cities, city_codes = encode_cities(np.asarray(columns['city']))
+
+    # Sort the rows into partitions once; the stable sort keeps file order inside each partition
+    keys = np.asarray(columns['year_month'])[rows].astype(np.int64) * max(len(cities), 1) + city_codes[rows]
+    order = np.argsort(keys, kind='stable')
+    rows = rows[order]
+    partition_keys, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    del keys, order
+
+    state = {
+        'year_month': partition_keys // max(len(cities), 1),
+        'city': partition_keys % max(len(cities), 1),
+        'count': counts.astype(np.int64),
+        'first_row': rows[starts].astype(np.int64) + row_offset,
+        'values': {},
+    }
+
+    # Reduce one field at a time from a single sorted copy, squared in place for the sums of squares last
+    values = state['values']
+    for field in PARTIAL_FIELDS:
+        field_values = np.asarray(get_column(columns, field), dtype=np.float64)[rows]
+        if not len(rows):
+            for stat in PARTIAL_STATS:
+                values[f'{field}_{stat}'] = field_values
+            continue
+        values[f'{field}_sum'] = np.add.reduceat(field_values, starts)
+        values[f'{field}_min'] = np.minimum.reduceat(field_values, starts)
+        values[f'{field}_max'] = np.maximum.reduceat(field_values, starts)
+        values[f'{field}_first'] = field_values[starts]
+        np.multiply(field_values, field_values, out=field_values)
+        values[f'{field}_sumsq'] = np.add.reduceat(field_values, starts)
+
+    state['cities'] = cities
+    state['rows'] = row_offset + len(columns['date'])
+    return state
+
+# Function to merge two partial states, the later one holding the rows read after the earlier one's
+def merge_partials(earlier, later):
+    # Number the later state's new cities after the earlier ones, looking each name up once
+    codes = {city: code for code, city in enumerate(earlier['cities'].tolist())}
+    later_cities = np.array([codes.setdefault(city, len(codes)) for city in later['cities'].tolist()], dtype=np.int64)
+
+    state = combine_entries(
+        np.concatenate([earlier['year_month'], later['year_month']]),
+        np.concatenate([earlier['city'], later_cities[later['city']]]),
+        np.concatenate([earlier['count'], later['count']]),
+        np.concatenate([earlier['first_row'], later['first_row']]),
+        {name: np.concatenate([column, later['values'][name]]) for name, column in earlier['values'].items()},
+    )
+    state['cities'] = np.array(list(codes), dtype=str)
+    state['rows'] = later['rows']
+    return state
+
+# Function to get the partial states of the data a report calculates from: partial states already
+# built (the runner and the service pass those from load_partials) are used as they are, loaded columns
+# are reduced to them, and a stream of column chunks is folded in chunk by chunk in constant memory
+def as_partials(data):
+    if isinstance(data, dict) and 'first_row' in data:
+        return data
+
+    partials = None
+    for chunk in as_column_chunks(data):
+        chunk_partials = build_partials(chunk, partials['rows'] if partials is not None else 0)
+        partials = chunk_partials if partials is None else merge_partials(partials, chunk_partials)
+    return partials if partials is not None else build_partials(records_to_columns([]))
+
+# Function to aggregate the partial states per year and month, over every city. Takes (field, aggregation)
+# pairs and returns the same 'years', 'count' and 'field_aggregation' arrays as aggregate.groupby_year_month.
+# 'std' is the population standard deviation, from the sums of squares.
+def partials_by_year_month(partials, aggregations):
+    for field, aggregation in aggregations:
+        if field not in PARTIAL_FIELDS:
+            raise ValueError(f"Field '{field}' has no partial states, expected one of {PARTIAL_FIELDS}")
+        if aggregation not in PARTIAL_AGGREGATIONS:
+            raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {PARTIAL_AGGREGATIONS}")
+
+    months_state = combine_entries(
+        partials['year_month'], np.zeros(len(partials['year_month']), dtype=np.int64),
+        partials['count'], partials['first_row'], partials['values'],
+    )
+    bucket_keys = months_state['year_month']
+    years = np.unique(bucket_keys // 12)
+    rows = np.searchsorted(years, bucket_keys // 12)
+    months = bucket_keys % 12
+
+    count = np.zeros((len(years), 12), dtype=np.int64)
+    count[rows, months] = months_state['count']
+    result = {'years': years, 'count': count}
+
+    values = months_state['values']
+    for field, aggregation in aggregations:
+        if aggregation == 'count':
+            reduced = months_state['count'].astype(np.float64)
+        elif aggregation == 'mean':
+            reduced = values[f'{field}_sum'] / months_state['count']
+        elif aggregation == 'std':
+            mean = values[f'{field}_sum'] / months_state['count']
+            reduced = np.sqrt(np.maximum(values[f'{field}_sumsq'] / months_state['count'] - mean * mean, 0))
+        else:
+            reduced = values[f'{field}_{aggregation}']
+        dense = np.full((len(years), 12), np.nan)
+        dense[rows, months] = reduced
+        result[f'{field}_{aggregation}'] = dense
+
+    return result
+
+# Function to get the path of the persisted partial states of a data file (next to it, so rewriting
+# the parse cache leaves them in place)
+def partials_path(file_path):
+    return file_path + '.partials.npz'
+
+# Function to save partial states, tagged with the fingerprint of the part of the data file they cover
+def write_partials(file_path, fingerprint, partials):
+    path = partials_path(file_path)
+    staging = f'{path}.tmp-{os.getpid()}.npz'
+    try:
+        meta = {'fingerprint': fingerprint, 'version': PARTIALS_VERSION, 'fields': PARTIAL_FIELDS, 'rows': partials['rows']}
+        np.savez(
+            staging,
+            meta=np.array(json.dumps(meta)),
+            cities=partials['cities'],
+            year_month=partials['year_month'],
+            city=partials['city'],
+            count=partials['count'],
+            first_row=partials['first_row'],
+            **{f'values_{name}': column for name, column in partials['values'].items()},
+        )
+        os.replace(staging, path)
+    except OSError as error:
+        print(f"Could not write partial states for '{file_path}': {error}")
+        if os.path.exists(staging):
+            os.remove(staging)
+
+# Function to read persisted partial states back with the fingerprint they cover, or (None, None) if
+# they are missing or were written for other fields
+def read_partials(file_path):
+    try:
+        with np.load(partials_path(file_path)) as stored:
+            meta = json.loads(stored['meta'].item())
+            if meta['version'] != PARTIALS_VERSION or meta['fields'] != PARTIAL_FIELDS:
+                return None, None
+            partials = {
+                'cities': stored['cities'],
+                'year_month': stored['year_month'],
+                'city': stored['city'],
+                'count': stored['count'],
+                'first_row': stored['first_row'],
+                'values': {name[len('values_'):]: stored[name] for name in stored.files if name.startswith('values_')},
+                'rows': meta['rows'],
+            }
+            return partials, meta['fingerprint']
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+# Function to bring the partial states of a data file up to date, folding in only the records appended to
+# it since they were saved (JSON Lines), so a daily run reads the new records rather than the whole history.
+# They are built from the whole file the first time, or when the file was changed some other way: from
+# `columns` when it is already loaded, with the fingerprint those columns were parsed from (read_dataset's,
+# or the parse cache's when none is given). Returns the partial states and the fingerprint they cover.
+def update_partials(file_path, columns=None, fingerprint=None):
+    partials, stored = read_partials(file_path)
+    stat = os.stat(file_path)
+    appended = appended_line_range(file_path, stored, stat) if partials is not None else None
+    if appended is not None:
+        start, end = appended
+        if end == start:
+            return partials, stored
+        partials = merge_partials(partials, build_partials(parse_line_range(file_path, start, end), partials['rows']))
+        fingerprint = file_fingerprint(file_path, end, stat.st_mtime_ns)
+        write_partials(file_path, fingerprint, partials)
+        return partials, fingerprint
+
+    if columns is None:
+        columns, fingerprint = read_dataset(file_path)
+    elif fingerprint is None:
+        fingerprint = cache_fingerprint(file_path)
+    partials = build_partials(columns)
+    if fingerprint is not None:
+        write_partials(file_path, fingerprint, partials)
+    return partials, fingerprint
+
+# Function to load the partial states of a data file (see update_partials)
+def load_partials(file_path, columns=None, fingerprint=None):
+    return update_partials(file_path, columns, fingerprint)[0]
@@ -0,0 +1,96 @@
+import os
+import json
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11 has no TOML reader; JSON query files still work
+    tomllib = None
+
+from categories import counts_to_dict
+from cube import CATEGORY_AXES, category_codes
+from index import build_date_index, build_city_date_index, select_date_rows
+
+# Query kinds and the fields a query may set
+QUERY_KINDS = ['magnitude', 'rainfall']
+QUERY_FIELDS = ['name', 'kind', 'start', 'end', 'city']
+
+# Function to read a query file (.json or .toml) holding a list of queries under 'queries', e.g.
+#   [[queries]]
+#   kind = "magnitude"
+#   start = "2020-01-01"
+#   end = "2020-06-30"
+#   city = "Lima"      # optional, leave out for every city
+def load_queries(file_path):
+    if os.path.splitext(file_path)[1].lower() == '.toml':
+        if tomllib is None:
+            raise ValueError(f"Reading '{file_path}' needs Python 3.11+ (tomllib); use a JSON query file instead")
+        with open(file_path, 'rb') as f:
+            spec = tomllib.load(f)
+    else:
+        with open(file_path, 'r') as f:
+            spec = json.load(f)
+
+    queries = spec.get('queries') if isinstance(spec, dict) else spec
+    if not isinstance(queries, list):
+        raise ValueError(f"Query file '{file_path}' must hold a list of queries under 'queries'")
+    return [check_query(query, number) for number, query in enumerate(queries, start=1)]
+
+# Function to validate one query and fill in its defaults
+def check_query(query, number):
+    if not isinstance(query, dict):
+        raise ValueError(f"Query {number} must be a table of fields, got {query!r}")
+
+    unknown = sorted(set(query) - set(QUERY_FIELDS))
+    if unknown:
+        raise ValueError(f"Query {number} has unknown fields {unknown}, expected some of {QUERY_FIELDS}")
+    if query.get('kind') not in QUERY_KINDS:
+        raise ValueError(f"Query {number} has kind {query.get('kind')!r}, expected one of {QUERY_KINDS}")
+    for field in ['start', 'end']:
+        if not isinstance(query.get(field), str):
+            raise ValueError(f"Query {number} needs a '{field}' date (YYYY-MM-DD)")
+    if query.get('city') is not None and not isinstance(query['city'], str):
+        raise ValueError(f"Query {number} has city {query['city']!r}, expected a name")
+
+    return {
+        'name': query.get('name') or f"query {number}",
+        'kind': query['kind'],
+        'start': query['start'],
+        'end': query['end'],
+        'city': query.get('city'),
+    }
+
+# Function to evaluate every query together: each column is classified once, the rows of all
+# queries are gathered from the date and city indexes, and one bincount per kind counts the
+# categories of every query at once. Returns one result per query, in query order.
+def evaluate_queries(data, queries, date_index=None, city_index=None):
+    if date_index is None and any(query['city'] is None for query in queries):
+        date_index = build_date_index(data)
+    if city_index is None and any(query['city'] is not None for query in queries):
+        city_index = build_city_date_index(data)
+
+    results = [dict(query) for query in queries]
+    for kind in QUERY_KINDS:
+        numbers = [number for number, query in enumerate(queries) if query['kind'] == kind]
+        if not numbers:
+            continue
+
+        bins = CATEGORY_AXES[kind][1]
+        codes = category_codes(data, kind)
+        slot_count = len(bins['labels']) + 1  # The last slot holds unclassified rows
+
+        query_rows = [
+            select_date_rows(data, queries[number]['start'], queries[number]['end'], date_index, queries[number]['city'], city_index)
+            for number in numbers
+        ]
+        rows = np.concatenate(query_rows)
+        owners = np.repeat(np.arange(len(numbers)), [len(selected) for selected in query_rows])
+        row_codes = np.where(codes[rows] >= 0, codes[rows], slot_count - 1)
+
+        table = np.bincount(owners * slot_count + row_codes, minlength=len(numbers) * slot_count)
+        table = table.reshape(len(numbers), slot_count)
+        for position, number in enumerate(numbers):
+            results[number]['counts'] = counts_to_dict(table[position, :-1], bins)
+            results[number]['records'] = table[position].sum().item()
+
+    return results
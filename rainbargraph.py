@@ -1,44 +1,22 @@
-import json
-import matplotlib.pyplot as plt
 import os
 import calendar
 from collections import defaultdict
-from datetime import datetime
-import shutil
-
-# Function to load data from a JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-# Function to classify rainfall into categories
-def classify_rainfall(rain_sum):
-    if rain_sum <= 5:
-        return 'Low_rainfall'
-    elif 6 <= rain_sum <= 10:
-        return 'Medium_rainfall'
-    elif rain_sum >= 10:
-        return 'High_rainfall'
-    return None  # If there's no valid data for rainfall
-
-# Function to count the frequency of rainfall categories per month and year
-def count_rainfall_categories(data):
-    rainfall_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))  # Year -> Month -> Category -> Count
+from cube import load_cube, cube_slice, axis_labels
+from render import plt, render_cached_charts, chart_template, set_bar_heights, rescale_axes
+from export import write_data_only
 
-    for entry in data:
-        date = entry.get('date', '')
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
+# Function to count the frequency of rainfall categories per month and year from the count cube
+def count_rainfall_categories(cube):
+    rainfall_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))  # Year -> Month -> Category -> Count
 
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            month = year_month.month
+    # Drop the cube's slots for invalid dates and unclassified rainfall
+    table = cube_slice(cube, ['year', 'month', 'rainfall'])[:-1, :-1, :-1]
 
-            category = classify_rainfall(rain_sum)
-            if category:
-                rainfall_counts[year][month][category] += 1
-        except ValueError:
-            continue  # Skip invalid date entries
+    for year, months in zip(cube['years'].tolist(), table.tolist()):
+        for month, row in enumerate(months, start=1):
+            for category, count in zip(axis_labels('rainfall'), row):
+                if count:
+                    rainfall_counts[year][month][category] += count
     
     return rainfall_counts
 
@@ -47,61 +25,69 @@ def create_folder(folder_name):
     if not os.path.exists(folder_name):
         os.makedirs(folder_name)
 
-# Function to plot the rainfall frequency bar graph for each year
-def plot_rainfall_categories(rainfall_counts, save_folder):
-    categories = ['Low_rainfall', 'Medium_rainfall', 'High_rainfall']
+# Function to build the rainfall categories figure once; every year reuses it with new bar heights
+def build_rainfall_categories_template():
+    months_list = [calendar.month_abbr[i] for i in range(1, 13)]
+
+    # Create the bar graph shared by every year
+    fig, ax = plt.subplots(figsize=(10, 6))
+    
+    # Bar width
+    bar_width = 0.25
+    index = range(12)
+
+    # Plot the bars (all zero until a year fills them in)
+    low_bars = ax.bar(index, [0] * 12, bar_width, label='Low Rainfall', color='green')
+    medium_bars = ax.bar([i + bar_width for i in index], [0] * 12, bar_width, label='Medium Rainfall', color='orange')
+    high_bars = ax.bar([i + bar_width * 2 for i in index], [0] * 12, bar_width, label='High Rainfall', color='red')
+
+    # Set labels
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Frequency')
+    ax.set_xticks([i + bar_width for i in index])
+    ax.set_xticklabels(months_list)
     
-    # Loop over all years
-    for year, months in rainfall_counts.items():
-        months_list = [calendar.month_abbr[i] for i in range(1, 13)]
-        
-        # Prepare data for plotting
-        low_rainfall = []
-        medium_rainfall = []
-        high_rainfall = []
-
-        for month in range(1, 13):
-            low_rainfall.append(months.get(month, {}).get('Low_rainfall', 0))
-            medium_rainfall.append(months.get(month, {}).get('Medium_rainfall', 0))
-            high_rainfall.append(months.get(month, {}).get('High_rainfall', 0))
-
-        # Create the bar graph
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Bar width
-        bar_width = 0.25
-        index = range(12)
-
-        # Plot the bars
-        ax.bar(index, low_rainfall, bar_width, label='Low Rainfall', color='green')
-        ax.bar([i + bar_width for i in index], medium_rainfall, bar_width, label='Medium Rainfall', color='orange')
-        ax.bar([i + bar_width * 2 for i in index], high_rainfall, bar_width, label='High Rainfall', color='red')
-
-        # Set labels and title
-        ax.set_xlabel('Month')
-        ax.set_ylabel('Frequency')
-        ax.set_title(f'Rainfall Categories Frequency in {year}')
-        ax.set_xticks([i + bar_width for i in index])
-        ax.set_xticklabels(months_list)
-        
-        # Add legends
-        ax.legend()
-
-        # Save the plot to the specified folder
-        save_path = os.path.join(save_folder, f'rainfall_categories_{year}.png')
-        plt.savefig(save_path)
-        plt.close()  # Close the plot to avoid memory issues
+    # Add legends
+    ax.legend()
+    return {'figure': fig, 'axes': ax, 'low': low_bars, 'medium': medium_bars, 'high': high_bars}
+
+# Function to plot the rainfall frequency bar graph of one year as an image_format ('png' or 'svg') file and return its path
+def plot_rainfall_categories_year(year, months, save_folder, image_format='png'):
+    # Prepare data for plotting
+    low_rainfall = []
+    medium_rainfall = []
+    high_rainfall = []
+
+    for month in range(1, 13):
+        low_rainfall.append(months.get(month, {}).get('Low_rainfall', 0))
+        medium_rainfall.append(months.get(month, {}).get('Medium_rainfall', 0))
+        high_rainfall.append(months.get(month, {}).get('High_rainfall', 0))
+
+    # Reuse the figure: only the bar heights, y-limits and title change from year to year
+    template = chart_template('rainfall_categories', build_rainfall_categories_template)
+    set_bar_heights(template['low'], low_rainfall)
+    set_bar_heights(template['medium'], medium_rainfall)
+    set_bar_heights(template['high'], high_rainfall)
+    rescale_axes(template['axes'])
+    template['axes'].set_title(f'Rainfall Categories Frequency in {year}')
+
+    # Save the plot to the specified folder
+    save_path = os.path.join(save_folder, f'rainfall_categories_{year}.{image_format}')
+    template['figure'].savefig(save_path)
+    return save_path
 
+# Function to plot the rainfall frequency bar graph for each year
+def plot_rainfall_categories(rainfall_counts, save_folder, workers=None):
+    # Fan the years out over the render processes; each job only carries that year's monthly counts
+    jobs = [
+        (year, {month: dict(counts) for month, counts in months.items()}, save_folder)
+        for year, months in rainfall_counts.items()
+    ]
+    for year, save_path in zip(rainfall_counts, render_cached_charts(plot_rainfall_categories_year, jobs, save_folder, workers)):
         print(f"Histogram for {year} saved to {save_path}")
 
-# Main function
-def main():
-    # Load earthquake and weather data from JSON file
-    data = load_json_data('bar_graphs\\merged_data.json')  # Replace with your actual file path
-
-    # Count rainfall categories
-    rainfall_counts = count_rainfall_categories(data)
-
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(rainfall_counts, workers=None):
     # Folder to save the bar graphs
     save_folder = 'rainfall_histograms'  # Folder name where the histogram will be saved
 
@@ -109,7 +95,22 @@ def main():
     create_folder(save_folder)
 
     # Plot and save the rainfall frequency bar graphs
-    plot_rainfall_categories(rainfall_counts, save_folder)
+    plot_rainfall_categories(rainfall_counts, save_folder, workers)
+
+# Main function
+def main():
+    # Load earthquake and weather data from JSON file
+    cube = load_cube('bar_graphs\\merged_data.json')  # Replace with your actual file path
+
+    # Count rainfall categories
+    rainfall_counts = count_rainfall_categories(cube)
+
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(rainfall_counts):
+        return
+
+    # Draw the charts
+    draw_report(rainfall_counts)
 
 # Run the main function
 if __name__ == "__main__":
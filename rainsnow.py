@@ -1,86 +1,86 @@
-import json
 import os
-import matplotlib.pyplot as plt
+from render import plt, render_cached_charts, chart_template, set_bar_heights, rescale_axes
 import calendar
-from collections import defaultdict
-from datetime import datetime
-import shutil
+from dataset import load_dataset
+from export import write_data_only
+from specs import REPORT_SPECS, evaluate_specs
 
-# Function to load data from a JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-# Function to create the folder if it doesn't exist (or delete and recreate it if it does)
+# Function to create the folder if it doesn't exist (kept between runs)
 def create_folder(folder_name):
-    if os.path.exists(folder_name):
-        shutil.rmtree(folder_name)  # Delete the existing folder and its contents
-    os.makedirs(folder_name)  # Create a new folder
-
-# Load data and create folder
-data = load_json_data('bar_line\\merged_data.json')  # Replace with your actual file path
-create_folder('graphs_rainfall_snowfall')  # Folder to store this specific plot
+    # Keep the folder between runs: the chart cache reuses unchanged graphs and removes stale ones
+    os.makedirs(folder_name, exist_ok=True)
+    return folder_name
 
 # Process data to get rainfall and snowfall
 def calculate_rainfall_snowfall(data):
-    monthly_data = defaultdict(lambda: defaultdict(list))
-
-    for entry in data:
-        date = entry.get('date', '')
-        rain_sum = entry.get('weather', {}).get('rain_sum', 0)
-        snowfall_sum = entry.get('weather', {}).get('snowfall_sum', 0)
-
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            month = year_month.month
-            monthly_data[year][month].append({
-                'rain_sum': rain_sum,
-                'snowfall_sum': snowfall_sum,
-            })
-        except ValueError:
-            continue  # Skip invalid date entries
-
-    year_month_totals = defaultdict(lambda: defaultdict(dict))
-    for year, months in monthly_data.items():
-        for month, values in months.items():
-            total_rainfall = sum(entry['rain_sum'] for entry in values)
-            total_snowfall = sum(entry['snowfall_sum'] for entry in values)
-            year_month_totals[year][month] = {
-                'total_rainfall': total_rainfall,
-                'total_snowfall': total_snowfall,
-            }
-
-    return year_month_totals
-
-# Plot the graph
-def plot_rainfall_snowfall(year_month_totals):
-    for year, months in year_month_totals.items():
-        months_list = [calendar.month_abbr[i] for i in range(1, 13)]
-        total_rainfall_list = [months.get(i, {}).get('total_rainfall', 0) for i in range(1, 13)]
-        total_snowfall_list = [months.get(i, {}).get('total_snowfall', 0) for i in range(1, 13)]
-
-        fig, ax1 = plt.subplots(figsize=(10, 6))
-
-        ax2 = ax1.twinx()
-        # Plot line for rainfall first to make sure it's on top
-        ax2.plot(months_list, total_rainfall_list, label='Rainfall (mm)', color='blue', marker='o', linestyle='-', linewidth=2)
-        ax2.set_ylabel('Rainfall (mm)', color='blue')
-        ax2.tick_params(axis='y', labelcolor='blue')
-
-        # Plot the bars for snowfall
-        ax1.bar(months_list, total_snowfall_list, label='Snowfall (cm)', color='cyan', alpha=0.6)
-        ax1.set_xlabel('Month')
-        ax1.set_ylabel('Snowfall (cm)', color='cyan')
-        ax1.tick_params(axis='y', labelcolor='cyan')
-
-        plt.title(f'Rainfall & Snowfall in {year}')
-        ax1.legend(loc='upper left')
-        ax2.legend(loc='upper right')
-
-        plt.savefig(f'graphs_rainfall_snowfall/rainfall_snowfall_{year}.png')
-        plt.close()
-
-# Calculate and plot
-year_month_totals = calculate_rainfall_snowfall(data)
-plot_rainfall_snowfall(year_month_totals)
+    # The bar and line fields are declared in specs.REPORT_SPECS; see specs.evaluate_specs
+    return evaluate_specs(data, ['rainsnow'])['rainsnow']
+
+# Function to build the rainfall and snowfall figure once; every year reuses it with new bar heights and line data
+def build_rainfall_snowfall_template():
+    months_list = [calendar.month_abbr[i] for i in range(1, 13)]
+
+    # Create the figure shared by every year
+    fig, ax1 = plt.subplots(figsize=(10, 6))
+
+    ax2 = ax1.twinx()
+    # Plot line for rainfall first to make sure it's on top
+    line, = ax2.plot(months_list, [0] * 12, label='Rainfall (mm)', color='blue', marker='o', linestyle='-', linewidth=2)
+    ax2.set_ylabel('Rainfall (mm)', color='blue')
+    ax2.tick_params(axis='y', labelcolor='blue')
+
+    # Plot the bars for snowfall
+    bars = ax1.bar(months_list, [0] * 12, label='Snowfall (cm)', color='cyan', alpha=0.6)
+    ax1.set_xlabel('Month')
+    ax1.set_ylabel('Snowfall (cm)', color='cyan')
+    ax1.tick_params(axis='y', labelcolor='cyan')
+
+    ax1.legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    return {'figure': fig, 'bar_axes': ax1, 'line_axes': ax2, 'bars': bars, 'line': line}
+
+# Function to plot and save the graph of one year as an image_format ('png' or 'svg') file and return its path
+def plot_rainfall_snowfall_year(year, months, folder_path, image_format='png'):
+    total_rainfall_list = [months.get(i, {}).get('total_rainfall', 0) for i in range(1, 13)]
+    total_snowfall_list = [months.get(i, {}).get('total_snowfall', 0) for i in range(1, 13)]
+
+    # Reuse the figure: only the bar heights, line data, y-limits and title change from year to year
+    template = chart_template('rainsnow', build_rainfall_snowfall_template)
+    set_bar_heights(template['bars'], total_snowfall_list)
+    template['line'].set_ydata(total_rainfall_list)
+    rescale_axes(template['bar_axes'], template['line_axes'])
+    template['line_axes'].set_title(f'Rainfall & Snowfall in {year}')  # The title sits on the twin axes, as plt.title did
+
+    graph_filename = f"{folder_path}/rainfall_snowfall_{year}.{image_format}"
+    template['figure'].savefig(graph_filename)
+    return graph_filename
+
+# Plot the graph of each year
+def plot_rainfall_snowfall(year_month_totals, folder_path, workers=None):
+    # Fan the years out over the render processes; each job only carries that year's monthly values
+    jobs = [(year, months, folder_path) for year, months in year_month_totals.items()]
+    return render_cached_charts(plot_rainfall_snowfall_year, jobs, folder_path, workers)
+
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(year_month_totals, workers=None):
+    # Create the folder and plot
+    folder_path = create_folder(REPORT_SPECS['rainsnow']['folder'])  # Folder to store this specific plot
+    plot_rainfall_snowfall(year_month_totals, folder_path, workers)
+
+# Main function
+def main():
+    # Load data (replace with your actual file path)
+    data = load_dataset('bar_line\\merged_data.json')
+
+    # Calculate the monthly rainfall and snowfall per year
+    year_month_totals = calculate_rainfall_snowfall(data)
+
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(year_month_totals):
+        return
+
+    # Draw the charts
+    draw_report(year_month_totals)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import functools
+import importlib
+import importlib.metadata
+from concurrent.futures import ProcessPoolExecutor
+from export import to_plain
+
+# Stand-in for a module that is only imported when one of its attributes is first used
+class LazyModule:
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attr)
+
+# matplotlib.pyplot for the chart scripts: importing a script (or running it with --data-only)
+# does not import matplotlib, which only loads once the first chart is drawn
+plt = LazyModule('matplotlib.pyplot')
+
+# Environment variable holding the default number of chart rendering processes
+WORKERS_ENV = 'STATS_TODAY_WORKERS'
+
+# Function to pick the number of render processes: the argument, else $STATS_TODAY_WORKERS, else one per CPU
+def render_workers(workers=None):
+    if workers is None:
+        workers = int(os.environ.get(WORKERS_ENV) or 0) or os.cpu_count() or 1
+    return max(1, workers)
+
+# Function to call render_func(*job) for every job and return what each call returns (the written
+# paths), in job order. With more than one worker the jobs fan out over a process pool, so
+# render_func must be a module-level function and each job should only carry the small
+# per-chart aggregates. One worker (or one job) renders in this process, same as the serial path.
+def render_charts(render_func, jobs, workers=None):
+    jobs = list(jobs)
+    workers = min(render_workers(workers), len(jobs))
+    if workers <= 1:
+        return [render_func(*job) for job in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(render_func, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+# Per-process cache of chart templates: each chart type's figure is built once and reused for every year
+TEMPLATES = {}
+
+# Function to get the template of a chart type, building it with build_func the first time.
+# A template is a dict holding the figure plus the axes and artists the per-year update touches.
+def chart_template(name, build_func):
+    if name not in TEMPLATES:
+        TEMPLATES[name] = build_func()
+    return TEMPLATES[name]
+
+# Function to give the bars of a bar container new heights
+def set_bar_heights(bars, heights):
+    for bar, height in zip(bars, heights):
+        bar.set_height(height)
+
+# Function to recompute the data limits of axes after their artists changed and autoscale them again
+def rescale_axes(*axes):
+    for ax in axes:
+        ax.relim()
+        ax.autoscale_view()
+
+# Bump when the drawing code of any chart changes so every cached chart is drawn again
+RENDERER_VERSION = 1
+
+# Name of the chart cache manifest kept in each chart folder
+CHART_MANIFEST = '.chart_cache.json'
+
+# Function to look up the installed matplotlib version once per process (None if it is not installed),
+# without importing matplotlib itself
+@functools.lru_cache(maxsize=None)
+def matplotlib_version():
+    try:
+        return importlib.metadata.version('matplotlib')
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+# Function to get the cache key of one chart: a hash of the render function, its job (the chart's
+# input aggregates and parameters), the renderer version and the installed matplotlib version
+def chart_key(render_func, job):
+    content = json.dumps([RENDERER_VERSION, matplotlib_version(), render_func.__module__, render_func.__qualname__, to_plain(job)])
+    return hashlib.sha256(content.encode()).hexdigest()
+
+# Function to read the manifest of a chart folder (chart key -> file name); a missing or broken one is empty
+def read_chart_manifest(folder_path):
+    try:
+        with open(os.path.join(folder_path, CHART_MANIFEST), 'r') as f:
+            return json.load(f)['charts']
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+# Function to write the manifest of a chart folder, swapping the finished file in
+def write_chart_manifest(folder_path, charts):
+    path = os.path.join(folder_path, CHART_MANIFEST)
+    staging = f'{path}.tmp-{os.getpid()}'
+    with open(staging, 'w') as f:
+        json.dump({'version': RENDERER_VERSION, 'charts': charts}, f, indent=2, sort_keys=True)
+    os.replace(staging, path)
+
+# Function to render the charts of one folder like render_charts, skipping every chart whose key
+# (see chart_key) matches a file the folder already holds. Files of the folder that no job produced
+# this time are removed. Returns the chart paths in job order, drawn or not.
+def render_cached_charts(render_func, jobs, folder_path, workers=None):
+    jobs = list(jobs)
+    os.makedirs(folder_path, exist_ok=True)
+    cached = read_chart_manifest(folder_path)
+    keys = [chart_key(render_func, job) for job in jobs]
+
+    paths = [None] * len(jobs)
+    pending = []
+    for position, key in enumerate(keys):
+        filename = cached.get(key)
+        if filename and os.path.isfile(os.path.join(folder_path, filename)):
+            paths[position] = os.path.join(folder_path, filename)
+        else:
+            pending.append(position)
+
+    for position, path in zip(pending, render_charts(render_func, [jobs[position] for position in pending], workers)):
+        paths[position] = path
+
+    # Remove the charts of the folder this run did not produce (years or cities that are gone)
+    charts = {key: os.path.basename(path) for key, path in zip(keys, paths)}
+    for filename in set(os.listdir(folder_path)) - set(charts.values()) - {CHART_MANIFEST}:
+        if os.path.isfile(os.path.join(folder_path, filename)):
+            os.remove(os.path.join(folder_path, filename))
+
+    write_chart_manifest(folder_path, charts)
+    if len(pending) < len(jobs):
+        print(f"Reused {len(jobs) - len(pending)} unchanged charts in '{folder_path}'")
+    return paths
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import importlib
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+from dataset import load_dataset, forget_derived_columns
+from index import build_date_index, build_city_date_index, select_date_rows, parse_day
+from export import to_plain
+from stats_today import REPORTS, calculate_columns
+
+# Address the service listens on by default (local only)
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8050
+
+# Default bound of the response cache, in bytes of rendered responses
+DEFAULT_CACHE_BYTES = 64 << 20
+
+# Query parameters a request may set
+REQUEST_PARAMS = ['year', 'city', 'start', 'end', 'format']
+
+# Chart formats and their content types
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Reports that draw one chart per year, and the function of their module that plots one year
+CHART_FUNCTIONS = {
+    'elevationwind': 'plot_elevation_wind_speed_year',
+    'mag_precipitation': 'plot_magnitude_precipitation_year',
+    'magnitudes': 'plot_magnitude_year',
+    'rain_magnitude': 'plot_rain_magnitude_year',
+    'rainbargraph': 'plot_rainfall_categories_year',
+    'rainsnow': 'plot_rainfall_snowfall_year',
+    'snow_windspeed': 'plot_wind_speed_snowfall_year',
+    'sun': 'plot_sunshine_year',
+    'sun_precipitation': 'plot_sunshine_precipitation_year',
+    'sunhrs_maxtemp': 'plot_sunshine_temperature_year',
+    'temp_mag': 'plot_temperature_magnitude_year',
+    'temp_windspeed': 'plot_temperature_wind_speed_year',
+    'tempreture_line': 'plot_temperature_averages_year',
+    'tempreture_rain': 'plot_temperature_rainfall_year',
+    'wind': 'plot_wind_speed_year',
+}
+
+# matplotlib's pyplot is not thread-safe, so the request threads draw one chart at a time
+RENDER_LOCK = threading.Lock()
+
+# Function to load the dataset into memory with the date and city indexes the filtered requests use
+def start_service(file_path, cache_bytes=DEFAULT_CACHE_BYTES):
+    data = {name: np.asarray(values) for name, values in load_dataset(file_path).items()}
+    date_index = build_date_index(data)
+    dates = data['date'][date_index['order']]
+    return {
+        'data': data,
+        'date_index': date_index,
+        'city_index': build_city_date_index(data),
+        'first_date': dates[0].item() if len(dates) else '',
+        'last_date': dates[-1].item() if len(dates) else '',
+        'cache': {'entries': OrderedDict(), 'bytes': 0, 'max_bytes': cache_bytes, 'in_flight': {}, 'lock': threading.Lock()},
+    }
+
+# Function to get a response from the cache, or build it with build_func. Concurrent requests for the
+# same key wait for the one build already running instead of starting their own. Responses are kept
+# least recently used first and the oldest are dropped once the cache holds more than its max_bytes.
+def cached_response(cache, key, build_func):
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['entries'].move_to_end(key)
+            return cache['entries'][key]
+        future = cache['in_flight'].get(key)
+        building = future is None
+        if building:
+            future = cache['in_flight'][key] = Future()
+    if not building:
+        return future.result()
+
+    try:
+        response = build_func()
+    except BaseException as error:
+        with cache['lock']:
+            del cache['in_flight'][key]
+        future.set_exception(error)
+        raise
+
+    with cache['lock']:
+        del cache['in_flight'][key]
+        size = len(response[2])
+        if size <= cache['max_bytes']:
+            cache['entries'][key] = response
+            cache['bytes'] += size
+            while cache['bytes'] > cache['max_bytes']:
+                _, dropped = cache['entries'].popitem(last=False)
+                cache['bytes'] -= len(dropped[2])
+    future.set_result(response)
+    return response
+
+# Function to read and check the query parameters of a request (each given at most once)
+def parse_params(query):
+    params = parse_qs(query, keep_blank_values=True)
+    unknown = sorted(set(params) - set(REQUEST_PARAMS))
+    if unknown:
+        raise ValueError(f"Unknown parameters {unknown}, expected some of {REQUEST_PARAMS}")
+    for name, values in params.items():
+        if len(values) != 1:
+            raise ValueError(f"Parameter '{name}' is given {len(values)} times")
+    params = {name: values[0] for name, values in params.items()}
+
+    if 'year' in params:
+        if not params['year'].isdigit():
+            raise ValueError(f"Parameter 'year' must be a year, got {params['year']!r}")
+        params['year'] = int(params['year'])
+    for name in ['start', 'end']:
+        if name in params:
+            day = parse_day(params[name])
+            if day is None:
+                raise ValueError(f"Parameter '{name}' must be a YYYY-MM-DD date, got {params[name]!r}")
+            # Write the date zero-padded (2020-9-1 -> 2020-09-01), so dates compare as strings
+            params[name] = str(np.datetime64(day, 'D'))
+    if params.get('format', 'png') not in CHART_FORMATS:
+        raise ValueError(f"Parameter 'format' must be one of {list(CHART_FORMATS)}, got {params['format']!r}")
+    return params
+
+# Function to get the rows a request selects (in file order), or None for the whole dataset.
+# year, start and end narrow the date range; city keeps one city's records.
+def select_rows(service, params):
+    if not any(name in params for name in ['year', 'city', 'start', 'end']):
+        return None
+
+    start = params.get('start', service['first_date'])
+    end = params.get('end', service['last_date'])
+    if 'year' in params:
+        start = max(start, f"{params['year']:04d}-01-01")
+        end = min(end, f"{params['year']:04d}-12-31")
+    rows = select_date_rows(service['data'], start, end, service['date_index'], params.get('city'), service['city_index'])
+    return np.sort(rows)
+
+# Function to calculate a report's aggregates over the selected rows, building the products it reads from them
+def calculate_rows(service, name, rows):
+    data = service['data'] if rows is None else {column: values[rows] for column, values in service['data'].items()}
+    try:
+        return calculate_columns(name, data)
+    finally:
+        # The selected rows are a throwaway copy; drop the columns derived from them
+        if rows is not None:
+            forget_derived_columns(data)
+
+# Function to make an error response
+def error_response(status, message):
+    return status, 'application/json', json.dumps({'error': message}).encode()
+
+# Function to draw one year's chart of a report and return the image bytes
+def render_chart(name, year, aggregates, image_format):
+    plot = getattr(importlib.import_module(REPORTS[name]['module']), CHART_FUNCTIONS[name])
+    with RENDER_LOCK, tempfile.TemporaryDirectory() as folder:
+        with open(plot(year, aggregates[year], folder, image_format), 'rb') as f:
+            return f.read()
+
+# Function to answer one request path with (status, content type, body). Routes:
+#   /reports                    the report names and the reports with charts
+#   /aggregates/REPORT          the report's aggregates as JSON (year, city, start, end select the records)
+#   /charts/REPORT?year=YEAR    one year's chart as PNG, or SVG with format=svg (city, start, end as above)
+def handle_request(service, path):
+    parts = urlsplit(path)
+    route = [part for part in parts.path.split('/') if part]
+    try:
+        params = parse_params(parts.query)
+    except ValueError as error:
+        return error_response(400, str(error))
+
+    if route in [[], ['reports']]:
+        return 200, 'application/json', json.dumps({'reports': list(REPORTS), 'charts': list(CHART_FUNCTIONS)}).encode()
+    if len(route) != 2 or route[0] not in ['aggregates', 'charts']:
+        return error_response(404, f"No page '{parts.path}', expected /reports, /aggregates/REPORT or /charts/REPORT")
+    kind, name = route
+    if name not in REPORTS or (kind == 'charts' and name not in CHART_FUNCTIONS):
+        return error_response(404, f"No {kind} for report '{name}', see /reports")
+    if kind == 'charts' and 'year' not in params:
+        return error_response(400, "Charts need a 'year' parameter")
+
+    # Only the first of several identical requests calculates (and draws); the others share its response
+    def build_response():
+        aggregates = calculate_rows(service, name, select_rows(service, params))
+        if kind == 'aggregates':
+            return 200, 'application/json', json.dumps(to_plain(aggregates)).encode()
+        if params['year'] not in aggregates:
+            return error_response(404, f"Report '{name}' has no records for {params['year']} in the selected range")
+        image_format = params.get('format', 'png')
+        return 200, CHART_FORMATS[image_format], render_chart(name, params['year'], aggregates, image_format)
+
+    return cached_response(service['cache'], (kind, name, tuple(sorted(params.items()))), build_response)
+
+# Request handler answering GET requests from the service held by the server
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # A failing calculation or drawing still gets an answer rather than a dropped connection
+        try:
+            status, content_type, body = handle_request(self.server.service, self.path)
+        except Exception as error:
+            self.log_error("Request %s failed: %r", self.path, error)
+            status, content_type, body = error_response(500, str(error))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# Function to read the command line
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='serve', description="Serve the stats_today aggregates and charts over local HTTP.")
+    parser.add_argument('--input', required=True, metavar='FILE', help="merged_data.json or merged_data.jsonl file to serve")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_BYTES / (1 << 20),
+                        help=f"Megabytes of responses kept in memory (default: {DEFAULT_CACHE_BYTES >> 20})")
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Charts are drawn off the main thread, so use the non-interactive backend unless one is set
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+
+    started = time.perf_counter()
+    server = ThreadingHTTPServer((args.host, args.port), ReportRequestHandler)
+    server.service = start_service(args.input, int(args.cache_mb * (1 << 20)))
+    print(f"Loaded '{args.input}' in {time.perf_counter() - started:.2f}s, serving on http://{args.host}:{server.server_port}/reports")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopped serving")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+from dataset import get_column, derived_column
+from aggregate import AGGREGATIONS, groupby_year_month, to_year_month_dict
+
+# Fields the specs can read that are derived from stored columns (computed once per loaded dataset)
+DERIVED_FIELDS = {
+    'sunshine_duration': lambda columns: get_column(columns, 'sunshine_hours') / 3600,  # Seconds to hours
+}
+
+# Declarative specs of the dual-axis monthly reports, by report name (see register_spec)
+REPORT_SPECS = {}
+
+# Function to register the spec of a dual-axis monthly report. bar and line are (field, aggregation, name):
+# the field read, how it is aggregated per month and the name the value gets in the
+# year -> month -> {name: value} result. folder is where the report saves its charts.
+def register_spec(report, bar, line, folder):
+    for field, aggregation, name in [bar, line]:
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Report '{report}' aggregates '{field}' with '{aggregation}', expected one of {AGGREGATIONS}")
+    REPORT_SPECS[report] = {'bar': bar, 'line': line, 'folder': folder}
+
+register_spec('rain_magnitude', ('rain_sum', 'sum', 'total_rain_sum'), ('magnitude', 'mean', 'average_magnitude'), 'rain_magnitude_graphs')
+register_spec('temp_mag', ('temperature_mean', 'mean', 'avg_temperature_mean'), ('magnitude', 'mean', 'avg_magnitude'), 'temperature_magnitude_graphs')
+register_spec('tempreture_rain', ('rain_sum', 'sum', 'total_rain_sum'), ('temperature_mean', 'mean', 'avg_temperature_mean'), 'temperature_rainfall_graphs')
+register_spec('sun_precipitation', ('precipitation_hours', 'sum', 'total_precipitation_hours'), ('sunshine_duration', 'mean', 'avg_sunshine_hours'), 'sunshine_precipitation_graphs')
+register_spec('snow_windspeed', ('snowfall_sum', 'sum', 'total_snowfall_sum'), ('wind_speed_max', 'max', 'max_wind_speed'), 'wind_speed_snowfall_graphs')
+register_spec('elevationwind', ('wind_speed_max', 'mean', 'avg_wind_speed'), ('elevation', 'mean', 'avg_elevation'), 'graphs_elevation_wind_speed')
+register_spec('mag_precipitation', ('precipitation_hours', 'mean', 'avg_precipitation_hours'), ('magnitude', 'mean', 'avg_magnitude'), 'graphs_magnitude_precipitation')
+register_spec('rainsnow', ('snowfall_sum', 'sum', 'total_snowfall'), ('rain_sum', 'sum', 'total_rainfall'), 'graphs_rainfall_snowfall')
+register_spec('sunhrs_maxtemp', ('temperature_max', 'mean', 'avg_temperature_max'), ('sunshine_duration', 'mean', 'avg_sunshine_hours'), 'graphs_sunshine_temperature')
+register_spec('temp_windspeed', ('wind_speed_max', 'mean', 'avg_wind_speed'), ('temperature_mean', 'mean', 'avg_temperature_mean'), 'graphs_temp_wind_speed')
+
+# Function to plan the fused scan of several reports: every distinct (field, aggregation) pair, once
+def plan_aggregations(reports):
+    aggregations = []
+    for report in reports:
+        for field, aggregation, _ in [REPORT_SPECS[report]['bar'], REPORT_SPECS[report]['line']]:
+            if (field, aggregation) not in aggregations:
+                aggregations.append((field, aggregation))
+    return aggregations
+
+# Function to evaluate the specs of several reports (every registered one by default) with a single
+# group-by pass over the data. Returns each report's year -> month -> {name: value} dict.
+def evaluate_specs(data, reports=None):
+    reports = list(REPORT_SPECS) if reports is None else list(reports)
+    if not reports:
+        return {}
+    aggregations = plan_aggregations(reports)
+    derived = {field: derived_column(data, field, DERIVED_FIELDS[field]) for field, _ in aggregations if field in DERIVED_FIELDS}
+    result = groupby_year_month(dict(data, **derived), aggregations)
+
+    report_data = {}
+    for report in reports:
+        spec = REPORT_SPECS[report]
+        report_data[report] = to_year_month_dict(result, {
+            name: f'{field}_{aggregation}' for field, aggregation, name in [spec['bar'], spec['line']]
+        })
+    return report_data
@@ -0,0 +1,426 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from dataset import load_dataset, read_dataset, forget_derived_columns, append_to_cache, appended_line_range, parse_line_range, file_fingerprint
+from render import render_workers
+from cube import load_cube, build_cube
+from partials import load_partials, update_partials, build_partials
+from export import add_data_only_args, write_aggregates
+from specs import REPORT_SPECS, evaluate_specs
+
+# Every report: the script module, the function that calculates its aggregates and the inputs that
+# function takes ('data' is the loaded dataset, 'cube' its count cube and 'partials' its mergeable
+# partial states). Each module's draw_report draws the charts from the aggregates.
+REPORTS = {
+    'citymag': {'module': 'citymag', 'calculate': 'count_magnitude_categories_by_year', 'inputs': ['cube']},
+    'citys_rainfall': {'module': 'citys_rainfall', 'calculate': 'count_rainfall_categories_by_year', 'inputs': ['data']},
+    'earthquake': {'module': 'earthquake', 'calculate': 'build_pie_chart_counts', 'inputs': ['data', 'cube']},
+    'elevationwind': {'module': 'elevationwind', 'calculate': 'calculate_elevation_wind_speed', 'inputs': ['data']},
+    'mag_precipitation': {'module': 'mag_precipitation', 'calculate': 'calculate_magnitude_precipitation', 'inputs': ['data']},
+    'magnitude_elev': {'module': 'magnitude_elev', 'calculate': 'calculate_magnitude_and_elevation_per_year_and_month', 'inputs': ['data']},
+    'magnitudes': {'module': 'magnitudes', 'calculate': 'calculate_highest_lowest_magnitude_per_year_and_month', 'inputs': ['partials']},
+    'rain_magnitude': {'module': 'rain_magnitude', 'calculate': 'calculate_rain_and_magnitude_per_year_and_month', 'inputs': ['data']},
+    'rainbargraph': {'module': 'rainbargraph', 'calculate': 'count_rainfall_categories', 'inputs': ['cube']},
+    'rainsnow': {'module': 'rainsnow', 'calculate': 'calculate_rainfall_snowfall', 'inputs': ['data']},
+    'snow_windspeed': {'module': 'snow_windspeed', 'calculate': 'calculate_wind_speed_snowfall_per_year_and_month', 'inputs': ['data']},
+    'sun': {'module': 'sun', 'calculate': 'calculate_highest_lowest_sunshine_per_year_and_month', 'inputs': ['partials']},
+    'sun_precipitation': {'module': 'sun_precipitation', 'calculate': 'calculate_sunshine_and_precipitation_per_year_and_month', 'inputs': ['data']},
+    'sunhrs_maxtemp': {'module': 'sunhrs_maxtemp', 'calculate': 'calculate_sunshine_temperature', 'inputs': ['data']},
+    'temp_mag': {'module': 'temp_mag', 'calculate': 'calculate_temperature_and_magnitude_per_year_and_month', 'inputs': ['data']},
+    'temp_windspeed': {'module': 'temp_windspeed', 'calculate': 'calculate_temperature_wind_speed', 'inputs': ['data']},
+    'tempreture_line': {'module': 'tempreture_line', 'calculate': 'calculate_avg_temperatures_per_year_and_month', 'inputs': ['partials']},
+    'tempreture_rain': {'module': 'tempreture_rain', 'calculate': 'calculate_temperature_rainfall_per_year_and_month', 'inputs': ['data']},
+    'wind': {'module': 'wind', 'calculate': 'calculate_highest_wind_speed_per_year_and_month', 'inputs': ['partials']},
+}
+
+# Reports whose aggregates are keyed by year, each year calculated from that year's records alone
+# (the watch mode recalculates only the years records were appended to)
+YEARLY_REPORTS = [
+    'citymag', 'citys_rainfall', 'elevationwind', 'mag_precipitation', 'magnitudes', 'rain_magnitude',
+    'rainbargraph', 'rainsnow', 'snow_windspeed', 'sun', 'sun_precipitation', 'sunhrs_maxtemp', 'temp_mag',
+    'temp_windspeed', 'tempreture_line', 'tempreture_rain', 'wind',
+]
+
+# Function to check the report names asked for and put them in registry order
+def select_reports(names):
+    unknown = sorted(set(names) - set(REPORTS))
+    if unknown:
+        raise ValueError(f"Unknown reports {unknown}, expected some of {list(REPORTS)}")
+    return [name for name in REPORTS if name in names]
+
+# File where the measured seconds of every task of a run are kept, so the next run starts the longest work first
+COSTS_FILE = '.stats_today_costs.json'
+
+# Shared products the reports read, and the products each one is built from: 'data' is the loaded
+# dataset, 'cube' its count cube, 'partials' its partial states (which only read the records appended
+# since the last run, not the dataset) and 'specs' the fused group-by of the selected reports of specs.py
+PRODUCTS = {
+    'data': [],
+    'cube': ['data'],
+    'partials': [],
+    'specs': ['data'],
+}
+
+# Function to list the products a report's calculation reads
+def report_needs(name):
+    if name in REPORT_SPECS:
+        return ['specs']
+    return list(REPORTS[name]['inputs'])
+
+# Function to build the task graph of a run: every task ('product:cube', 'report:wind', ...) with the
+# products it waits for. Only the products a selected report reads (directly or through another product) are built.
+def build_task_graph(names):
+    tasks = {}
+    wanted = [product for name in names for product in report_needs(name)]
+    while wanted:
+        product = wanted.pop()
+        if f'product:{product}' not in tasks:
+            tasks[f'product:{product}'] = list(PRODUCTS[product])
+            wanted.extend(PRODUCTS[product])
+
+    # When the run loads the dataset anyway, the partial states wait for it, so a full rebuild of them
+    # reuses it instead of parsing the file a second time
+    if 'product:partials' in tasks and 'product:data' in tasks:
+        tasks['product:partials'] = ['data']
+    for name in names:
+        tasks[f'report:{name}'] = report_needs(name)
+    return tasks
+
+# Function to read the task costs of earlier runs (task -> seconds); a missing or broken file is empty
+def read_costs(costs_path):
+    try:
+        with open(costs_path, 'r') as f:
+            return {task: float(seconds) for task, seconds in json.load(f).items()}
+    except (OSError, ValueError, TypeError, AttributeError):
+        return {}
+
+# Function to save the task costs, swapping the finished file in
+def write_costs(costs_path, costs):
+    staging = f'{costs_path}.tmp-{os.getpid()}'
+    try:
+        with open(staging, 'w') as f:
+            json.dump(costs, f, indent=2, sort_keys=True)
+        os.replace(staging, costs_path)
+    except OSError as error:
+        print(f"Could not save report costs to '{costs_path}': {error}")
+
+# Function to rank the tasks longest-first: a task's priority is its own recorded cost plus the
+# longest chain of work waiting on it (a report's drawing, or the reports reading a product).
+# Tasks never measured count as the average measured task.
+def task_priorities(tasks, costs, draw=True):
+    default = sum(costs.values()) / len(costs) if costs else 1.0
+    priorities = {}
+
+    def priority(task):
+        if task not in priorities:
+            kind, name = task.split(':')
+            if kind == 'report':
+                after = costs.get(f'draw:{name}', default) if draw else 0.0
+            else:
+                after = max((priority(other) for other, needs in tasks.items() if name in needs), default=0.0)
+            priorities[task] = costs.get(task, default) + after
+        return priorities[task]
+
+    for task in tasks:
+        priority(task)
+    return priorities
+
+# Function to build one shared product from the products it is built from. The fingerprint of the part
+# of the data file a product was read from is kept in fingerprints under the product's name.
+def build_product(name, inputs, file_path, names, fingerprints):
+    if name == 'data':
+        columns, fingerprints['data'] = read_dataset(file_path)
+        return columns
+    if name == 'cube':
+        return load_cube(file_path, inputs['data'], fingerprints['data'])
+    if name == 'partials':
+        partials, fingerprints['partials'] = update_partials(file_path, inputs.get('data'), fingerprints.get('data'))
+        return partials
+
+    # Every selected report declared in specs.py is calculated by one group-by pass, so adding
+    # such a report adds no scan of the data
+    return evaluate_specs(inputs['data'], [report for report in names if report in REPORT_SPECS])
+
+# Function to calculate one report's aggregates from the products it reads
+def calculate_report(name, inputs):
+    if name in REPORT_SPECS:
+        return inputs['specs'][name]
+
+    report = REPORTS[name]
+    calculate = getattr(importlib.import_module(report['module']), report['calculate'])
+    return calculate(*(inputs[product] for product in report['inputs']))
+
+# Function to calculate one report's aggregates straight from loaded columns (e.g. a selection of rows),
+# building the products it reads from them instead of loading the persisted ones of the data file
+def calculate_columns(name, data):
+    inputs = {'data': data}
+    for product in report_needs(name):
+        if product == 'cube':
+            inputs['cube'] = build_cube(data)
+        elif product == 'partials':
+            inputs['partials'] = build_partials(data)
+        elif product == 'specs':
+            inputs['specs'] = evaluate_specs(data, [name])
+    return calculate_report(name, inputs)
+
+# Function to run one task of the graph in a calculation thread; returns its result and the seconds it took
+def run_task(task, inputs, file_path, names, fingerprints):
+    started = time.perf_counter()
+    kind, name = task.split(':')
+    result = build_product(name, inputs, file_path, names, fingerprints) if kind == 'product' else calculate_report(name, inputs)
+    return result, time.perf_counter() - started
+
+# Function to copy an aggregate with every dict in it (the reports' defaultdicts too) as a plain dict,
+# so it can be sent to a draw process; the draws only read the aggregates with .get
+def plain_dicts(value):
+    if isinstance(value, dict):
+        return {key: plain_dicts(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return tuple(plain_dicts(item) for item in value)
+    return value
+
+# Function to draw one report's charts from its aggregates; returns the seconds it took.
+# Module-level so the draw processes can run it.
+def draw_report_job(name, aggregates, workers=None):
+    started = time.perf_counter()
+    importlib.import_module(REPORTS[name]['module']).draw_report(aggregates, workers)
+    return time.perf_counter() - started
+
+# Function to run the given reports over one dataset that is loaded (and parsed) only once.
+# The products and report calculations form a task graph run on `workers` threads: a task starts once
+# the products it reads are built, the longest ready task first (by the costs recorded in costs_path),
+# and a product is dropped as soon as the last task reading it has finished. Each finished report is
+# drawn in one of `workers` draw processes, again longest first, while the calculations go on.
+# With data_only set to 'json' or 'csv' the aggregates of every report are written to output
+# (keyed by report name) instead of drawing any chart. Returns the aggregates by report name; the
+# fingerprints of the data the products were read from are put in `fingerprints` when it is given.
+def run_reports(names, file_path, workers=None, data_only=None, output='-', costs_path=COSTS_FILE, fingerprints=None):
+    names = select_reports(names)
+    workers = render_workers(workers)
+    tasks = build_task_graph(names)
+    costs = read_costs(costs_path)
+    priorities = task_priorities(tasks, costs, draw=not data_only)
+
+    # Reference counts: how many tasks still have to read each product
+    refcounts = {product: 0 for product in PRODUCTS}
+    for needs in tasks.values():
+        for product in needs:
+            refcounts[product] += 1
+
+    inputs, aggregates, measured = {}, {}, {}
+    fingerprints = {} if fingerprints is None else fingerprints
+    waiting = dict(tasks)
+    draws = []  # Reports calculated but not drawn yet
+    running = {}  # future -> (kind, task)
+
+    # One report draws over every worker itself; several reports are drawn side by side, one process each.
+    # The draw processes are spawned (not forked) since calculation threads are running at the time.
+    draw_pool = None
+    if not data_only and workers > 1 and len(names) > 1:
+        draw_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    with ThreadPoolExecutor(max_workers=workers) as calculators:
+        try:
+            while waiting or draws or running:
+                # Start the ready calculations and draws, longest first, while workers are free
+                ready = [task for task, needs in waiting.items() if all(product in inputs for product in needs)]
+                for task in sorted(ready, key=priorities.get, reverse=True):
+                    if sum(kind == 'task' for kind, _ in running.values()) >= workers:
+                        break
+                    del waiting[task]
+                    running[calculators.submit(run_task, task, inputs, file_path, names, fingerprints)] = ('task', task)
+
+                draws.sort(key=lambda name: costs.get(f'draw:{name}', float('inf')), reverse=True)
+                while draws and draw_pool is not None and sum(kind == 'draw' for kind, _ in running.values()) < workers:
+                    name = draws.pop(0)
+                    running[draw_pool.submit(draw_report_job, name, plain_dicts(aggregates[name]), 1)] = ('draw', name)
+                if draws and draw_pool is None and not running:
+                    name = draws.pop(0)
+                    measured[f'draw:{name}'] = draw_report_job(name, aggregates[name], workers)
+                    print(f"Report '{name}' drawn in {measured[f'draw:{name}']:.2f}s")
+                    continue
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    kind, task = running.pop(future)
+                    if kind == 'draw':
+                        measured[f'draw:{task}'] = future.result()
+                        print(f"Report '{task}' drawn in {measured[f'draw:{task}']:.2f}s")
+                        continue
+
+                    result, measured[task] = future.result()
+                    product_or_report, name = task.split(':')
+                    if product_or_report == 'product':
+                        inputs[name] = result
+                    else:
+                        aggregates[name] = result
+                        if not data_only:
+                            draws.append(name)
+
+                    # Drop the products no remaining task reads
+                    for product in tasks[task]:
+                        refcounts[product] -= 1
+                        if refcounts[product] == 0:
+                            released = inputs.pop(product)
+                            if product == 'data':
+                                forget_derived_columns(released)
+        finally:
+            if draw_pool is not None:
+                draw_pool.shutdown()
+
+    write_costs(costs_path, dict(costs, **measured))
+    if data_only:
+        write_aggregates({name: aggregates[name] for name in names}, data_only, output)
+    return aggregates
+
+# Seconds the watch mode waits between two looks at the input file
+WATCH_INTERVAL = 5.0
+
+# Function to list the (year, month, city) partitions the rows from `start` on fall in (rows without a valid date are skipped)
+def changed_partitions(columns, start):
+    valid = np.asarray(columns['valid'][start:])
+    years, months, cities = (np.asarray(columns[name][start:])[valid].tolist() for name in ['year', 'month', 'city'])
+    return sorted(set(zip(years, months, cities)))
+
+# Function to bring the aggregates of the given reports up to date with the records appended in `years`
+# and redraw them. A report in YEARLY_REPORTS that reads the partial states is calculated from them once
+# they have folded in the appended lines; the other reports in YEARLY_REPORTS recalculate only those years,
+# from their records alone, and keep their other years. The chart cache then redraws only the charts whose
+# year changed. The reports not in YEARLY_REPORTS run over the whole dataset again. Returns the aggregates
+# by report name.
+def refresh_reports(names, file_path, years, aggregates, workers=None, costs_path=COSTS_FILE):
+    refreshed = dict(aggregates)
+    others = [name for name in names if name not in YEARLY_REPORTS]
+    if others:
+        refreshed.update(run_reports(others, file_path, workers, costs_path=costs_path))
+
+    yearly = [name for name in names if name in YEARLY_REPORTS]
+    if not yearly or not years:
+        return refreshed
+
+    # Only the reports reading more than the partial states need the records of the changed years
+    inputs, data = {}, None
+    if any(report_needs(name) == ['partials'] for name in yearly):
+        inputs['partials'] = load_partials(file_path)
+    if any(report_needs(name) != ['partials'] for name in yearly):
+        updated = append_to_cache(file_path)
+        columns = updated[0] if updated is not None else load_dataset(file_path)
+        rows = np.flatnonzero(np.asarray(columns['valid']) & np.isin(np.asarray(columns['year']), years))
+        data = {column: np.asarray(values)[rows] for column, values in columns.items()}
+    try:
+        for name in yearly:
+            started = time.perf_counter()
+            refreshed[name] = dict(aggregates[name])
+            if report_needs(name) == ['partials']:
+                refreshed[name].update(calculate_report(name, inputs))
+            else:
+                refreshed[name].update(calculate_columns(name, data))
+            draw_report_job(name, refreshed[name], workers)
+            print(f"Report '{name}' updated for {', '.join(map(str, years))} in {time.perf_counter() - started:.2f}s")
+    finally:
+        # The selected rows are a throwaway copy; drop the columns derived from them
+        if data is not None:
+            forget_derived_columns(data)
+    return refreshed
+
+# Function to run the given reports over the whole of file_path; returns their aggregates with the
+# fingerprint of the data they were calculated from. When the products were read from different lengths
+# of a file being appended to, that is the shortest, so no appended record is skipped later.
+def rerun_reports(names, file_path, workers=None, costs_path=COSTS_FILE):
+    fingerprints = {}
+    aggregates = run_reports(names, file_path, workers, costs_path=costs_path, fingerprints=fingerprints)
+    read = [fingerprint for fingerprint in fingerprints.values() if fingerprint is not None]
+    return aggregates, min(read, key=lambda fingerprint: fingerprint['size'], default=None)
+
+# Function to keep the given reports up to date with the records appended to file_path, looking every
+# `interval` seconds. The live file is compared with the fingerprint (size, mtime and head and tail hash)
+# of the data the reports were last calculated from: appended JSON Lines records are parsed on their own
+# and added to the parse cache, and only the years they fall in are recalculated and redrawn (e.g. wind.py's
+# wind_speed_{year}.png of the year the new records fall in). A file changed in any other way (rewritten
+# at the same size, truncated, edited) is loaded again in full. Stops after `polls` looks (forever by default).
+def watch_reports(names, file_path, workers=None, costs_path=COSTS_FILE, interval=WATCH_INTERVAL, polls=None):
+    names = select_reports(names)
+    aggregates, seen = rerun_reports(names, file_path, workers, costs_path)
+    while polls is None or polls > 0:
+        time.sleep(interval)
+        polls = None if polls is None else polls - 1
+
+        stat = os.stat(file_path)
+        appended = appended_line_range(file_path, seen, stat) if seen is not None else None
+        if appended is None:
+            print(f"'{file_path}' was rewritten, running every selected report over it again")
+            aggregates, seen = rerun_reports(names, file_path, workers, costs_path)
+            continue
+        start, end = appended
+        if end == start:
+            continue  # Unchanged, or the last appended line is still being written
+
+        # The records the reports have seen are unchanged, so the years to update are those of the appended lines
+        added = parse_line_range(file_path, start, end)
+        partitions = changed_partitions(added, 0)
+        print(f"{len(added['date'])} new records in {len(partitions)} partitions: " +
+              ', '.join(f'{year}-{month:02d} {city}' for year, month, city in partitions[:10]) +
+              (', ...' if len(partitions) > 10 else ''))
+        years = sorted(set(year for year, _, _ in partitions))
+        aggregates = refresh_reports(names, file_path, years, aggregates, workers, costs_path)
+        seen = file_fingerprint(file_path, end, stat.st_mtime_ns)
+
+# Function to add the options of the commands that run reports: the report names, --all, --input, --workers and --costs
+def add_report_args(parser):
+    parser.add_argument('reports', nargs='*', metavar='REPORT', help="Names of the reports to run (see `list`)")
+    parser.add_argument('--all', action='store_true', help="Run every report")
+    parser.add_argument('--input', required=True, metavar='FILE', help="merged_data.json or merged_data.jsonl file to read")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of workers calculating and drawing the reports (default: $STATS_TODAY_WORKERS, else one per CPU)")
+    parser.add_argument('--costs', default=COSTS_FILE, metavar='FILE',
+                        help=f"File the measured task costs are kept in between runs (default: {COSTS_FILE})")
+    return parser
+
+# Function to read the command line: `run` or `watch` (with --all or report names), or `list`
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='stats_today', description="Run the stats_today reports over one dataset.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = add_report_args(commands.add_parser('run', help="Load the dataset once and run the selected reports"))
+    add_data_only_args(run_parser)
+
+    watch_parser = add_report_args(commands.add_parser('watch', help="Run the selected reports, then again whenever records are appended to the input"))
+    watch_parser.add_argument('--interval', type=float, default=WATCH_INTERVAL,
+                              help=f"Seconds between two looks at the input (default: {WATCH_INTERVAL:g})")
+
+    commands.add_parser('list', help="List the report names")
+    return parser.parse_args(argv)
+
+# Main function
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'list':
+        print('\n'.join(REPORTS))
+        return
+
+    if not args.all and not args.reports:
+        sys.exit(f"stats_today {args.command}: give report names or --all (see `python -m stats_today list`)")
+    names = list(REPORTS) if args.all else args.reports
+    try:
+        select_reports(names)
+    except ValueError as error:
+        sys.exit(f"stats_today {args.command}: {error}")
+
+    if args.command == 'watch':
+        try:
+            watch_reports(names, args.input, args.workers, args.costs, args.interval)
+        except KeyboardInterrupt:
+            print("Stopped watching")
+        return
+    run_reports(names, args.input, args.workers, args.data_only, args.output, args.costs)
+
+if __name__ == "__main__":
+    main()
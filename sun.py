@@ -1,110 +1,111 @@
-import json
-import matplotlib.pyplot as plt
 import os
-import shutil
-from collections import defaultdict
-from datetime import datetime
 import calendar
-
-# Function to load data from a JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-# Function to convert sunshine_seconds to hours
+import numpy as np
+from dataset import load_dataset
+from partials import as_partials, partials_by_year_month
+from render import plt, render_cached_charts, chart_template, set_bar_heights, rescale_axes
+from export import write_data_only
+from aggregate import to_year_month_dict
+
+# Function to convert sunshine_seconds to hours (works on single values and whole columns)
 def get_sunshine_duration(sunshine_seconds):
-    return float(sunshine_seconds) / 3600  # Convert seconds to hours
+    return np.asarray(sunshine_seconds, dtype=np.float64) / 3600  # Convert seconds to hours
 
 # Function to process the data and calculate the highest and lowest sunshine hours per year and month
+# (data is loaded columns, a stream of column chunks or prebuilt partial states)
 def calculate_highest_lowest_sunshine_per_year_and_month(data):
-    sunshine_per_year_month = defaultdict(lambda: defaultdict(list))
-
-    for entry in data:
-        date = entry.get('date', '')
-        sunshine_seconds = entry.get('weather', {}).get('sunshine_hours', 0)
-
-        # Convert sunshine hours from seconds to hours
-        sunshine_hours = get_sunshine_duration(sunshine_seconds)
-
-        # Extract year and month from the date
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            month = year_month.month
-            sunshine_per_year_month[year][month].append(sunshine_hours)
-        except ValueError:
-            continue  # Skip invalid date entries
-
-    # Calculate the highest and lowest sunshine hours for each month of each year
-    highest_lowest_sunshine = defaultdict(lambda: defaultdict(dict))
-    for year, months in sunshine_per_year_month.items():
-        for month, sunshine_hours in months.items():
-            highest_lowest_sunshine[year][month]['max_sunshine'] = max(sunshine_hours)
-            highest_lowest_sunshine[year][month]['min_sunshine'] = min(sunshine_hours)
-
-    return highest_lowest_sunshine
-
-# Function to create the 'sunshine_graphs' folder (delete if exists)
+    result = partials_by_year_month(as_partials(data), [('sunshine_hours', 'max'), ('sunshine_hours', 'min')])
+
+    # The partial states keep seconds; convert the monthly highest and lowest to hours
+    return to_year_month_dict(dict(
+        result,
+        max_sunshine=get_sunshine_duration(result['sunshine_hours_max']),
+        min_sunshine=get_sunshine_duration(result['sunshine_hours_min']),
+    ), {
+        'max_sunshine': 'max_sunshine',
+        'min_sunshine': 'min_sunshine',
+    })
+
+# Function to create the 'sunshine_graphs' folder (kept between runs)
 def create_sunshine_graph_folder():
     folder_path = 'sunshine_graphs'
     
-    # If the folder exists, delete it and recreate it
-    if os.path.exists(folder_path):
-        shutil.rmtree(folder_path)
-    
-    # Create a new folder to store graphs
-    os.makedirs(folder_path)
+    # Keep the folder between runs: the chart cache reuses unchanged graphs and removes stale ones
+    os.makedirs(folder_path, exist_ok=True)
     return folder_path
 
+# Function to build the sunshine figure once; every year reuses it with new bar heights
+def build_sunshine_template():
+    months_list = [calendar.month_abbr[month] for month in range(1, 13)]  # Short names of the months
+
+    # Create the figure shared by every year
+    figure = plt.figure(figsize=(10, 6))
+    bar_width = 0.35  # Set the width of the bars
+    index = range(len(months_list))
+
+    # Plot the bars for max sunshine hours and min sunshine hours (all zero until a year fills them in)
+    max_sunshine_bars = plt.bar(index, [0] * 12, bar_width, label='Max Sunshine Hours', color='orange')
+    min_sunshine_bars = plt.bar([i + bar_width for i in index], [0] * 12, bar_width, label='Min Sunshine Hours', color='blue')
+
+    plt.xlabel('Month')
+    plt.ylabel('Sunshine Hours (hrs)')
+    plt.xticks([i + bar_width / 2 for i in index], months_list)  # Center the ticks between the bars
+    plt.legend()
+    return {'figure': figure, 'axes': plt.gca(), 'max_sunshine': max_sunshine_bars, 'min_sunshine': min_sunshine_bars}
+
+# Function to plot and save the sunshine graph of one year as an image_format ('png' or 'svg') file and return its path
+def plot_sunshine_year(year, months, folder_path, image_format='png'):
+    # Prepare the data for the plot
+    max_sunshine_list = []
+    min_sunshine_list = []
+
+    # Get the monthly values (months without records stay at 0)
+    for month in range(1, 13):
+        max_sunshine_list.append(months.get(month, {}).get('max_sunshine', 0))
+        min_sunshine_list.append(months.get(month, {}).get('min_sunshine', 0))
+
+    # Reuse the figure: only the bar heights, y-limits and title change from year to year
+    template = chart_template('sunshine', build_sunshine_template)
+    set_bar_heights(template['max_sunshine'], max_sunshine_list)
+    set_bar_heights(template['min_sunshine'], min_sunshine_list)
+    rescale_axes(template['axes'])
+    template['axes'].set_title(f'Highest and Lowest Sunshine Hours in {year}')
+
+    # Save the figure as a PNG file
+    graph_filename = f"{folder_path}/sunshine_{year}.{image_format}"
+    template['figure'].savefig(graph_filename)
+    return graph_filename
+
 # Function to plot the highest and lowest sunshine hours for all 12 months in one graph for each year
-def plot_and_save_sunshine(highest_lowest_sunshine, folder_path):
-    for year, months in highest_lowest_sunshine.items():
-        # Prepare the data for the plot
-        months_list = []
-        max_sunshine_list = []
-        min_sunshine_list = []
-
-        # Get the short name of the months (Jan, Feb, Mar, etc.) and sunshine data
-        for month in range(1, 13):
-            months_list.append(calendar.month_abbr[month])  # Short name of the month
-            max_sunshine_list.append(months.get(month, {}).get('max_sunshine', 0))
-            min_sunshine_list.append(months.get(month, {}).get('min_sunshine', 0))
-
-        # Create a new figure for the year
-        plt.figure(figsize=(10, 6))
-        bar_width = 0.35  # Set the width of the bars
-        index = range(len(months_list))
-
-        # Plot the bars for max sunshine hours and min sunshine hours
-        plt.bar(index, max_sunshine_list, bar_width, label='Max Sunshine Hours', color='orange')
-        plt.bar([i + bar_width for i in index], min_sunshine_list, bar_width, label='Min Sunshine Hours', color='blue')
-
-        plt.xlabel('Month')
-        plt.ylabel('Sunshine Hours (hrs)')
-        plt.title(f'Highest and Lowest Sunshine Hours in {year}')
-        plt.xticks([i + bar_width / 2 for i in index], months_list)  # Center the ticks between the bars
-        plt.legend()
-
-        # Save the figure as a PNG file
-        graph_filename = f"{folder_path}/sunshine_{year}.png"
-        plt.savefig(graph_filename)
-        plt.close()  # Close the plot to avoid memory issues
+def plot_and_save_sunshine(highest_lowest_sunshine, folder_path, workers=None):
+    # Fan the years out over the render processes; each job only carries that year's monthly values
+    jobs = [(year, months, folder_path) for year, months in highest_lowest_sunshine.items()]
+    return render_cached_charts(plot_sunshine_year, jobs, folder_path, workers)
+
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(highest_lowest_sunshine, workers=None):
+    # Create the 'sunshine_graphs' folder
+    folder_path = create_sunshine_graph_folder()
+
+    # Generate and save sunshine hour graphs for each year
+    plot_and_save_sunshine(highest_lowest_sunshine, folder_path, workers)
+
+    print(f"Sunshine hour graphs saved in '{folder_path}'")
 
 # Main function
 def main():
     # Load data (replace 'data.json' with your file path)
-    data = load_json_data('bar_graphs\\merged_data.json')
+    data = load_dataset('bar_graphs\\merged_data.json')
 
     # Calculate highest and lowest sunshine hours per year and month
     highest_lowest_sunshine = calculate_highest_lowest_sunshine_per_year_and_month(data)
 
-    # Create the 'sunshine_graphs' folder
-    folder_path = create_sunshine_graph_folder()
-
-    # Generate and save sunshine hour graphs for each year
-    plot_and_save_sunshine(highest_lowest_sunshine, folder_path)
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(highest_lowest_sunshine):
+        return
 
-    print(f"Sunshine hour graphs saved in '{folder_path}'")
+    # Draw the charts
+    draw_report(highest_lowest_sunshine)
 
 if __name__ == "__main__":
     main()
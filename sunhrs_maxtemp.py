@@ -1,87 +1,84 @@
-import json
 import os
-import matplotlib.pyplot as plt
+from render import plt, render_cached_charts, chart_template, set_bar_heights, rescale_axes
 import calendar
-from collections import defaultdict
-from datetime import datetime
-import shutil
+from dataset import load_dataset
+from export import write_data_only
+from specs import REPORT_SPECS, evaluate_specs
 
-# Load data from JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-# Create folder if not exists, or delete and recreate if it exists
+# Function to create the folder if it doesn't exist (kept between runs)
 def create_folder(folder_name):
-    if os.path.exists(folder_name):
-        shutil.rmtree(folder_name)  # Delete the existing folder and its contents
-    os.makedirs(folder_name)  # Create a new folder
-
-# Load data and create folder
-data = load_json_data('bar_line\\merged_data.json')  # Replace with your actual file path
-create_folder('graphs_sunshine_temperature')  # Folder to store this specific plot
+    # Keep the folder between runs: the chart cache reuses unchanged graphs and removes stale ones
+    os.makedirs(folder_name, exist_ok=True)
+    return folder_name
 
 # Process data to get sunshine hours and temperature max
 def calculate_sunshine_temperature(data):
-    monthly_data = defaultdict(lambda: defaultdict(list))
-
-    def get_sunshine_duration(sunshine_seconds):
-        return sunshine_seconds / 3600
-
-    for entry in data:
-        date = entry.get('date', '')
-        sunshine_seconds = entry.get('weather', {}).get('sunshine_hours', 0)
-        temperature_max = entry.get('weather', {}).get('temperature_max', 0)
-
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            month = year_month.month
-            monthly_data[year][month].append({
-                'sunshine_hours': get_sunshine_duration(sunshine_seconds),
-                'temperature_max': temperature_max,
-            })
-        except ValueError:
-            continue  # Skip invalid date entries
-
-    year_month_averages = defaultdict(lambda: defaultdict(dict))
-    for year, months in monthly_data.items():
-        for month, values in months.items():
-            avg_sunshine_hours = sum(entry['sunshine_hours'] for entry in values) / len(values)
-            avg_temperature_max = sum(entry['temperature_max'] for entry in values) / len(values)
-            year_month_averages[year][month] = {
-                'avg_sunshine_hours': avg_sunshine_hours,
-                'avg_temperature_max': avg_temperature_max,
-            }
-
-    return year_month_averages
-
-# Plot the graph
-def plot_sunshine_temperature(year_month_averages):
-    for year, months in year_month_averages.items():
-        months_list = [calendar.month_abbr[i] for i in range(1, 13)]
-        avg_sunshine_hours_list = [months.get(i, {}).get('avg_sunshine_hours', 0) for i in range(1, 13)]
-        avg_temperature_max_list = [months.get(i, {}).get('avg_temperature_max', 0) for i in range(1, 13)]
-
-        fig, ax1 = plt.subplots(figsize=(10, 6))
-
-        ax2 = ax1.twinx()
-        ax2.plot(months_list, avg_sunshine_hours_list, label='Sunshine Hours', color='orange', marker='o', linestyle='-', linewidth=2)
-        ax2.set_ylabel('Sunshine Hours (h)', color='orange')
-        ax2.tick_params(axis='y', labelcolor='orange')
-
-        ax1.bar(months_list, avg_temperature_max_list, label='Max Temperature (°C)', color='purple', alpha=0.6)
-        ax1.set_xlabel('Month')
-        ax1.set_ylabel('Max Temperature (°C)', color='purple')
-        ax1.tick_params(axis='y', labelcolor='purple')
-
-        plt.title(f'Sunshine Hours & Max Temperature in {year}')
-        ax1.legend(loc='upper left')
-        ax2.legend(loc='upper right')
-
-        plt.savefig(f'graphs_sunshine_temperature/sunshine_temperature_{year}.png')
-        plt.close()
-
-# Calculate and plot
-year_month_averages = calculate_sunshine_temperature(data)
-plot_sunshine_temperature(year_month_averages)
+    # The bar and line fields are declared in specs.REPORT_SPECS; see specs.evaluate_specs
+    return evaluate_specs(data, ['sunhrs_maxtemp'])['sunhrs_maxtemp']
+
+# Function to build the sunshine and temperature figure once; every year reuses it with new bar heights and line data
+def build_sunshine_temperature_template():
+    months_list = [calendar.month_abbr[i] for i in range(1, 13)]
+
+    # Create the figure shared by every year
+    fig, ax1 = plt.subplots(figsize=(10, 6))
+
+    ax2 = ax1.twinx()
+    line, = ax2.plot(months_list, [0] * 12, label='Sunshine Hours', color='orange', marker='o', linestyle='-', linewidth=2)
+    ax2.set_ylabel('Sunshine Hours (h)', color='orange')
+    ax2.tick_params(axis='y', labelcolor='orange')
+
+    bars = ax1.bar(months_list, [0] * 12, label='Max Temperature (°C)', color='purple', alpha=0.6)
+    ax1.set_xlabel('Month')
+    ax1.set_ylabel('Max Temperature (°C)', color='purple')
+    ax1.tick_params(axis='y', labelcolor='purple')
+
+    ax1.legend(loc='upper left')
+    ax2.legend(loc='upper right')
+    return {'figure': fig, 'bar_axes': ax1, 'line_axes': ax2, 'bars': bars, 'line': line}
+
+# Function to plot and save the graph of one year as an image_format ('png' or 'svg') file and return its path
+def plot_sunshine_temperature_year(year, months, folder_path, image_format='png'):
+    avg_sunshine_hours_list = [months.get(i, {}).get('avg_sunshine_hours', 0) for i in range(1, 13)]
+    avg_temperature_max_list = [months.get(i, {}).get('avg_temperature_max', 0) for i in range(1, 13)]
+
+    # Reuse the figure: only the bar heights, line data, y-limits and title change from year to year
+    template = chart_template('sunhrs_maxtemp', build_sunshine_temperature_template)
+    set_bar_heights(template['bars'], avg_temperature_max_list)
+    template['line'].set_ydata(avg_sunshine_hours_list)
+    rescale_axes(template['bar_axes'], template['line_axes'])
+    template['line_axes'].set_title(f'Sunshine Hours & Max Temperature in {year}')  # The title sits on the twin axes, as plt.title did
+
+    graph_filename = f"{folder_path}/sunshine_temperature_{year}.{image_format}"
+    template['figure'].savefig(graph_filename)
+    return graph_filename
+
+# Plot the graph of each year
+def plot_sunshine_temperature(year_month_averages, folder_path, workers=None):
+    # Fan the years out over the render processes; each job only carries that year's monthly values
+    jobs = [(year, months, folder_path) for year, months in year_month_averages.items()]
+    return render_cached_charts(plot_sunshine_temperature_year, jobs, folder_path, workers)
+
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(year_month_averages, workers=None):
+    # Create the folder and plot
+    folder_path = create_folder(REPORT_SPECS['sunhrs_maxtemp']['folder'])  # Folder to store this specific plot
+    plot_sunshine_temperature(year_month_averages, folder_path, workers)
+
+# Main function
+def main():
+    # Load data (replace with your actual file path)
+    data = load_dataset('bar_line\\merged_data.json')
+
+    # Calculate the monthly sunshine hours and max temperature per year
+    year_month_averages = calculate_sunshine_temperature(data)
+
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(year_month_averages):
+        return
+
+    # Draw the charts
+    draw_report(year_month_averages)
+
+if __name__ == "__main__":
+    main()
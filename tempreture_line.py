@@ -1,106 +1,105 @@
-import json
-import matplotlib.pyplot as plt
 import os
-import shutil
-from collections import defaultdict
-from datetime import datetime
 import calendar
-
-# Function to load data from a JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
+from dataset import load_dataset
+from partials import as_partials, partials_by_year_month
+from render import plt, render_cached_charts, chart_template, rescale_axes
+from export import write_data_only
+from aggregate import to_year_month_dict
 
 # Function to process the data and calculate average temperatures per year and month
+# (data is loaded columns, a stream of column chunks or prebuilt partial states)
 def calculate_avg_temperatures_per_year_and_month(data):
-    temp_per_year_month = defaultdict(lambda: defaultdict(lambda: {'temperature_max': [], 'temperature_min': [], 'temperature_mean': []}))
-
-    for entry in data:
-        date = entry.get('date', '')
-        temperature_max = entry.get('weather', {}).get('temperature_max', 0)
-        temperature_min = entry.get('weather', {}).get('temperature_min', 0)
-        temperature_mean = entry.get('weather', {}).get('temperature_mean', 0)
-
-        # Extract year and month from the date
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            month = year_month.month
-            temp_per_year_month[year][month]['temperature_max'].append(temperature_max)
-            temp_per_year_month[year][month]['temperature_min'].append(temperature_min)
-            temp_per_year_month[year][month]['temperature_mean'].append(temperature_mean)
-        except ValueError:
-            continue  # Skip invalid date entries
-
-    # Calculate average temperatures for each month of each year
-    avg_temperatures = defaultdict(lambda: defaultdict(dict))
-    for year, months in temp_per_year_month.items():
-        for month, temps in months.items():
-            avg_temperatures[year][month]['temperature_max'] = sum(temps['temperature_max']) / len(temps['temperature_max']) if temps['temperature_max'] else 0
-            avg_temperatures[year][month]['temperature_min'] = sum(temps['temperature_min']) / len(temps['temperature_min']) if temps['temperature_min'] else 0
-            avg_temperatures[year][month]['temperature_mean'] = sum(temps['temperature_mean']) / len(temps['temperature_mean']) if temps['temperature_mean'] else 0
-
-    return avg_temperatures
-
-# Function to create the 'temperature_graphs' folder (delete if exists)
+    result = partials_by_year_month(as_partials(data), [
+        ('temperature_max', 'mean'),
+        ('temperature_min', 'mean'),
+        ('temperature_mean', 'mean'),
+    ])
+
+    return to_year_month_dict(result, {
+        'temperature_max': 'temperature_max_mean',
+        'temperature_min': 'temperature_min_mean',
+        'temperature_mean': 'temperature_mean_mean',
+    })
+
+# Function to create the 'temperature_graphs' folder (kept between runs)
 def create_temperature_graph_folder():
     folder_path = 'temperature_graphs'
     
-    # If the folder exists, delete it and recreate it
-    if os.path.exists(folder_path):
-        shutil.rmtree(folder_path)
-    
-    # Create a new folder to store graphs
-    os.makedirs(folder_path)
+    # Keep the folder between runs: the chart cache reuses unchanged graphs and removes stale ones
+    os.makedirs(folder_path, exist_ok=True)
     return folder_path
 
+# Function to build the temperature figure once; every year reuses it with new line data
+def build_temperature_template():
+    months_list = [calendar.month_abbr[month] for month in range(1, 13)]  # Short names of the months
+
+    # Create the figure shared by every year
+    figure = plt.figure(figsize=(10, 6))
+    max_temp_line, = plt.plot(months_list, [0] * 12, label='Max Temperature', marker='o', color='red')
+    min_temp_line, = plt.plot(months_list, [0] * 12, label='Min Temperature', marker='o', color='blue')
+    mean_temp_line, = plt.plot(months_list, [0] * 12, label='Mean Temperature', marker='o', color='green')
+
+    plt.xlabel('Month')
+    plt.ylabel('Temperature (°C)')
+    plt.legend()
+    return {'figure': figure, 'axes': plt.gca(), 'max_temp': max_temp_line, 'min_temp': min_temp_line, 'mean_temp': mean_temp_line}
+
+# Function to plot and save the temperature graph of one year as an image_format ('png' or 'svg') file and return its path
+def plot_temperature_averages_year(year, months, folder_path, image_format='png'):
+    # Prepare the data for the plot
+    max_temp_list = []
+    min_temp_list = []
+    mean_temp_list = []
+
+    # Get the monthly temperature data (months without records stay at 0)
+    for month in range(1, 13):
+        max_temp_list.append(months.get(month, {}).get('temperature_max', 0))
+        min_temp_list.append(months.get(month, {}).get('temperature_min', 0))
+        mean_temp_list.append(months.get(month, {}).get('temperature_mean', 0))
+
+    # Reuse the figure: only the line data, y-limits and title change from year to year
+    template = chart_template('temperature', build_temperature_template)
+    template['max_temp'].set_ydata(max_temp_list)
+    template['min_temp'].set_ydata(min_temp_list)
+    template['mean_temp'].set_ydata(mean_temp_list)
+    rescale_axes(template['axes'])
+    template['axes'].set_title(f'Average Temperatures in {year}')
+
+    # Save the figure as a PNG file
+    graph_filename = f"{folder_path}/temperature_{year}.{image_format}"
+    template['figure'].savefig(graph_filename)
+    return graph_filename
+
 # Function to plot the temperature averages for all 12 months in one graph for each year
-def plot_and_save_temperature_averages(avg_temperatures, folder_path):
-    for year, months in avg_temperatures.items():
-        # Prepare the data for the plot
-        months_list = []
-        max_temp_list = []
-        min_temp_list = []
-        mean_temp_list = []
-
-        # Get the short name of the months (Jan, Feb, Mar, etc.) and temperature data
-        for month in range(1, 13):
-            months_list.append(calendar.month_abbr[month])  # Short name of the month
-            max_temp_list.append(months.get(month, {}).get('temperature_max', 0))
-            min_temp_list.append(months.get(month, {}).get('temperature_min', 0))
-            mean_temp_list.append(months.get(month, {}).get('temperature_mean', 0))
-
-        # Create a new figure for the year
-        plt.figure(figsize=(10, 6))
-        plt.plot(months_list, max_temp_list, label='Max Temperature', marker='o', color='red')
-        plt.plot(months_list, min_temp_list, label='Min Temperature', marker='o', color='blue')
-        plt.plot(months_list, mean_temp_list, label='Mean Temperature', marker='o', color='green')
-
-        plt.xlabel('Month')
-        plt.ylabel('Temperature (°C)')
-        plt.title(f'Average Temperatures in {year}')
-        plt.legend()
-
-        # Save the figure as a PNG file
-        graph_filename = f"{folder_path}/temperature_{year}.png"
-        plt.savefig(graph_filename)
-        plt.close()  # Close the plot to avoid memory issues
+def plot_and_save_temperature_averages(avg_temperatures, folder_path, workers=None):
+    # Fan the years out over the render processes; each job only carries that year's monthly values
+    jobs = [(year, months, folder_path) for year, months in avg_temperatures.items()]
+    return render_cached_charts(plot_temperature_averages_year, jobs, folder_path, workers)
+
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(avg_temperatures, workers=None):
+    # Create the 'temperature_graphs' folder
+    folder_path = create_temperature_graph_folder()
+
+    # Generate and save temperature graphs for each year
+    plot_and_save_temperature_averages(avg_temperatures, folder_path, workers)
+
+    print(f"Temperature graphs saved in '{folder_path}'")
 
 # Main function
 def main():
     # Load data (replace 'data.json' with your file path)
-    data = load_json_data('bar_graphs\\merged_data.json')
+    data = load_dataset('bar_graphs\\merged_data.json')
 
     # Calculate average temperatures per year and month
     avg_temperatures = calculate_avg_temperatures_per_year_and_month(data)
 
-    # Create the 'temperature_graphs' folder
-    folder_path = create_temperature_graph_folder()
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(avg_temperatures):
+        return
 
-    # Generate and save temperature graphs for each year
-    plot_and_save_temperature_averages(avg_temperatures, folder_path)
-
-    print(f"Temperature graphs saved in '{folder_path}'")
+    # Draw the charts
+    draw_report(avg_temperatures)
 
 if __name__ == "__main__":
     main()
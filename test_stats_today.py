@@ -0,0 +1,612 @@
+import os
+import json
+import random
+import time
+import urllib.request
+import urllib.error
+import threading
+from collections import defaultdict
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import serve
+import stats_today
+import dataset
+from partials import build_partials, load_partials, partials_by_year_month, PARTIAL_FIELDS
+from dataset import load_dataset, records_to_columns
+
+CITIES = ['Lima', 'Quito', 'Tokyo', 'Izmir', 'Naples']
+WEATHER_FIELDS = [
+    'rain_sum', 'snowfall_sum', 'wind_speed_max', 'sunshine_hours', 'precipitation_hours',
+    'temperature_max', 'temperature_min', 'temperature_mean',
+]
+
+# Function to make records like the merged data files hold, with the odd ones the loader has to cope
+# with: unpadded and invalid dates, missing or non-string cities, missing weather fields and values in
+# the gaps between the category bins
+def make_records(count, seed=7, years=(2019, 2020, 2021)):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        year, month, day = rng.choice(years), rng.randint(1, 12), rng.randint(1, 28)
+        date = rng.choice([f'{year}-{month:02d}-{day:02d}'] * 6 + [f'{year}-{month}-{day}', '', 'not a date', f'{year}-02-30'])
+        record = {
+            'date': date,
+            'time': f'{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}',
+            'magnitude': rng.choice([1, 2, 2.5, 3, 4.2, 5, 6.1, round(rng.uniform(0, 8), 2)]),
+            'elevation': rng.choice([5, 10.5, 20, 45, 75, 95, round(rng.uniform(0, 120), 1)]),
+        }
+        city = rng.choice(CITIES * 2 + ['', None, 42, 'missing'])
+        if city != 'missing':
+            record['city'] = city
+        weather = {
+            'rain_sum': rng.choice([0, 3, 5.5, 7, 10, 12.3, round(rng.uniform(0, 20), 1)]),
+            'snowfall_sum': rng.choice([0, 0, round(rng.uniform(0, 15), 1)]),
+            'wind_speed_max': round(rng.uniform(0, 60), 1),
+            'sunshine_hours': round(rng.uniform(0, 43200), 1),
+            'precipitation_hours': rng.randint(0, 24),
+            'temperature_max': round(rng.uniform(5, 40), 1),
+            'temperature_min': round(rng.uniform(-10, 15), 1),
+            'temperature_mean': round(rng.uniform(0, 25), 1),
+        }
+        if rng.random() < 0.1:
+            del weather[rng.choice(WEATHER_FIELDS)]
+        if rng.random() < 0.97:
+            record['weather'] = weather
+        records.append(record)
+    return records
+
+# Function to write records as a JSON array (.json) or JSON Lines (.jsonl) file
+def write_records(path, records):
+    with open(path, 'w') as f:
+        if str(path).endswith('.jsonl'):
+            f.writelines(json.dumps(record) + '\n' for record in records)
+        else:
+            json.dump(records, f)
+    return str(path)
+
+# Function to check two sets of columns hold the same records
+def assert_same_columns(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for name in expected:
+        assert np.array_equal(np.asarray(actual[name]), np.asarray(expected[name])), name
+
+# Function to turn an aggregate into plain dicts, lists and Python numbers
+def plain(value):
+    if isinstance(value, dict):
+        return {key.item() if isinstance(key, np.generic) else key: plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+# Function to check two aggregates hold the same keys and (up to float rounding) the same values
+def assert_close(actual, expected, path='aggregate'):
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict), path
+        assert sorted(actual, key=str) == sorted(expected, key=str), path
+        for key in expected:
+            assert_close(actual[key], expected[key], f'{path}[{key!r}]')
+    elif isinstance(expected, (list, tuple)):
+        assert len(actual) == len(expected), path
+        for position, (actual_item, expected_item) in enumerate(zip(actual, expected)):
+            assert_close(actual_item, expected_item, f'{path}[{position}]')
+    elif isinstance(expected, float):
+        assert actual == pytest.approx(expected, rel=1e-9, abs=1e-9), path
+    else:
+        assert actual == expected, path
+
+# The per-record loops of the original scripts, which the loader and the vectorized aggregates must reproduce
+
+# Function to get a record's (year, month) as the original scripts parsed it, or None for an invalid date
+def baseline_year_month(record):
+    try:
+        parsed = datetime.strptime(record.get('date', ''), "%Y-%m-%d")
+    except ValueError:
+        return None
+    return parsed.year, parsed.month
+
+# Function to read a field the way the original scripts did: magnitude and elevation from the record,
+# everything else from its weather block (sunshine_duration is sunshine_hours in hours)
+def baseline_field(record, field):
+    if field in ['magnitude', 'elevation']:
+        return record.get(field, 0)
+    if field == 'sunshine_duration':
+        return float(record.get('weather', {}).get('sunshine_hours', 0)) / 3600
+    return record.get('weather', {}).get(field, 0)
+
+# Function to collect a field's values per year and month in file order
+def baseline_values(records, field):
+    values = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        year_month = baseline_year_month(record)
+        if year_month is not None:
+            values[year_month[0]][year_month[1]].append(baseline_field(record, field))
+    return values
+
+def baseline_classify_magnitude(magnitude):
+    if magnitude <= 2:
+        return 'Low_Magnitude'
+    elif 3 <= magnitude <= 5:
+        return 'Medium_Magnitude'
+    elif magnitude >= 5:
+        return 'High_Magnitude'
+    return None
+
+def baseline_classify_rainfall(rain_sum):
+    if rain_sum <= 5:
+        return 'Low_rainfall'
+    elif 6 <= rain_sum <= 10:
+        return 'Medium_rainfall'
+    elif rain_sum >= 10:
+        return 'High_rainfall'
+    return None
+
+def baseline_classify_elevation(elevation):
+    if elevation <= 10:
+        return 'Below_Sea_Level'
+    elif 11 <= elevation <= 30:
+        return 'Sea_Level'
+    elif 31 <= elevation <= 60:
+        return 'Ground_Level'
+    elif 61 <= elevation <= 90:
+        return 'Ground_Level_Mid'
+    elif elevation > 90:
+        return 'Ground_Level_High'
+    return None
+
+# Function to apply per-month statistics to one field's values: {name: function of the month's values}
+def baseline_monthly(records, field, statistics):
+    return {
+        year: {month: {name: statistic(values) for name, statistic in statistics.items()} for month, values in months.items()}
+        for year, months in baseline_values(records, field).items()
+    }
+
+def baseline_mean(values):
+    return sum(values) / len(values)
+
+# What each original dual-axis script aggregated per month: (field, statistic, name) of its bars and its line
+BASELINE_SPEC_FIELDS = {
+    'elevationwind': [('wind_speed_max', baseline_mean, 'avg_wind_speed'), ('elevation', baseline_mean, 'avg_elevation')],
+    'mag_precipitation': [('precipitation_hours', baseline_mean, 'avg_precipitation_hours'), ('magnitude', baseline_mean, 'avg_magnitude')],
+    'rain_magnitude': [('rain_sum', sum, 'total_rain_sum'), ('magnitude', baseline_mean, 'average_magnitude')],
+    'rainsnow': [('snowfall_sum', sum, 'total_snowfall'), ('rain_sum', sum, 'total_rainfall')],
+    'snow_windspeed': [('snowfall_sum', sum, 'total_snowfall_sum'), ('wind_speed_max', max, 'max_wind_speed')],
+    'sun_precipitation': [('precipitation_hours', sum, 'total_precipitation_hours'), ('sunshine_duration', baseline_mean, 'avg_sunshine_hours')],
+    'sunhrs_maxtemp': [('temperature_max', baseline_mean, 'avg_temperature_max'), ('sunshine_duration', baseline_mean, 'avg_sunshine_hours')],
+    'temp_mag': [('temperature_mean', baseline_mean, 'avg_temperature_mean'), ('magnitude', baseline_mean, 'avg_magnitude')],
+    'temp_windspeed': [('wind_speed_max', baseline_mean, 'avg_wind_speed'), ('temperature_mean', baseline_mean, 'avg_temperature_mean')],
+    'tempreture_rain': [('rain_sum', sum, 'total_rain_sum'), ('temperature_mean', baseline_mean, 'avg_temperature_mean')],
+}
+
+# Function to compute one of the dual-axis reports as its original script did
+def baseline_spec_report(records, report):
+    result = defaultdict(lambda: defaultdict(dict))
+    for field, statistic, name in BASELINE_SPEC_FIELDS[report]:
+        for year, months in baseline_values(records, field).items():
+            for month, values in months.items():
+                result[year][month][name] = statistic(values)
+    return result
+
+# Function to count categories per year and city in the original scripts' order (cities with a plain name only)
+def baseline_city_categories(records, classify, field):
+    counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for record in records:
+        city = record.get('city', None)
+        year_month = baseline_year_month(record)
+        if not city or not isinstance(city, str) or year_month is None:
+            continue
+        category = classify(baseline_field(record, field))
+        if category:
+            counts[year_month[0]][city][category] += 1
+    return counts
+
+BASELINE_REPORTS = {
+    'wind': lambda records: baseline_monthly(records, 'wind_speed_max', {'max_wind_speed': max, 'actual_wind_speed': lambda values: values[0]}),
+    'magnitudes': lambda records: baseline_monthly(records, 'magnitude', {'max_magnitude': max, 'min_magnitude': min}),
+    'sun': lambda records: baseline_monthly(records, 'sunshine_duration', {'max_sunshine': max, 'min_sunshine': min}),
+    'citymag': lambda records: baseline_city_categories(records, baseline_classify_magnitude, 'magnitude'),
+    'citys_rainfall': lambda records: baseline_city_categories(records, baseline_classify_rainfall, 'rain_sum'),
+}
+
+@pytest.fixture(scope='module')
+def records():
+    return make_records(1500)
+
+@pytest.fixture(scope='module')
+def columns(records, tmp_path_factory):
+    return load_dataset(write_records(tmp_path_factory.mktemp('data') / 'merged_data.json', records), use_cache=False)
+
+def test_loader_reads_the_odd_records(records, columns):
+    assert len(columns['date']) == len(records)
+    assert columns['magnitude'].dtype == np.float64
+    for row, record in enumerate(records):
+        city = record.get('city', '')
+        assert columns['city'][row] == (city if isinstance(city, str) else '')
+        assert columns['hour'][row] == int(record['time'].split(':')[0])
+        for field in ['magnitude', 'elevation', 'rain_sum', 'snowfall_sum', 'wind_speed_max', 'sunshine_hours', 'temperature_max']:
+            assert columns[field][row] == baseline_field(record, field), field
+        year_month = baseline_year_month(record)
+        assert bool(columns['valid'][row]) == (year_month is not None)
+        if year_month is not None:
+            assert (columns['year'][row], columns['month'][row]) == year_month
+
+# Function to rewrite a file in place at the same size (one city letter changed) with a newer mtime
+def rewrite_same_size(path):
+    with open(path, 'rb') as f:
+        content = bytearray(f.read())
+    position = content.index(b'"city": "', len(content) // 2) + len(b'"city": "')
+    content[position] = ord('X') if content[position] != ord('X') else ord('Y')
+    stat = os.stat(path)
+    with open(path, 'wb') as f:
+        f.write(bytes(content))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+# Function to cut a file down to its first half of complete lines
+def truncate(path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    with open(path, 'wb') as f:
+        f.write(content[:content.index(b'\n', len(content) // 2) + 1])
+
+def test_cache_is_reused_until_the_file_changes(records, tmp_path):
+    path = write_records(tmp_path / 'merged_data.json', records)
+    parsed = load_dataset(path)
+    cached = load_dataset(path)
+    assert isinstance(cached['date'], np.memmap)
+    assert_same_columns(cached, parsed)
+
+    rewrite_same_size(path)
+    reloaded = load_dataset(path)
+    assert not isinstance(reloaded['date'], np.memmap)
+    assert_same_columns(reloaded, load_dataset(path, use_cache=False))
+
+def test_streamed_chunks_hold_every_record(records, tmp_path):
+    path = write_records(tmp_path / 'merged_data.json', records)
+    chunks = list(dataset.iter_column_chunks(path, chunk_size=100))
+    assert [len(chunk['date']) for chunk in chunks] == [100] * 15
+    assert_same_columns(dataset.concat_columns(chunks), records_to_columns(records))
+    assert_same_columns(load_dataset(path, use_cache=False), records_to_columns(records))
+
+@pytest.fixture
+def jsonl_file(tmp_path):
+    return write_records(tmp_path / 'merged_data.jsonl', make_records(400, seed=11))
+
+def test_jsonl_ranges_parse_like_the_whole_file(monkeypatch, jsonl_file):
+    monkeypatch.setattr(dataset, 'JSONL_MIN_RANGE_BYTES', 1000)
+    assert len(dataset.split_line_ranges(jsonl_file, 3)) == 3
+    assert_same_columns(dataset.load_jsonl_columns(jsonl_file, workers=3), records_to_columns(make_records(400, seed=11)))
+
+def test_jsonl_leaves_out_a_line_being_written(jsonl_file):
+    line = json.dumps(make_records(1, seed=13)[0])
+    with open(jsonl_file, 'a') as f:
+        f.write(line[:20])
+    assert len(load_dataset(jsonl_file, use_cache=False)['date']) == 400
+
+    # A whole record that only lacks its newline ends a finished file
+    with open(jsonl_file, 'a') as f:
+        f.write(line[20:])
+    assert len(load_dataset(jsonl_file, use_cache=False)['date']) == 401
+
+def test_dates_decode_like_strptime():
+    dates = ['2020-01-31', '2020-02-29', '2019-02-29', '2021-12-31', '2021-13-01', '2021-00-10', '2021-04-31',
+             '2020-1-5', '2020-01-5', '0000-01-01', '1900-02-29', '2000-02-29', ' 2020-01-01', '2020/01/01', '', 'not a date']
+    decoded = dataset.decode_dates(np.array(dates))
+    for position, date in enumerate(dates):
+        try:
+            parsed = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            parsed = None
+        assert bool(decoded['valid'][position]) == (parsed is not None), date
+        if parsed is not None:
+            assert (decoded['year'][position], decoded['month'][position], decoded['day'][position]) == (parsed.year, parsed.month, parsed.day)
+            assert decoded['year_month'][position] == parsed.year * 12 + parsed.month - 1
+            assert decoded['day_number'][position] == (parsed - datetime(1970, 1, 1)).days
+
+def test_pie_chart_counts_match_baseline_loop(records, columns):
+    pie_counts = plain(stats_today.calculate_columns('earthquake', columns))
+    magnitudes = {}
+    rainfall = {}
+    by_elevation = {}
+    for record in records:
+        magnitude = baseline_classify_magnitude(record['magnitude'])
+        if magnitude:
+            magnitudes[magnitude] = magnitudes.get(magnitude, 0) + 1
+            elevation = baseline_classify_elevation(record['elevation'])
+            if elevation:
+                counts = by_elevation.setdefault(elevation, {})
+                counts[magnitude] = counts.get(magnitude, 0) + 1
+        rain = baseline_classify_rainfall(baseline_field(record, 'rain_sum'))
+        if rain:
+            rainfall[rain] = rainfall.get(rain, 0) + 1
+    assert {label: count for label, count in pie_counts['magnitude'].items() if count} == magnitudes
+    assert {label: count for label, count in pie_counts['rainfall'].items() if count} == rainfall
+    for elevation, counts in by_elevation.items():
+        assert {label: count for label, count in pie_counts['magnitude_by_elevation'][elevation].items() if count} == counts
+
+@pytest.mark.parametrize('name', sorted(BASELINE_REPORTS))
+def test_report_matches_baseline_loop(name, records, columns):
+    result = plain(stats_today.calculate_columns(name, columns))
+    assert_close(result, plain(BASELINE_REPORTS[name](records)))
+
+def test_temperature_averages_match_baseline_loop(records, columns):
+    expected = defaultdict(lambda: defaultdict(dict))
+    for field in ['temperature_max', 'temperature_min', 'temperature_mean']:
+        for year, months in baseline_values(records, field).items():
+            for month, values in months.items():
+                expected[year][month][field] = baseline_mean(values)
+    assert_close(plain(stats_today.calculate_columns('tempreture_line', columns)), plain(expected))
+
+def test_magnitude_elevation_matches_baseline_loop(records, columns):
+    result, classes = stats_today.calculate_columns('magnitude_elev', columns)
+    assert classes == ['Below_Sea_Level', 'Sea_Level', 'Ground_Level', 'Ground_Level_Mid', 'Ground_Level_High']
+    magnitudes = baseline_values(records, 'magnitude')
+    elevations = baseline_values(records, 'elevation')
+    assert sorted(result) == sorted(magnitudes)
+    for year, months in magnitudes.items():
+        assert sorted(result[year]) == sorted(months)
+        for month, values in months.items():
+            assert result[year][month]['avg_magnitude'] == pytest.approx(baseline_mean(values))
+            # The original took the mode through a set, so ties between classes could go either way
+            month_classes = [baseline_classify_elevation(elevation) for elevation in elevations[year][month]]
+            top = max(month_classes.count(elevation_class) for elevation_class in month_classes)
+            assert month_classes.count(result[year][month]['elevation_class']) == top
+
+def test_rainfall_categories_match_baseline_loop(records, columns):
+    expected = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for record in records:
+        year_month = baseline_year_month(record)
+        category = baseline_classify_rainfall(baseline_field(record, 'rain_sum'))
+        if year_month is not None and category:
+            expected[year_month[0]][year_month[1]][category] += 1
+    assert_close(plain(stats_today.calculate_columns('rainbargraph', columns)), plain(expected))
+
+@pytest.mark.parametrize('name', ['citymag', 'citys_rainfall'])
+def test_city_charts_follow_each_years_order(name, records, columns):
+    result = stats_today.calculate_columns(name, columns)
+    expected = BASELINE_REPORTS[name](records)
+    for year in expected:
+        assert list(result[year]) == list(expected[year])
+
+@pytest.mark.parametrize('report', sorted(BASELINE_SPEC_FIELDS))
+def test_spec_report_matches_baseline_loop(report, records, columns):
+    assert_close(plain(stats_today.calculate_columns(report, columns)), plain(baseline_spec_report(records, report)))
+
+# Function to append records to a JSON Lines file
+def append_records(path, records):
+    with open(path, 'a') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+
+def test_cache_takes_appended_lines(jsonl_file):
+    before = len(load_dataset(jsonl_file)['date'])
+    append_records(jsonl_file, make_records(50, seed=12))
+    columns, rows, fingerprint = dataset.append_to_cache(jsonl_file)
+    assert rows == before
+    assert len(columns['date']) == before + 50
+    assert fingerprint == dataset.cache_fingerprint(jsonl_file) == dataset.file_fingerprint(jsonl_file)
+    assert_same_columns(load_dataset(jsonl_file), load_dataset(jsonl_file, use_cache=False))
+
+def test_cache_waits_for_the_last_line(jsonl_file):
+    before = len(load_dataset(jsonl_file)['date'])
+    size = os.path.getsize(jsonl_file)
+    line = json.dumps(make_records(1, seed=13)[0]) + '\n'
+    with open(jsonl_file, 'a') as f:
+        f.write(line[:20])
+    assert dataset.appended_line_range(jsonl_file, dataset.cache_fingerprint(jsonl_file)) == (size, size)
+    columns, rows, _ = dataset.append_to_cache(jsonl_file)
+    assert rows == len(columns['date']) == before
+
+    with open(jsonl_file, 'a') as f:
+        f.write(line[20:])
+    columns, rows, _ = dataset.append_to_cache(jsonl_file)
+    assert (rows, len(columns['date'])) == (before, before + 1)
+
+def test_cache_skips_no_record_appended_during_a_load(monkeypatch, jsonl_file):
+    # Lines appended while the file is parsed are left for the next append pass, not taken twice
+    load_jsonl_columns = dataset.load_jsonl_columns
+    def append_then_parse(file_path, *args):
+        append_records(file_path, make_records(30, seed=16))
+        return load_jsonl_columns(file_path, *args)
+    monkeypatch.setattr(dataset, 'load_jsonl_columns', append_then_parse)
+    columns, fingerprint = dataset.read_dataset(jsonl_file)
+    monkeypatch.undo()
+
+    assert len(columns['date']) == 400
+    assert fingerprint['size'] < os.path.getsize(jsonl_file)
+    columns, rows, _ = dataset.append_to_cache(jsonl_file)
+    assert (rows, len(columns['date'])) == (400, 430)
+    assert_same_columns(columns, load_dataset(jsonl_file, use_cache=False))
+
+@pytest.mark.parametrize('change', [rewrite_same_size, truncate])
+def test_cache_reloads_a_rewritten_file(change, jsonl_file):
+    load_dataset(jsonl_file)
+    change(jsonl_file)
+    assert dataset.append_to_cache(jsonl_file) is None
+    assert_same_columns(load_dataset(jsonl_file), load_dataset(jsonl_file, use_cache=False))
+
+# Function to run the watch mode over a file, making one change to it before each look, and record
+# which reports were run in full and which years were recalculated
+def watch_changes(monkeypatch, file_path, changes, names=('wind', 'earthquake')):
+    calls = []
+    monkeypatch.setattr(stats_today, 'draw_report_job', lambda name, aggregates, workers=None: 0.0)
+    run_reports = stats_today.run_reports
+    monkeypatch.setattr(stats_today, 'run_reports', lambda names, *args, **kwargs: calls.append(('run', list(names))) or run_reports(names, *args, **kwargs))
+    refresh_reports = stats_today.refresh_reports
+    monkeypatch.setattr(stats_today, 'refresh_reports', lambda names, file_path, years, *args: calls.append(('years', years)) or refresh_reports(names, file_path, years, *args))
+    changes = list(changes)
+    monkeypatch.setattr(stats_today.time, 'sleep', lambda seconds: changes.pop(0)(file_path))
+    stats_today.watch_reports(list(names), file_path, workers=1, costs_path=file_path + '.costs.json', interval=0, polls=len(changes))
+    return calls
+
+def test_watch_recalculates_only_the_appended_years(monkeypatch, jsonl_file):
+    calls = watch_changes(monkeypatch, jsonl_file, [
+        lambda path: append_records(path, make_records(30, seed=15, years=(2022,))),
+        lambda path: None,
+    ])
+    # The unchanged file on the second look runs nothing
+    assert calls == [('run', ['earthquake', 'wind']), ('years', [2022]), ('run', ['earthquake'])]
+
+def test_watch_waits_for_a_line_being_written(monkeypatch, jsonl_file):
+    line = json.dumps(make_records(1, seed=17, years=(2023,))[0]) + '\n'
+    def write(text):
+        def change(path):
+            with open(path, 'a') as f:
+                f.write(text)
+        return change
+    calls = watch_changes(monkeypatch, jsonl_file, [write(line[:20]), write(line[20:])])
+    assert calls == [('run', ['earthquake', 'wind']), ('years', [2023]), ('run', ['earthquake'])]
+
+@pytest.mark.parametrize('change', [rewrite_same_size, truncate])
+def test_watch_reruns_every_report_after_a_rewrite(change, monkeypatch, jsonl_file):
+    calls = watch_changes(monkeypatch, jsonl_file, [change])
+    assert calls == [('run', ['earthquake', 'wind']), ('run', ['earthquake', 'wind'])]
+
+@pytest.mark.parametrize('name', ['wind', 'sun', 'magnitudes', 'tempreture_line'])
+def test_partial_reports_read_columns_chunks_and_partials_alike(name, records, tmp_path):
+    path = write_records(tmp_path / 'merged_data.json', records)
+    module = __import__(stats_today.REPORTS[name]['module'])
+    calculate = getattr(module, stats_today.REPORTS[name]['calculate'])
+    from_columns = plain(calculate(load_dataset(path, use_cache=False)))
+    assert_close(plain(calculate(dataset.iter_column_chunks(path, chunk_size=100))), from_columns)
+    assert_close(plain(calculate(build_partials(load_dataset(path, use_cache=False)))), from_columns)
+
+# Function to check partial states reduce to the same monthly statistics
+def assert_same_partials(actual, expected):
+    aggregations = [(field, aggregation) for field in PARTIAL_FIELDS for aggregation in ['sum', 'min', 'max', 'first', 'count']]
+    actual_months, expected_months = partials_by_year_month(actual, aggregations), partials_by_year_month(expected, aggregations)
+    assert actual['rows'] == expected['rows']
+    assert list(actual['cities']) == list(expected['cities'])
+    for name, values in expected_months.items():
+        np.testing.assert_allclose(actual_months[name], values, rtol=1e-12, err_msg=name)
+
+def test_partials_fold_in_appended_lines(jsonl_file):
+    load_partials(jsonl_file)
+    append_records(jsonl_file, make_records(50, seed=14, years=(2021, 2022)))
+    assert_same_partials(load_partials(jsonl_file), build_partials(load_dataset(jsonl_file, use_cache=False)))
+
+def test_partials_built_from_columns_cover_only_those_columns(jsonl_file):
+    columns, fingerprint = dataset.read_dataset(jsonl_file)
+    append_records(jsonl_file, make_records(50, seed=14))
+    load_partials(jsonl_file, columns, fingerprint)
+    # The lines appended after the columns were read are folded in by the next load
+    assert_same_partials(load_partials(jsonl_file), build_partials(load_dataset(jsonl_file, use_cache=False)))
+
+@pytest.mark.parametrize('change', [rewrite_same_size, truncate])
+def test_partials_rebuild_after_a_rewrite(change, jsonl_file):
+    load_partials(jsonl_file)
+    change(jsonl_file)
+    assert_same_partials(load_partials(jsonl_file), build_partials(load_dataset(jsonl_file, use_cache=False)))
+
+# serve.py routing and error codes
+
+@pytest.fixture(scope='module')
+def service(records, tmp_path_factory):
+    return serve.start_service(write_records(tmp_path_factory.mktemp('serve') / 'merged_data.json', records))
+
+# Function to answer one request path and read its JSON body
+def get_json(service, path):
+    status, content_type, body = serve.handle_request(service, path)
+    assert content_type == 'application/json'
+    return status, json.loads(body)
+
+def test_serve_lists_reports(service):
+    status, body = get_json(service, '/reports')
+    assert status == 200
+    assert body['reports'] == list(stats_today.REPORTS)
+    assert set(body['charts']) <= set(body['reports'])
+
+def test_serve_selects_rows_by_year_and_unpadded_dates(service, records):
+    status, body = get_json(service, '/aggregates/wind?year=2020')
+    assert status == 200
+    expected = {year: months for year, months in BASELINE_REPORTS['wind'](records).items() if year == 2020}
+    assert_close({int(year): {int(month): values for month, values in months.items()} for year, months in body.items()}, plain(expected))
+    assert get_json(service, '/aggregates/wind?start=2020-3-1&end=2020-6-30') == get_json(service, '/aggregates/wind?start=2020-03-01&end=2020-06-30')
+    assert get_json(service, '/aggregates/wind?year=2020&start=2019-9-5') == get_json(service, '/aggregates/wind?year=2020')
+
+def test_serve_draws_charts(service):
+    status, content_type, body = serve.handle_request(service, '/charts/wind?year=2020')
+    assert (status, content_type, body[:4]) == (200, 'image/png', b'\x89PNG')
+    status, content_type, body = serve.handle_request(service, '/charts/rainsnow?year=2020&format=svg')
+    assert (status, content_type) == (200, 'image/svg+xml') and b'<svg' in body
+
+@pytest.mark.parametrize('path, status', [
+    ('/aggregates/wind?month=3', 400),
+    ('/aggregates/wind?year=2020&year=2021', 400),
+    ('/aggregates/wind?year=twenty', 400),
+    ('/aggregates/wind?start=2020-13-01', 400),
+    ('/charts/wind?year=2020&format=gif', 400),
+    ('/charts/wind', 400),
+    ('/nothing', 404),
+    ('/aggregates/nothing', 404),
+    ('/charts/earthquake?year=2020', 404),
+    ('/charts/wind?year=1990', 404),
+])
+def test_serve_error_codes(service, path, status):
+    assert get_json(service, path)[0] == status
+
+# Lock that counts how often it was taken, to tell when every request has looked at the cache
+class CountingLock:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.taken = 0
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.taken += 1
+
+    def __exit__(self, *error):
+        self.lock.release()
+
+def test_serve_builds_each_response_once_for_concurrent_requests():
+    requests = 8
+    lock = CountingLock()
+    cache = {'entries': serve.OrderedDict(), 'bytes': 0, 'max_bytes': 1 << 20, 'in_flight': {}, 'lock': lock}
+    builds = []
+    release = threading.Event()
+    def build():
+        builds.append(1)
+        release.wait(10)
+        return 200, 'text/plain', b'body'
+
+    start = threading.Barrier(requests)
+    responses = []
+    def request():
+        start.wait()
+        responses.append(serve.cached_response(cache, 'key', build))
+    threads = [threading.Thread(target=request) for _ in range(requests)]
+    for thread in threads:
+        thread.start()
+
+    # Finish the build only once every request has found it running
+    deadline = time.monotonic() + 10
+    while lock.taken < requests and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert len(builds) == 1
+    assert responses == [(200, 'text/plain', b'body')] * requests
+
+def test_serve_answers_a_failing_request_with_500(service, monkeypatch):
+    def fail(service, path):
+        raise RuntimeError('drawing failed')
+    monkeypatch.setattr(serve, 'handle_request', fail)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), serve.ReportRequestHandler)
+    server.service = service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}/aggregates/wind', timeout=10)
+        assert error.value.code == 500
+        assert json.loads(error.value.read()) == {'error': 'drawing failed'}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,103 +1,101 @@
-import json
-import matplotlib.pyplot as plt
 import os
-import shutil
-from collections import defaultdict
-from datetime import datetime
 import calendar
-
-# Function to load data from a JSON file
-def load_json_data(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
+from dataset import load_dataset
+from partials import as_partials, partials_by_year_month
+from render import plt, render_cached_charts, chart_template, set_bar_heights, rescale_axes
+from export import write_data_only
+from aggregate import to_year_month_dict
 
 # Function to process the data and calculate the highest wind_speed_max per year and month
+# (data is loaded columns, a stream of column chunks from iter_column_chunks or prebuilt partial states)
 def calculate_highest_wind_speed_per_year_and_month(data):
-    wind_speed_per_year_month = defaultdict(lambda: defaultdict(list))
-
-    for entry in data:
-        date = entry.get('date', '')
-        wind_speed_max = entry.get('weather', {}).get('wind_speed_max', 0)
-
-        # Extract year and month from the date
-        try:
-            year_month = datetime.strptime(date, "%Y-%m-%d")
-            year = year_month.year
-            month = year_month.month
-            wind_speed_per_year_month[year][month].append(wind_speed_max)
-        except ValueError:
-            continue  # Skip invalid date entries
-
-    # Calculate the highest wind_speed_max for each month of each year
-    highest_wind_speed = defaultdict(lambda: defaultdict(dict))
-    for year, months in wind_speed_per_year_month.items():
-        for month, wind_speeds in months.items():
-            highest_wind_speed[year][month]['max_wind_speed'] = max(wind_speeds)
-            highest_wind_speed[year][month]['actual_wind_speed'] = wind_speeds[0]  # Use the first entry as actual wind speed
-
-    return highest_wind_speed
-
-# Function to create the 'wind_speed_graphs' folder (delete if exists)
+    result = partials_by_year_month(as_partials(data), [('wind_speed_max', 'max'), ('wind_speed_max', 'first')])
+
+    return to_year_month_dict(result, {
+        'max_wind_speed': 'wind_speed_max_max',
+        'actual_wind_speed': 'wind_speed_max_first',  # The month's first entry is the actual wind speed
+    })
+
+# Function to create the 'wind_speed_graphs' folder (kept between runs)
 def create_wind_speed_graph_folder():
     folder_path = 'wind_speed_graphs'
     
-    # If the folder exists, delete it and recreate it
-    if os.path.exists(folder_path):
-        shutil.rmtree(folder_path)
-    
-    # Create a new folder to store graphs
-    os.makedirs(folder_path)
+    # Keep the folder between runs: the chart cache reuses unchanged graphs and removes stale ones
+    os.makedirs(folder_path, exist_ok=True)
     return folder_path
 
+# Function to build the wind speed figure once; every year reuses it with new bar heights
+def build_wind_speed_template():
+    months_list = [calendar.month_abbr[month] for month in range(1, 13)]  # Short names of the months
+
+    # Create the figure shared by every year
+    figure = plt.figure(figsize=(10, 6))
+    bar_width = 0.35  # Set the width of the bars
+    index = range(len(months_list))
+
+    # Plot the bars for max wind speed and actual wind speed (all zero until a year fills them in)
+    max_wind_speed_bars = plt.bar(index, [0] * 12, bar_width, label='Max Wind Speed', color='red')
+    actual_wind_speed_bars = plt.bar([i + bar_width for i in index], [0] * 12, bar_width, label='Actual Wind Speed', color='blue')
+
+    plt.xlabel('Month')
+    plt.ylabel('Wind Speed (km/h or mph)')
+    plt.xticks([i + bar_width / 2 for i in index], months_list)  # Center the ticks between the bars
+    plt.legend()
+    return {'figure': figure, 'axes': plt.gca(), 'max_wind_speed': max_wind_speed_bars, 'actual_wind_speed': actual_wind_speed_bars}
+
+# Function to plot and save the wind speed graph of one year as an image_format ('png' or 'svg') file and return its path
+def plot_wind_speed_year(year, months, folder_path, image_format='png'):
+    # Prepare the data for the plot
+    max_wind_speed_list = []
+    actual_wind_speed_list = []
+
+    # Get the monthly values (months without records stay at 0)
+    for month in range(1, 13):
+        max_wind_speed_list.append(months.get(month, {}).get('max_wind_speed', 0))
+        actual_wind_speed_list.append(months.get(month, {}).get('actual_wind_speed', 0))
+
+    # Reuse the figure: only the bar heights, y-limits and title change from year to year
+    template = chart_template('wind_speed', build_wind_speed_template)
+    set_bar_heights(template['max_wind_speed'], max_wind_speed_list)
+    set_bar_heights(template['actual_wind_speed'], actual_wind_speed_list)
+    rescale_axes(template['axes'])
+    template['axes'].set_title(f'Highest and Actual Wind Speed in {year}')
+
+    # Save the figure as a PNG file
+    graph_filename = f"{folder_path}/wind_speed_{year}.{image_format}"
+    template['figure'].savefig(graph_filename)
+    return graph_filename
+
 # Function to plot the highest wind_speed_max and actual wind_speed_max for all 12 months in one graph for each year
-def plot_and_save_wind_speed(highest_wind_speed, folder_path):
-    for year, months in highest_wind_speed.items():
-        # Prepare the data for the plot
-        months_list = []
-        max_wind_speed_list = []
-        actual_wind_speed_list = []
-
-        # Get the short name of the months (Jan, Feb, Mar, etc.) and wind speed data
-        for month in range(1, 13):
-            months_list.append(calendar.month_abbr[month])  # Short name of the month
-            max_wind_speed_list.append(months.get(month, {}).get('max_wind_speed', 0))
-            actual_wind_speed_list.append(months.get(month, {}).get('actual_wind_speed', 0))
-
-        # Create a new figure for the year
-        plt.figure(figsize=(10, 6))
-        bar_width = 0.35  # Set the width of the bars
-        index = range(len(months_list))
-
-        # Plot the bars for max wind speed and actual wind speed
-        plt.bar(index, max_wind_speed_list, bar_width, label='Max Wind Speed', color='red')
-        plt.bar([i + bar_width for i in index], actual_wind_speed_list, bar_width, label='Actual Wind Speed', color='blue')
-
-        plt.xlabel('Month')
-        plt.ylabel('Wind Speed (km/h or mph)')
-        plt.title(f'Highest and Actual Wind Speed in {year}')
-        plt.xticks([i + bar_width / 2 for i in index], months_list)  # Center the ticks between the bars
-        plt.legend()
-
-        # Save the figure as a PNG file
-        graph_filename = f"{folder_path}/wind_speed_{year}.png"
-        plt.savefig(graph_filename)
-        plt.close()  # Close the plot to avoid memory issues
+def plot_and_save_wind_speed(highest_wind_speed, folder_path, workers=None):
+    # Fan the years out over the render processes; each job only carries that year's monthly values
+    jobs = [(year, months, folder_path) for year, months in highest_wind_speed.items()]
+    return render_cached_charts(plot_wind_speed_year, jobs, folder_path, workers)
+
+# Function to draw the report's charts from its aggregates (used by main and by the stats_today runner)
+def draw_report(highest_wind_speed, workers=None):
+    # Create the 'wind_speed_graphs' folder
+    folder_path = create_wind_speed_graph_folder()
+
+    # Generate and save wind speed graphs for each year
+    plot_and_save_wind_speed(highest_wind_speed, folder_path, workers)
+
+    print(f"Wind speed graphs saved in '{folder_path}'")
 
 # Main function
 def main():
     # Load data (replace 'data.json' with your file path)
-    data = load_json_data('bar_graphs\\merged_data.json')
+    data = load_dataset('bar_graphs\\merged_data.json')
 
     # Calculate highest and actual wind_speed_max per year and month
     highest_wind_speed = calculate_highest_wind_speed_per_year_and_month(data)
 
-    # Create the 'wind_speed_graphs' folder
-    folder_path = create_wind_speed_graph_folder()
-
-    # Generate and save wind speed graphs for each year
-    plot_and_save_wind_speed(highest_wind_speed, folder_path)
+    # With --data-only, write the aggregates instead of drawing them
+    if write_data_only(highest_wind_speed):
+        return
 
-    print(f"Wind speed graphs saved in '{folder_path}'")
+    # Draw the charts
+    draw_report(highest_wind_speed)
 
 if __name__ == "__main__":
     main()